@@ -0,0 +1,376 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Position keys are account row * SYMBOL_SLOTS + symbol code
+SYMBOL_SLOTS = 1 << 24
+
+SNAPSHOT_VERSION = 1
+
+_EMPTY = int(np.iinfo(np.int64).min)
+_DELETED = _EMPTY + 1
+_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+def _grown(array: np.ndarray, size: int, fill=0) -> np.ndarray:
+    bigger = np.full(max(size, 2 * len(array), 16), fill, dtype=array.dtype)
+    bigger[:len(array)] = array
+    return bigger
+
+
+class _IntTable:
+    # int64 -> int64 hash table (open addressing, linear probing) in two
+    # NumPy arrays: 16 bytes a slot instead of a dict entry plus two int objects
+    def __init__(self, capacity: int = 16):
+        self._reset(capacity)
+
+    def _reset(self, capacity: int) -> None:
+        size = 1 << max(4, (capacity - 1).bit_length())
+        self._keys = np.full(size, _EMPTY, dtype=np.int64)
+        self._values = np.zeros(size, dtype=np.int64)
+        self._mask = size - 1
+        self._shift = 64 - (size.bit_length() - 1)
+        self.count = 0
+        self._filled = 0  # live and deleted slots
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _home(self, key: int) -> int:
+        return ((key * _MULTIPLIER) & _MASK64) >> self._shift
+
+    def _find(self, key: int) -> int:
+        keys, slot = self._keys, self._home(key)
+        while True:
+            found = keys.item(slot)
+            if found == key:
+                return slot
+            if found == _EMPTY:
+                return -1
+            slot = (slot + 1) & self._mask
+
+    def get(self, key: int) -> Optional[int]:
+        slot = self._find(key)
+        return None if slot < 0 else self._values.item(slot)
+
+    def put(self, key: int, value: int) -> None:
+        keys, slot, reuse = self._keys, self._home(key), -1
+        while True:
+            found = keys.item(slot)
+            if found == key:
+                self._values[slot] = value
+                return
+            if found == _EMPTY:
+                break
+            if found == _DELETED and reuse < 0:
+                reuse = slot
+            slot = (slot + 1) & self._mask
+        if reuse >= 0:
+            slot = reuse
+        else:
+            self._filled += 1
+        keys[slot] = key
+        self._values[slot] = value
+        self.count += 1
+        if self._filled * 10 > len(keys) * 7:
+            self._rehash()
+
+    def pop(self, key: int) -> Optional[int]:
+        slot = self._find(key)
+        if slot < 0:
+            return None
+        self._keys[slot] = _DELETED
+        self.count -= 1
+        return int(self._values[slot])
+
+    def _rehash(self) -> None:
+        live = self._keys > _DELETED
+        keys, values = self._keys[live], self._values[live]
+        self._reset(2 * max(len(keys), 8))
+        self.insert_new(keys, values)
+
+    def insert_new(self, keys: np.ndarray, values: np.ndarray) -> None:
+        # Bulk insert of distinct keys that aren't in the table yet: every
+        # pending key tries its next slot at once and one per free slot wins,
+        # which fills slots exactly as inserting them one by one could have
+        if (self._filled + len(keys)) * 10 > len(self._keys) * 7:
+            live = self._keys > _DELETED
+            keys = np.concatenate((self._keys[live], keys))
+            values = np.concatenate((self._values[live], values))
+            self._reset(2 * max(len(keys), 8))
+        home = ((keys.astype(np.uint64) * np.uint64(_MULTIPLIER)) >> np.uint64(self._shift)).astype(np.int64)
+        pending = np.arange(len(keys))
+        probe = 0
+        while len(pending):
+            slots = (home[pending] + probe) & self._mask
+            free = self._keys[slots] == _EMPTY
+            taken, first = np.unique(slots[free], return_index=True)
+            winners = pending[free][first]
+            self._keys[taken] = keys[winners]
+            self._values[taken] = values[winners]
+            placed = np.zeros(len(keys), dtype=bool)
+            placed[winners] = True
+            pending = pending[~placed[pending]]
+            probe += 1
+        self.count += len(keys)
+        self._filled += len(keys)
+
+    def nbytes(self) -> int:
+        return self._keys.nbytes + self._values.nbytes
+
+
+class AccountStore:
+    """Cash and positions for a lot of accounts in flat NumPy columns.
+
+    An account is a row (user id, cash, first position); a position is a row
+    (account, symbol code, quantity, average price) linked to the account's
+    other positions. Hash tables kept in arrays map user ids to accounts and
+    (account, symbol) to positions, so a trade touches O(1) rows, and rows of
+    closed positions are reused. Everything is a few dozen bytes per account
+    and per position.
+
+    Not thread-safe: callers serialize trades on one account with
+    lock_for(), everything else runs on the event loop.
+    """
+
+    def __init__(self, starting_cash: float = 10000.0, capacity: int = 1024, lock_shards: int = 1024):
+        self.starting_cash = starting_cash
+        self._rows = _IntTable(capacity)
+        self._user_id = np.zeros(capacity, dtype=np.int64)
+        self._cash = np.zeros(capacity)
+        self._head = np.full(capacity, -1, dtype=np.int32)
+        self._accounts = 0
+
+        self._positions = _IntTable(capacity)
+        self._owner = np.zeros(capacity, dtype=np.int32)
+        self._symbol = np.zeros(capacity, dtype=np.int32)
+        self._quantity = np.zeros(capacity, dtype=np.int64)
+        self._average = np.zeros(capacity)
+        self._next = np.full(capacity, -1, dtype=np.int32)
+        self._prev = np.full(capacity, -1, dtype=np.int32)
+        self._used = 0
+        self._free: List[int] = []
+
+        self._codes: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._locks: List[Optional[asyncio.Lock]] = [None] * lock_shards
+
+    @classmethod
+    def from_env(cls) -> "AccountStore":
+        path = os.getenv("MOCK_SNAPSHOT_PATH")
+        if path and os.path.exists(path):
+            store = cls.load(path)
+            logger.info(f"Loaded {store._accounts} accounts from {path}")
+            return store
+        return cls()
+
+    def lock_for(self, user_id: int) -> asyncio.Lock:
+        # Created on first use so they belong to the running event loop
+        shard = hash(user_id) % len(self._locks)
+        lock = self._locks[shard]
+        if lock is None:
+            lock = self._locks[shard] = asyncio.Lock()
+        return lock
+
+    def _code(self, symbol: str) -> int:
+        code = self._codes.get(symbol)
+        if code is None:
+            if len(self._names) >= SYMBOL_SLOTS:
+                raise ValueError("Too many symbols")
+            code = self._codes[symbol] = len(self._names)
+            self._names.append(symbol)
+        return code
+
+    def _row(self, user_id: int) -> int:
+        if not _DELETED < user_id < 2 ** 63:
+            raise ValueError("User id out of range")
+        row = self._rows.get(user_id)
+        if row is None:
+            row = self._accounts
+            if row == len(self._cash):
+                self._user_id = _grown(self._user_id, row + 1)
+                self._cash = _grown(self._cash, row + 1)
+                self._head = _grown(self._head, row + 1, -1)
+            self._user_id[row] = user_id
+            self._cash[row] = self.starting_cash
+            self._head[row] = -1
+            self._rows.put(user_id, row)
+            self._accounts += 1
+        return row
+
+    def _new_position(self, row: int, code: int, quantity: int, price: float) -> None:
+        if self._free:
+            position = self._free.pop()
+        else:
+            position = self._used
+            if position == len(self._owner):
+                size = position + 1
+                self._owner = _grown(self._owner, size)
+                self._symbol = _grown(self._symbol, size)
+                self._quantity = _grown(self._quantity, size)
+                self._average = _grown(self._average, size)
+                self._next = _grown(self._next, size, -1)
+                self._prev = _grown(self._prev, size, -1)
+            self._used += 1
+        self._owner[position] = row
+        self._symbol[position] = code
+        self._quantity[position] = quantity
+        self._average[position] = price
+        first = int(self._head[row])
+        self._next[position] = first
+        self._prev[position] = -1
+        if first >= 0:
+            self._prev[first] = position
+        self._head[row] = position
+        self._positions.put(row * SYMBOL_SLOTS + code, position)
+
+    def _drop_position(self, row: int, code: int, position: int) -> None:
+        before, after = int(self._prev[position]), int(self._next[position])
+        if before >= 0:
+            self._next[before] = after
+        else:
+            self._head[row] = after
+        if after >= 0:
+            self._prev[after] = before
+        self._positions.pop(row * SYMBOL_SLOTS + code)
+        self._quantity[position] = 0
+        self._free.append(position)
+
+    def buy(self, user_id: int, symbol: str, quantity: int, price: float) -> float:
+        # Returns the new cash balance
+        row = self._row(user_id)
+        total = price * quantity
+        if self._cash[row] < total:
+            raise ValueError("Not enough cash for this trade")
+        self._cash[row] -= total
+        code = self._code(symbol)
+        position = self._positions.get(row * SYMBOL_SLOTS + code)
+        if position is None:
+            self._new_position(row, code, quantity, price)
+        else:
+            held = int(self._quantity[position])
+            self._average[position] = (held * self._average[position] + total) / (held + quantity)
+            self._quantity[position] = held + quantity
+        return float(self._cash[row])
+
+    def sell(self, user_id: int, symbol: str, quantity: int, price: float) -> float:
+        row = self._row(user_id)
+        code = self._codes.get(symbol)
+        position = None if code is None else self._positions.get(row * SYMBOL_SLOTS + code)
+        if position is None or self._quantity[position] < quantity:
+            raise ValueError("Not enough shares to sell")
+        self._cash[row] += price * quantity
+        self._quantity[position] -= quantity
+        if not self._quantity[position]:
+            self._drop_position(row, code, position)
+        return float(self._cash[row])
+
+    def cash(self, user_id: int) -> float:
+        return float(self._cash[self._row(user_id)])
+
+    def portfolio(self, user_id: int) -> Dict[str, Any]:
+        # Creates the account on first sight, like the old dict did
+        row = self._row(user_id)
+        rows = []
+        position = int(self._head[row])
+        while position >= 0:
+            rows.append(position)
+            position = int(self._next[position])
+        # Row order survives a snapshot and reload, list order doesn't
+        positions = [
+            {
+                "symbol": self._names[self._symbol[position]],
+                "quantity": int(self._quantity[position]),
+                "average_price": float(self._average[position]),
+            }
+            for position in sorted(rows)
+        ]
+        return {"cash": float(self._cash[row]), "positions": positions}
+
+    def stats(self) -> Dict[str, Any]:
+        columns = (
+            self._user_id, self._cash, self._head,
+            self._owner, self._symbol, self._quantity, self._average, self._next, self._prev,
+        )
+        return {
+            "accounts": self._accounts,
+            "positions": len(self._positions),
+            "symbols": len(self._names),
+            "bytes": sum(c.nbytes for c in columns) + self._rows.nbytes() + self._positions.nbytes(),
+        }
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        # Copies of everything live, cheap enough to take on the event loop
+        # and write out elsewhere
+        live = np.flatnonzero(self._quantity[:self._used])
+        n = self._accounts
+        return {
+            "version": np.array([SNAPSHOT_VERSION]),
+            "starting_cash": np.array([self.starting_cash]),
+            "user_id": self._user_id[:n].copy(),
+            "cash": self._cash[:n].copy(),
+            "owner": self._owner[live],
+            "symbol": self._symbol[live],
+            "quantity": self._quantity[live],
+            "average_price": self._average[live],
+            "symbols": np.array(self._names, dtype=str),
+        }
+
+    @staticmethod
+    def write_snapshot(path: str, arrays: Dict[str, np.ndarray]) -> None:
+        # Written to a temporary file and renamed, so a crash mid-write
+        # leaves the previous snapshot in place
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def save(self, path: str) -> None:
+        self.write_snapshot(path, self.snapshot())
+
+    @classmethod
+    def load(cls, path: str) -> "AccountStore":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"][0]) != SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported snapshot version in {path}")
+            user_id, cash = data["user_id"], data["cash"]
+            # Grouped by account so each account's positions are one run
+            order = np.argsort(data["owner"], kind="stable")
+            owner, symbol = data["owner"][order], data["symbol"][order]
+            quantity, average_price = data["quantity"][order], data["average_price"][order]
+            names = data["symbols"].tolist()
+            starting_cash = float(data["starting_cash"][0])
+
+        n, m = len(user_id), len(owner)
+        store = cls(starting_cash, capacity=max(n, m, 1024))
+        store._user_id[:n] = user_id
+        store._cash[:n] = cash
+        store._accounts = n
+        store._rows.insert_new(user_id, np.arange(n))
+
+        store._owner[:m] = owner
+        store._symbol[:m] = symbol
+        store._quantity[:m] = quantity
+        store._average[:m] = average_price
+        store._used = m
+        if m:
+            # Link each run of positions to its neighbours
+            same = owner[1:] == owner[:-1]
+            later = np.arange(1, m, dtype=np.int32)
+            store._next[:m - 1] = np.where(same, later, -1)
+            store._prev[1:m] = np.where(same, later - 1, -1)
+            first = np.flatnonzero(np.insert(~same, 0, True))
+            store._head[owner[first]] = first
+        store._positions.insert_new(owner.astype(np.int64) * SYMBOL_SLOTS + symbol, np.arange(m))
+
+        store._names = names
+        store._codes = {name: code for code, name in enumerate(names)}
+        return store
@@ -0,0 +1,297 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+from backtest import average_cost
+from price_history import PriceHistoryStore
+from trading import STARTING_CASH
+
+TRADING_DAYS = 252
+
+# A run of trades as parallel arrays in the order they were applied:
+# timestamp (epoch seconds), symbol, signed quantity (sells < 0), price
+Trades = Dict[str, np.ndarray]
+
+
+def _trades(rows) -> Trades:
+    # From (symbol, trade_type, quantity, price, timestamp) rows; timestamps
+    # are naive UTC like everywhere else
+    symbol, trade_type, quantity, price, timestamp = zip(*rows) if rows else ((),) * 5
+    quantity = np.array(quantity, dtype=float)
+    sells = np.array([kind.upper() == "SELL" for kind in trade_type], dtype=bool)
+    timestamp = np.array([int(t.replace(tzinfo=timezone.utc).timestamp()) for t in timestamp], dtype=np.int64)
+    return {
+        # A trade never counts as earlier than the one applied before it
+        "timestamp": np.maximum.accumulate(timestamp) if len(timestamp) else timestamp,
+        "symbol": np.array(symbol, dtype=object),
+        "quantity": np.where(sells, -quantity, quantity),
+        "price": np.array(price, dtype=float),
+    }
+
+
+def _select(trades: Trades, mask: np.ndarray) -> Trades:
+    return {name: column[mask] for name, column in trades.items()}
+
+
+def _concat(first: Trades, second: Trades) -> Trades:
+    return {name: np.concatenate((first[name], second[name])) for name in first}
+
+
+class _Entry:
+    # Everything derived from one portfolio's trades. Days up to
+    # closed_through are valued once and kept; trades after that day stay in
+    # ``pending`` until their day closes.
+    def __init__(self, portfolio_id: int):
+        self.portfolio_id = portfolio_id
+        self.lock = threading.Lock()
+        # Portfolio.trade_count the trades were last read for, -1 before the first read
+        self.trade_count = -1
+        self.last_trade_id = 0
+        self.last_timestamp = 0
+        self.cash = STARTING_CASH
+        self.held: Dict[str, float] = {}
+        self.average_price: Dict[str, float] = {}
+        self.realized: Dict[str, float] = {}
+        self.last_price: Dict[str, float] = {}
+        self.closed_through: Optional[np.datetime64] = None
+        self.days = np.empty(0, dtype="datetime64[D]")
+        self.equity = np.empty(0)
+        self.eod_cash = STARTING_CASH
+        self.eod_held: Dict[str, float] = {}
+        self.eod_last_price: Dict[str, float] = {}
+        self.pending: Trades = _trades([])
+
+
+class PortfolioAnalytics:
+    """Performance analytics per portfolio, kept up to date incrementally.
+
+    The first request for a portfolio reads its whole trade log and values
+    every trading day (UTC) against the price history store, all in NumPy.
+    After that only trades newer than the last one seen are read, and only
+    when the portfolio's trade_count in the database has moved, so trades
+    from any process or from the journal are picked up. Past days are valued
+    once when they close, and new prices only move the current point. P&L
+    uses the same average-cost rules as the trades themselves.
+    """
+
+    def __init__(self, store: PriceHistoryStore, max_portfolios: int = 1000, clock=time.time):
+        self.store = store
+        self.max_portfolios = max_portfolios
+        self.clock = clock
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.updates = 0
+
+    @classmethod
+    def from_env(cls, store: PriceHistoryStore) -> "PortfolioAnalytics":
+        return cls(store, max_portfolios=int(os.getenv("ANALYTICS_CACHE_SIZE", "1000")))
+
+    def _entry(self, user_id: int, portfolio_id: int, trade_count: int) -> _Entry:
+        # Least recently used evicted. A portfolio that was replaced or lost
+        # trades starts over.
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.portfolio_id == portfolio_id and entry.trade_count <= trade_count:
+                self._entries.move_to_end(user_id)
+            else:
+                entry = self._entries[user_id] = _Entry(portfolio_id)
+                while len(self._entries) > self.max_portfolios:
+                    self._entries.popitem(last=False)
+            return entry
+
+    def _read_trades(self, db: Session, entry: _Entry) -> Trades:
+        rows = db.query(
+            models.Trade.id, models.Trade.symbol, models.Trade.trade_type, models.Trade.quantity,
+            models.Trade.price, models.Trade.timestamp
+        ).filter(
+            models.Trade.portfolio_id == entry.portfolio_id,
+            models.Trade.id > entry.last_trade_id
+        ).order_by(models.Trade.id).all()
+        if rows:
+            entry.last_trade_id = rows[-1].id
+        return _trades([row[1:] for row in rows])
+
+    def _apply(self, entry: _Entry, trades: Trades) -> None:
+        # Fold new trades into the running cash, holdings, average prices and
+        # realized P&L. Current holdings go in first as buys at their average
+        # price, which restarts each average exactly where it was.
+        if not len(trades["price"]):
+            return
+        trades["timestamp"] = np.maximum(trades["timestamp"], entry.last_timestamp)
+        entry.last_timestamp = int(trades["timestamp"][-1])
+        seeded = sorted(symbol for symbol, held in entry.held.items() if held)
+        symbol = np.concatenate((np.array(seeded, dtype=object), trades["symbol"]))
+        quantity = np.concatenate(([entry.held[s] for s in seeded], trades["quantity"]))
+        price = np.concatenate(([entry.average_price[s] for s in seeded], trades["price"]))
+
+        # Group by symbol keeping trade order, then one scan over all groups:
+        # each group starts from flat, which resets the average
+        names, codes = np.unique(symbol.astype(str), return_inverse=True)
+        order = np.argsort(codes, kind="stable")
+        codes, quantity, price = codes[order], quantity[order], price[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(codes)] - 1
+        after = np.empty_like(quantity)
+        for start, end in zip(starts, ends):
+            after[start:end + 1] = np.cumsum(quantity[start:end + 1])
+        average = average_cost(after - quantity, quantity, price)
+        average_before = np.r_[0.0, average[:-1]]
+        average_before[starts] = 0.0
+        realized = np.where(quantity < 0, -quantity * (price - average_before), 0.0)
+
+        realized_by_symbol = np.add.reduceat(realized, starts)
+        for i, name in enumerate(names):
+            entry.held[name] = float(after[ends[i]])
+            entry.average_price[name] = float(average[ends[i]])
+            entry.realized[name] = entry.realized.get(name, 0.0) + float(realized_by_symbol[i])
+        for name, last in zip(trades["symbol"], trades["price"]):
+            entry.last_price[name] = float(last)
+        entry.cash += float(-np.sum(trades["quantity"] * trades["price"]))
+        if entry.closed_through is None:
+            first_day = np.datetime64(int(trades["timestamp"][0]), "s").astype("datetime64[D]")
+            entry.closed_through = first_day - 1
+        entry.pending = _concat(entry.pending, trades)
+
+    def _closes(self, symbol: str, ends: np.ndarray, trade_time: np.ndarray, trade_price: np.ndarray) -> np.ndarray:
+        # Price of ``symbol`` as of each end time: the last stored bar before
+        # it, or the last trade price if that's more recent or there's no bar
+        try:
+            bars = self.store.bars(symbol.upper(), None, int(ends[-1]))
+        except ValueError:
+            return trade_price
+        if not len(bars["timestamp"]):
+            return trade_price
+        k = np.searchsorted(bars["timestamp"], ends, "left") - 1
+        has_bar = k >= 0
+        k = np.maximum(k, 0)
+        use_bar = has_bar & ((bars["timestamp"][k] >= trade_time) | np.isnan(trade_price))
+        return np.where(use_bar, bars["close"][k], trade_price)
+
+    def _close_days(self, entry: _Entry, today: np.datetime64) -> None:
+        # Value every trading day since closed_through that has ended
+        if entry.closed_through is None or entry.closed_through >= today - 1:
+            return
+        days = np.arange(entry.closed_through + 1, today, dtype="datetime64[D]")
+        days = days[np.is_busday(days)]
+        through = today - 1
+        if len(days):
+            ends = (days + 1).astype("datetime64[s]").astype(np.int64)
+            pending = entry.pending
+            k = np.searchsorted(pending["timestamp"], ends, "left")
+            flows = -(pending["quantity"] * pending["price"])
+            equity = (entry.eod_cash + np.r_[0.0, np.cumsum(flows)])[k]
+            for symbol in set(entry.eod_held) | set(pending["symbol"]):
+                mask = pending["symbol"] == symbol
+                held = entry.eod_held.get(symbol, 0.0) + np.r_[0.0, np.cumsum(pending["quantity"][mask])]
+                ks = np.searchsorted(pending["timestamp"][mask], ends, "left")
+                if not held[ks].any():
+                    continue
+                previous = entry.eod_last_price.get(symbol, np.nan)
+                trade_price = np.r_[previous, pending["price"][mask]][ks]
+                trade_time = np.r_[np.iinfo(np.int64).min, pending["timestamp"][mask]][ks]
+                closes = self._closes(symbol, ends, trade_time, trade_price)
+                equity += held[ks] * np.nan_to_num(closes)
+            entry.days = np.concatenate((entry.days, days))
+            entry.equity = np.concatenate((entry.equity, equity))
+
+        # Move the end-of-day state up to ``through``
+        end = int((through + 1).astype("datetime64[s]").astype(np.int64))
+        done = entry.pending["timestamp"] < end
+        closed = _select(entry.pending, done)
+        entry.eod_cash += float(-np.sum(closed["quantity"] * closed["price"]))
+        for symbol, quantity, price in zip(closed["symbol"], closed["quantity"], closed["price"]):
+            entry.eod_held[symbol] = entry.eod_held.get(symbol, 0.0) + quantity
+            entry.eod_last_price[symbol] = price
+        entry.eod_held = {symbol: held for symbol, held in entry.eod_held.items() if held}
+        entry.pending = _select(entry.pending, ~done)
+        entry.closed_through = through
+
+    def report(
+        self, db: Session, user_id: int, portfolio_id: int, trade_count: int,
+        quote_prices: Callable[[List[str]], Dict[str, float]], series: bool = True
+    ) -> Dict[str, Any]:
+        # ``trade_count`` is the portfolio's Portfolio.trade_count as just read
+        # from the database. ``quote_prices`` returns current prices for a
+        # list of symbols, leaving out any it couldn't get.
+        entry = self._entry(user_id, portfolio_id, trade_count)
+        with entry.lock:
+            if entry.trade_count != trade_count:
+                if entry.trade_count < 0:
+                    self.builds += 1
+                else:
+                    self.updates += 1
+                self._apply(entry, self._read_trades(db, entry))
+                entry.trade_count = trade_count
+            today = np.datetime64(int(self.clock()), "s").astype("datetime64[D]")
+            self._close_days(entry, today)
+            held = {symbol: quantity for symbol, quantity in entry.held.items() if quantity}
+
+        prices = quote_prices(list(held))
+
+        with entry.lock:
+            by_symbol = []
+            market_value = 0.0
+            for symbol in sorted(set(held) | set(entry.realized)):
+                quantity = held.get(symbol, 0.0)
+                average_price = entry.average_price.get(symbol, 0.0)
+                current_price = prices.get(symbol.upper(), entry.last_price.get(symbol, average_price))
+                unrealized = quantity * (current_price - average_price)
+                realized = entry.realized.get(symbol, 0.0)
+                market_value += quantity * current_price
+                by_symbol.append({
+                    "symbol": symbol,
+                    "quantity": quantity,
+                    "averagePrice": average_price,
+                    "currentPrice": current_price,
+                    "realizedPnl": realized,
+                    "unrealizedPnl": unrealized,
+                    "totalPnl": realized + unrealized,
+                    "contribution": (realized + unrealized) / STARTING_CASH,
+                })
+            equity_now = entry.cash + market_value
+            values = np.append(entry.equity, equity_now)
+            dates = np.append(entry.days, today)
+            cash = entry.cash
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = np.diff(values) / values[:-1]
+        returns = np.where(np.isfinite(returns), returns, 0.0)
+        deviation = float(np.std(returns, ddof=1)) if len(returns) > 1 else 0.0
+        peak = np.maximum.accumulate(values)
+        realized_total = sum(row["realizedPnl"] for row in by_symbol)
+        unrealized_total = sum(row["unrealizedPnl"] for row in by_symbol)
+        result = {
+            "cash": cash,
+            "equity": equity_now,
+            "realizedPnl": realized_total,
+            "unrealizedPnl": unrealized_total,
+            "totalPnl": realized_total + unrealized_total,
+            "totalReturn": equity_now / STARTING_CASH - 1,
+            "volatility": deviation * np.sqrt(TRADING_DAYS) if deviation else None,
+            "sharpeRatio": float(np.mean(returns)) / deviation * np.sqrt(TRADING_DAYS) if deviation else None,
+            "maxDrawdown": float(np.max(1 - values / peak)) if peak.all() else 0.0,
+            "bySymbol": by_symbol,
+        }
+        if series:
+            result["series"] = {
+                "dates": np.datetime_as_string(dates).tolist(),
+                "equity": values.tolist(),
+                "dailyReturns": returns.tolist(),
+            }
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "portfolios": len(self._entries),
+                "builds": self.builds,
+                "updates": self.updates,
+            }
@@ -0,0 +1,216 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+ACCESS_LOGGER = "access"
+
+# Default level per APP_ENV, LOG_LEVEL overrides it
+ENVIRONMENT_LEVELS = {"development": "DEBUG", "test": "WARNING", "staging": "INFO", "production": "INFO"}
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_sampled_var: contextvars.ContextVar[bool] = contextvars.ContextVar("log_sampled", default=True)
+
+# Attributes every LogRecord has, anything else on a record came from extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and
+    whatever was passed as extra=."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _RequestContextFilter(logging.Filter):
+    # Runs where the record is logged, so the request's context vars are
+    # visible: tags records with the request id and drops debug/info records of
+    # requests that weren't sampled (the access line decides for itself)
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return (
+            record.levelno >= logging.WARNING
+            or record.name == ACCESS_LOGGER
+            or _sampled_var.get()
+        )
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock QueueHandler formats the message on the calling thread; only
+    # merge the %-args here and leave the rest to the listener
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(text: Optional[str]) -> Dict[str, str]:
+    # "sqlalchemy.engine=INFO,quote_cache=DEBUG" -> {logger: level}
+    levels = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(default_level: str = "INFO") -> logging.handlers.QueueListener:
+    """Send every log record through a queue to a background thread that
+    formats and writes it, so logging never blocks the event loop on I/O.
+
+    LOG_LEVEL (or the default for APP_ENV) sets the root level, LOG_LEVELS
+    per-logger overrides, LOG_FORMAT is json (default) or text. Safe to call
+    more than once.
+    """
+    global _listener
+    environment = os.getenv("APP_ENV", "").lower()
+    level = os.getenv("LOG_LEVEL") or ENVIRONMENT_LEVELS.get(environment, default_level)
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    for name, override in parse_levels(os.getenv("LOG_LEVELS")).items():
+        logging.getLogger(name).setLevel(override)
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        output.setFormatter(logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+        ))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(records)
+    handler.addFilter(_RequestContextFilter())
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    # Flush what's still queued on the way out
+    atexit.register(_listener.stop)
+    return _listener
+
+
+class _Sampling:
+    # Route patterns like "/stock/{symbol}" with the share of requests to log
+    def __init__(self, rates: Dict[str, float]):
+        self.rules: List[Tuple[re.Pattern, float]] = [
+            (re.compile("^" + re.sub(r"\\\{[^/]+?\\\}", "[^/]+", re.escape(route)) + "$"), rate)
+            for route, rate in rates.items()
+        ]
+
+    @classmethod
+    def parse(cls, text: Optional[str]) -> "_Sampling":
+        # "/stock/{symbol}=0.01,/stocks=0.1"
+        rates = {}
+        for item in (text or "").split(","):
+            if "=" in item:
+                route, rate = item.rsplit("=", 1)
+                rates[route.strip()] = float(rate)
+        return cls(rates)
+
+    def rate(self, path: str) -> float:
+        for pattern, rate in self.rules:
+            if pattern.match(path):
+                return rate
+        return 1.0
+
+
+class RequestLogMiddleware:
+    """ASGI middleware: gives each request an id (X-Request-ID, echoed back)
+    and writes one access record with method, path, status and latency.
+
+    Routes listed in LOG_SAMPLE_RATES are logged for that share of requests
+    only, along with the debug/info records logged while handling them.
+    Server errors and requests slower than LOG_SLOW_MS are always logged.
+    """
+
+    def __init__(self, app, sample_rates: Optional[str] = None, slow_ms: Optional[float] = None):
+        self.app = app
+        self.sampling = _Sampling.parse(sample_rates if sample_rates is not None else os.getenv("LOG_SAMPLE_RATES"))
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv("LOG_SLOW_MS", "1000"))
+        self.logger = logging.getLogger(ACCESS_LOGGER)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        rate = self.sampling.rate(path)
+        sampled = rate >= 1.0 or random.random() < rate
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        id_token = request_id_var.set(request_id)
+        sampled_token = _sampled_var.set(sampled)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        except Exception:
+            self.logger.exception("Request failed", extra=self._fields(scope, path, 500, started))
+            raise
+        else:
+            fields = self._fields(scope, path, status, started)
+            if sampled or status >= 500 or fields["latency_ms"] >= self.slow_ms:
+                self.logger.info("%s %s %s", scope["method"], path, status, extra=fields)
+        finally:
+            request_id_var.reset(id_token)
+            _sampled_var.reset(sampled_token)
+
+    @staticmethod
+    def _fields(scope, path: str, status: int, started: float) -> dict:
+        return {
+            "method": scope["method"],
+            "path": path,
+            "status": status,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
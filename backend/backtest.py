@@ -0,0 +1,172 @@
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from trading import STARTING_CASH, TradeRejected, apply_fill
+
+# Bars checked per vectorized pass. A block that needs more than MAX_PASSES
+# rejections is finished order by order instead.
+BLOCK_BARS = 4096
+MAX_PASSES = 4
+
+
+def orders_from_targets(targets) -> np.ndarray:
+    # The orders that move holdings to ``targets`` (shares held per bar)
+    targets = np.asarray(targets, dtype=float)
+    return np.diff(targets, axis=0, prepend=np.zeros((1,) + targets.shape[1:]))
+
+
+def load_prices(
+    store, symbols: Sequence[str], start: Optional[int] = None, end: Optional[int] = None, column: str = "close"
+) -> Tuple[np.ndarray, np.ndarray]:
+    # (timestamps, prices[bar, symbol]) from a PriceHistoryStore, on the
+    # timestamps every symbol has a bar for
+    bars = [store.bars(symbol, start, end) for symbol in symbols]
+    timestamps = bars[0]["timestamp"]
+    for b in bars[1:]:
+        timestamps = np.intersect1d(timestamps, b["timestamp"], assume_unique=True)
+    prices = np.empty((len(timestamps), len(symbols)))
+    for i, b in enumerate(bars):
+        prices[:, i] = b[column][np.searchsorted(b["timestamp"], timestamps)]
+    return np.array(timestamps), prices
+
+
+def _affine_scan(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # x_t = a_t * x_{t-1} + b_t along axis 0 from x_{-1} = 0, as a prefix
+    # composition of the affine steps (log2(n) vectorized passes)
+    a, b = a.copy(), b.copy()
+    step = 1
+    while step < len(a):
+        b[step:] = a[step:] * b[:-step] + b[step:]
+        a[step:] = a[step:] * a[:-step]
+        step *= 2
+    return b
+
+
+def average_cost(before: np.ndarray, fills: np.ndarray, prices: np.ndarray) -> np.ndarray:
+    # Average price after each fill along axis 0, given the holdings before
+    # it. Only buys move it: avg' = avg * before/after + price * bought/after,
+    # and a buy from flat starts over at the fill price.
+    after = before + fills
+    buys = fills > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = np.where(buys, before / after, 1.0)
+        b = np.where(buys, np.where(before == 0, prices, prices * fills / after), 0.0)
+    return _affine_scan(a, b)
+
+
+def _flows(q: np.ndarray, p: np.ndarray) -> np.ndarray:
+    # Cash moved by each order, buys negative
+    return np.where(q != 0, -(q * p), 0.0)
+
+
+def _first_rejected(cash: float, held: np.ndarray, q: np.ndarray, p: np.ndarray) -> Tuple[int, float, np.ndarray]:
+    # Assume every order in the block fills and find the first one the live
+    # rules would have rejected (-1 if none), with the closing cash and
+    # holdings. Running totals are summed in fill order, the same operations
+    # apply_fill does, so a balance lands below zero here exactly when it
+    # would have been short there.
+    held_path = np.cumsum(np.vstack([held, q]), axis=0)[1:]
+    cash_path = np.cumsum(np.concatenate(([cash], _flows(q, p).ravel())))[1:].reshape(q.shape)
+    bad = ((q < 0) & (held_path < 0)) | ((q > 0) & (cash_path < 0))
+    first = int(np.argmax(bad)) if bad.any() else -1
+    return first, float(cash_path[-1, -1]), held_path[-1].copy()
+
+
+def _fill_loop(cash: float, held: np.ndarray, q: np.ndarray, p: np.ndarray, rejected: np.ndarray) -> float:
+    bars, width = q.shape
+    for t in range(bars):
+        for s in range(width):
+            quantity = q[t, s]
+            if not quantity:
+                continue
+            action = "buy" if quantity > 0 else "sell"
+            try:
+                cash, held[s], _ = apply_fill(cash, held[s], 0.0, action, abs(quantity), p[t, s])
+            except TradeRejected:
+                q[t, s] = 0.0
+                rejected[t, s] = True
+    return cash
+
+
+def run_backtest(
+    prices, orders, cash: float = STARTING_CASH, symbols: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """Simulate a strategy's orders against a price series.
+
+    ``prices`` and ``orders`` are (bars,) or (bars, symbols) arrays: the fill
+    price at each bar and the signed number of shares to trade there (> 0
+    buys, < 0 sells). Orders fill bar by bar, symbols left to right, under the
+    same rules as a trade through the API: a buy needs the cash, a sell needs
+    the shares, otherwise the order is rejected and skipped, and buys move the
+    average price. Orders at bar t see no later bars, so a signal computed
+    from a bar's close should be shifted to trade on the next one.
+    """
+    prices = np.asarray(prices, dtype=float)
+    orders = np.asarray(orders, dtype=float)
+    if prices.shape != orders.shape or prices.ndim not in (1, 2):
+        raise ValueError("prices and orders must be arrays of the same (bars,) or (bars, symbols) shape")
+    single = prices.ndim == 1
+    if single:
+        prices, orders = prices[:, None], orders[:, None]
+    bars, width = prices.shape
+    if not np.isfinite(prices[orders != 0]).all():
+        raise ValueError("Orders need a finite price")
+    symbols = list(symbols) if symbols is not None else [str(i) for i in range(width)]
+    if len(symbols) != width:
+        raise ValueError("One symbol per price column")
+
+    # Settle which orders fill. A block without rejections costs one
+    # vectorized pass; each rejection zeroes that order and re-checks.
+    fills = orders.copy()
+    rejected = np.zeros(orders.shape, dtype=bool)
+    balance, held = float(cash), np.zeros(width)
+    for t0 in range(0, bars, BLOCK_BARS):
+        block = slice(t0, t0 + BLOCK_BARS)
+        q, p = fills[block], prices[block]
+        for _ in range(MAX_PASSES):
+            first, block_cash, block_held = _first_rejected(balance, held, q, p)
+            if first < 0:
+                balance, held = block_cash, block_held
+                break
+            q.flat[first] = 0.0
+            rejected[block].flat[first] = True
+        else:
+            balance = _fill_loop(balance, held, q, p, rejected[block])
+
+    positions = np.cumsum(fills, axis=0)
+    cash_path = np.cumsum(np.concatenate(([float(cash)], _flows(fills, prices).ravel())))[1:]
+    cash_path = cash_path.reshape(bars, width)[:, -1]
+    equity = cash_path + np.where(positions != 0, positions * prices, 0.0).sum(axis=1)
+
+    average_price = average_cost(positions - fills, fills, prices)
+
+    peak = np.maximum.accumulate(equity) if bars else equity
+    traded_bar, traded_symbol = np.nonzero(fills)
+    rejected_bar, rejected_symbol = np.nonzero(rejected)
+    return {
+        "symbols": symbols,
+        "equity": equity,
+        "cash": cash_path,
+        "positions": positions[:, 0] if single else positions,
+        "averagePrice": average_price[:, 0] if single else average_price,
+        "trades": {
+            "bar": traded_bar,
+            "symbol": traded_symbol,
+            "quantity": fills[traded_bar, traded_symbol],
+            "price": prices[traded_bar, traded_symbol],
+        },
+        "rejected": {
+            "bar": rejected_bar,
+            "symbol": rejected_symbol,
+            "quantity": orders[rejected_bar, rejected_symbol],
+        },
+        "summary": {
+            "startingCash": float(cash),
+            "finalEquity": float(equity[-1]) if bars else float(cash),
+            "totalReturn": float(equity[-1] / cash - 1) if bars and cash else 0.0,
+            "maxDrawdown": float(np.max(1 - equity / peak)) if bars else 0.0,
+            "trades": len(traded_bar),
+            "rejected": len(rejected_bar),
+        },
+    }
@@ -0,0 +1,93 @@
+"""Memory, trade speed and snapshot cost of mock_stock_api's account store.
+
+Opens N accounts holding --positions positions each, then times buys and
+sells on random accounts, a snapshot save and load, and compares memory
+with the same accounts kept the old way: a dict of {"cash", "positions":
+[...]} dicts keyed by str(user_id). Memory is measured with tracemalloc,
+which makes opening the accounts a lot slower than it really is.
+
+    python benchmarks/bench_account_store.py
+    python benchmarks/bench_account_store.py --accounts 1000000 --positions 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from account_store import AccountStore  # noqa: E402
+
+
+def measured(build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    built = build()
+    seconds = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return built, size, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=200000)
+    parser.add_argument("--positions", type=int, default=2, help="positions per account")
+    parser.add_argument("--trades", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    symbols = [f"S{i:03d}" for i in range(200)]
+    holdings = [rng.sample(symbols, args.positions) for _ in range(args.accounts)]
+
+    def build_store():
+        store = AccountStore(starting_cash=1e9)
+        for user_id, held in enumerate(holdings, 1):
+            for symbol in held:
+                store.buy(user_id, symbol, 10, 100.0)
+        return store
+
+    def build_dicts():
+        portfolios = {}
+        for user_id, held in enumerate(holdings, 1):
+            portfolios[str(user_id)] = {
+                "cash": 1e9,
+                "positions": [{"symbol": symbol, "quantity": 10, "average_price": 100.0} for symbol in held],
+            }
+        return portfolios
+
+    store, store_bytes, build_seconds = measured(build_store)
+    _, dict_bytes, _ = measured(build_dicts)
+
+    started = time.perf_counter()
+    for _ in range(args.trades):
+        user_id = rng.randint(1, args.accounts)
+        symbol = rng.choice(holdings[user_id - 1])
+        store.buy(user_id, symbol, 1, 101.0)
+        store.sell(user_id, symbol, 1, 102.0)
+    trade_us = (time.perf_counter() - started) / (2 * args.trades) * 1e6
+
+    path = os.path.join(tempfile.mkdtemp(), "accounts.npz")
+    started = time.perf_counter()
+    store.save(path)
+    save_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    loaded = AccountStore.load(path)
+    load_seconds = time.perf_counter() - started
+    assert loaded.portfolio(args.accounts) == store.portfolio(args.accounts)
+
+    print(f"{args.accounts} accounts x {args.positions} positions")
+    print(f"store memory        {store_bytes / 2**20:>10.1f} MiB  ({store_bytes / args.accounts:.0f} B/account)")
+    print(f"dict-of-dicts       {dict_bytes / 2**20:>10.1f} MiB  ({dict_bytes / args.accounts:.0f} B/account)")
+    print(f"open all accounts   {build_seconds:>10.2f} s")
+    print(f"buy or sell         {trade_us:>10.2f} us")
+    print(f"snapshot save       {save_seconds * 1000:>10.1f} ms  ({os.path.getsize(path) / 2**20:.1f} MiB)")
+    print(f"snapshot load       {load_seconds * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
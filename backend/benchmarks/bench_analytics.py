@@ -0,0 +1,121 @@
+"""Cost of portfolio analytics: first build vs cached and incremental requests.
+
+Writes a portfolio with N trades spread over --years of trading days into a
+temporary SQLite database, with hourly price history for its symbols, then
+times PortfolioAnalytics.report: cold (whole trade log read and every day
+valued), warm with nothing new, after one new trade, and after a day has
+closed. Prices come from a dict, so no quote fetching is included.
+
+    python benchmarks/bench_analytics.py
+    python benchmarks/bench_analytics.py --trades 200000 --years 10 --symbols 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import models  # noqa: E402
+from analytics import PortfolioAnalytics  # noqa: E402
+from price_history import PriceHistoryStore  # noqa: E402
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trades", type=int, default=50000)
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    tmp = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite:///{os.path.join(tmp, 'analytics.db')}")
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    portfolio = models.Portfolio(user_id=1, cash=10000.0)
+    db.add(portfolio)
+    db.commit()
+
+    symbols = [f"S{i:03d}" for i in range(args.symbols)]
+    start = int(datetime(2015, 1, 1, tzinfo=timezone.utc).timestamp())
+    hours = start + np.arange(int(args.years * 365 * 24)) * 3600
+    store = PriceHistoryStore(os.path.join(tmp, "history"))
+    closes = {}
+    for symbol in symbols:
+        close = np.round(50 * np.exp(np.cumsum(rng.normal(0, 0.003, len(hours)))), 2)
+        store.append(symbol, hours, close, close, close, close, np.zeros(len(hours)))
+        closes[symbol] = close
+
+    # Sells never exceed the shares held
+    times = np.sort(rng.integers(0, len(hours) - 1, args.trades))
+    picks = rng.integers(0, args.symbols, args.trades)
+    held = dict.fromkeys(symbols, 0)
+    rows = []
+    for seq, (hour, pick) in enumerate(zip(times.tolist(), picks.tolist()), 1):
+        symbol = symbols[pick]
+        sell = held[symbol] > 0 and rng.random() < 0.5
+        quantity = int(rng.integers(1, held[symbol] + 1)) if sell else 1
+        held[symbol] += -quantity if sell else quantity
+        rows.append({
+            "portfolio_id": portfolio.id, "symbol": symbol, "quantity": float(quantity),
+            "price": float(closes[symbol][hour]), "trade_type": "SELL" if sell else "BUY",
+            "timestamp": datetime.utcfromtimestamp(int(hours[hour])), "seq": seq,
+        })
+    db.execute(insert(models.Trade), rows)
+    db.commit()
+
+    now = [float(hours[-1])]
+    prices = {symbol: float(closes[symbol][-1]) for symbol in symbols}
+
+    trade_count = [args.trades]
+
+    def report(analytics):
+        return analytics.report(db, 1, portfolio.id, trade_count[0], lambda wanted: {s: prices[s] for s in wanted})
+
+    cold = timed(lambda: report(PortfolioAnalytics(store, clock=lambda: now[0])), 3)
+    analytics = PortfolioAnalytics(store, clock=lambda: now[0])
+    result = report(analytics)
+    warm = timed(lambda: report(analytics), 200)
+
+    def one_trade():
+        db.add(models.Trade(
+            portfolio_id=portfolio.id, symbol=symbols[0], quantity=1.0, price=prices[symbols[0]],
+            trade_type="BUY", timestamp=datetime.utcfromtimestamp(now[0])
+        ))
+        db.commit()
+        trade_count[0] += 1
+        report(analytics)
+
+    new_trade = timed(one_trade, 50)
+
+    def next_day():
+        now[0] += 86400
+        report(analytics)
+
+    day_closed = timed(next_day, 20)
+
+    print(f"{args.trades} trades, {args.symbols} symbols, {len(result['series']['dates'])} days")
+    print(f"cold build                {cold:>10.1f} ms")
+    print(f"warm, nothing new         {warm:>10.3f} ms")
+    print(f"after one new trade       {new_trade:>10.3f} ms")
+    print(f"after a day closes        {day_closed:>10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Vectorized backtest speed over years of minute bars.
+
+Generates a random-walk minute series (390 bars a day, 252 days a year),
+trades a moving-average crossover on it and times run_backtest. With
+--symbols > 1 every symbol runs the same strategy on its own series. Also
+runs the first --check-bars bars through trading.apply_fill one order at a
+time and checks both give the same cash, holdings and average prices.
+
+    python benchmarks/bench_backtest.py
+    python benchmarks/bench_backtest.py --years 10 --symbols 5 --check-bars 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backtest import orders_from_targets, run_backtest  # noqa: E402
+from trading import STARTING_CASH, TradeRejected, apply_fill  # noqa: E402
+
+
+def moving_average(values, window):
+    sums = np.cumsum(values, axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    return sums / np.minimum(np.arange(1, len(values) + 1), window).reshape((-1,) + (1,) * (values.ndim - 1))
+
+
+def reference(prices, orders, cash):
+    # Order by order through apply_fill, as the API would
+    held = [0.0] * prices.shape[1]
+    average = [0.0] * prices.shape[1]
+    for t in range(prices.shape[0]):
+        for s in range(prices.shape[1]):
+            quantity = float(orders[t, s])
+            if quantity:
+                action = "buy" if quantity > 0 else "sell"
+                try:
+                    cash, held[s], average[s] = apply_fill(cash, held[s], average[s], action, abs(quantity), prices[t, s])
+                except TradeRejected:
+                    pass
+    return cash, held, average
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=float, default=10)
+    parser.add_argument("--symbols", type=int, default=1)
+    parser.add_argument("--fast", type=int, default=50, help="fast moving average, bars")
+    parser.add_argument("--slow", type=int, default=200, help="slow moving average, bars")
+    parser.add_argument("--shares", type=float, default=10, help="shares held while the signal is long")
+    parser.add_argument("--check-bars", type=int, default=100000, help="bars to verify against apply_fill (0 to skip)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    bars = int(args.years * 252 * 390)
+    rng = np.random.default_rng(args.seed)
+    prices = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.0008, (bars, args.symbols)), axis=0)), 2)
+
+    started = time.perf_counter()
+    long = moving_average(prices, args.fast) > moving_average(prices, args.slow)
+    # Decide on a bar's close, trade on the next bar
+    targets = np.vstack([np.zeros((1, args.symbols)), long[:-1]]) * args.shares
+    orders = orders_from_targets(targets)
+    signal_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    result = run_backtest(prices, orders)
+    run_seconds = time.perf_counter() - started
+
+    summary = result["summary"]
+    print(f"{bars} bars x {args.symbols} symbols ({args.years:g} years of minutes)")
+    print(f"signals                  {signal_seconds * 1000:>10.1f} ms")
+    print(f"run_backtest             {run_seconds * 1000:>10.1f} ms  ({bars * args.symbols / run_seconds / 1e6:.1f}M bars/s)")
+    print(f"trades / rejected        {summary['trades']:>10} / {summary['rejected']}")
+    print(f"final equity             {summary['finalEquity']:>10.2f}  (max drawdown {summary['maxDrawdown']:.1%})")
+
+    if args.check_bars:
+        n = min(args.check_bars, bars)
+        started = time.perf_counter()
+        cash, held, average = reference(prices[:n], orders[:n], STARTING_CASH)
+        loop_seconds = time.perf_counter() - started
+        part = run_backtest(prices[:n], orders[:n])
+        assert part["cash"][-1] == cash, (part["cash"][-1], cash)
+        assert list(part["positions"][-1]) == held, (part["positions"][-1], held)
+        assert np.allclose(part["averagePrice"][-1], average, rtol=1e-9), (part["averagePrice"][-1], average)
+        print(f"apply_fill loop, {n} bars {loop_seconds * 1000:>8.1f} ms  (same cash, holdings and average prices)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Leaderboard update and query cost at competition scale.
+
+Builds an in-memory leaderboard of N portfolios holding random positions,
+then times price ticks (revaluing only the holders of one symbol), refreshes
+of recently traded portfolios, top-N and rank queries, against a full
+revalue-and-sort of every portfolio per update.
+
+    python benchmarks/bench_leaderboard.py
+    python benchmarks/bench_leaderboard.py --users 100000 --symbols 500 --positions 5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboard import Leaderboard  # noqa: E402
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--positions", type=int, default=5, help="positions per portfolio")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    symbols = [f"S{i:04d}" for i in range(args.symbols)]
+    prices = {symbol: rng.uniform(5, 500) for symbol in symbols}
+
+    def random_holdings(user_id):
+        held = {
+            symbol: (float(rng.randint(1, 50)), prices[symbol])
+            for symbol in rng.sample(symbols, args.positions)
+        }
+        return user_id, rng.uniform(0, 10000), held
+
+    rows = [random_holdings(user_id) for user_id in range(1, args.users + 1)]
+    board = Leaderboard()
+
+    started = time.perf_counter()
+    board.set_holdings(rows)
+    board.set_prices(prices)
+    load_seconds = time.perf_counter() - started
+
+    def tick():
+        symbol = rng.choice(symbols)
+        board.on_price(symbol, prices[symbol] * rng.uniform(0.98, 1.02))
+
+    def trades():
+        board.set_holdings([random_holdings(rng.randint(1, args.users)) for _ in range(100)])
+
+    def full_resort():
+        # What ranking costs without incremental maintenance
+        equity = [
+            (-(cash + sum(quantity * prices[symbol] for symbol, (quantity, _) in held.items())), user_id)
+            for user_id, cash, held in rows
+        ]
+        equity.sort()
+
+    print(f"{args.users} portfolios, {args.symbols} symbols, {args.positions} positions each")
+    print(f"initial load + pricing        {load_seconds * 1000:>10.1f} ms")
+    print(f"price tick (one symbol)       {timed(tick, 200):>10.3f} ms  (~{args.users * args.positions // args.symbols} holders)")
+    print(f"100 traded portfolios         {timed(trades, 50):>10.3f} ms")
+    print(f"top 10                        {timed(lambda: board.top(10), 2000):>10.4f} ms")
+    print(f"top 10 at offset users/2      {timed(lambda: board.top(10, args.users // 2), 2000):>10.4f} ms")
+    print(f"rank of a user                {timed(lambda: board.rank(rng.randint(1, args.users)), 2000):>10.4f} ms")
+    print(f"full revalue + sort           {timed(full_resort, 3):>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
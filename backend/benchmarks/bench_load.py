@@ -0,0 +1,330 @@
+"""Mixed-workload load test of main.app or my_stock_app over local HTTP.
+
+Starts the app with uvicorn on a free localhost port, on a throwaway SQLite
+file (or --database-url, e.g. a local Postgres) and with quotes from the
+synthetic provider or a mock_stock_api started next to it, so nothing leaves
+the machine. --concurrency workers then run a weighted mix of quote polling,
+batch quotes, portfolio reads, trade bursts and trade-history scrolling for
+--duration seconds, and the run reports requests/s and p50/p95/p99 latency
+per endpoint. Each worker's sequence of requests is fixed by --seed.
+
+--save writes the results as a JSON baseline (committed baselines live in
+benchmarks/baselines/, so a re-run shows up as a diff); --baseline compares
+against one and exits non-zero if an endpoint's p95 grew, or its
+throughput fell, by more than --tolerance.
+
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --app my_stock_app --quotes mock --concurrency 32
+    python benchmarks/bench_load.py --database-url postgresql://localhost/stocks_bench
+    python benchmarks/bench_load.py --save benchmarks/baselines/main_sqlite.json
+    python benchmarks/bench_load.py --baseline benchmarks/baselines/main_sqlite.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+import numpy as np
+import requests
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SYMBOLS = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "META", "NVDA", "NFLX", "PYPL", "INTC"]
+
+# Where each app takes trades and what it calls the side ("buy" / "BUY")
+APPS = {
+    "main": {"target": "main:app", "trade": "/trade", "side": "action", "history": True},
+    "my_stock_app": {"target": "my_stock_app:my_app", "trade": "/make-trade", "side": "trade_type", "history": False},
+}
+
+DEFAULT_MIX = "quote=45,batch=10,portfolio=20,trade=15,history=10"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def serve(target: str, env: dict, log_path: str):
+    # uvicorn in a child process, stopped on the way out
+    port = free_port()
+    log = open(log_path, "ab")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{target} exited during startup, see {log_path}")
+            try:
+                if requests.get(f"{base}/", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{target} did not start within 60s, see {log_path}")
+            time.sleep(0.2)
+        yield base
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+
+
+class Recorder:
+    # Latencies and outcomes per endpoint, for requests started in the window
+    def __init__(self, measure_from: float):
+        self.measure_from = measure_from
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(lambda: defaultdict(int))
+
+    def request(self, session, method: str, url: str, endpoint: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=30, **kwargs)
+            outcome = "ok" if response.status_code < 400 else "rejected" if response.status_code < 500 else "errors"
+        except requests.RequestException:
+            response, outcome = None, "errors"
+        if started >= self.measure_from:
+            self.latencies[endpoint].append(time.perf_counter() - started)
+            self.outcomes[endpoint][outcome] += 1
+        return response
+
+
+def trade_body(app, user, symbol, buy):
+    side = "buy" if buy else "sell"
+    return {"user_id": user, "symbol": symbol, "quantity": 1, app["side"]: side if app["side"] == "action" else side.upper()}
+
+
+def run_scenario(name, rng, session, recorder, base, app, users):
+    user = rng.randint(1, users)
+    if name == "quote":
+        recorder.request(session, "GET", f"{base}/stock/{rng.choice(SYMBOLS)}", "GET /stock/{symbol}")
+    elif name == "batch":
+        symbols = ",".join(rng.sample(SYMBOLS, 5))
+        recorder.request(session, "GET", f"{base}/stocks", "GET /stocks", params={"symbols": symbols})
+    elif name == "portfolio":
+        recorder.request(session, "GET", f"{base}/my-portfolio/{user}", "GET /my-portfolio/{user_id}")
+    elif name == "trade":
+        # A burst of round trips, so shares sold were always just bought
+        for _ in range(2):
+            symbol = rng.choice(SYMBOLS)
+            for buy in (True, False):
+                recorder.request(
+                    session, "POST", f"{base}{app['trade']}", f"POST {app['trade']}",
+                    json=trade_body(app, user, symbol, buy),
+                )
+    elif name == "history":
+        # Scroll up to three pages back
+        params = {"limit": 20}
+        for _ in range(3):
+            response = recorder.request(
+                session, "GET", f"{base}/trade-history/{user}", "GET /trade-history/{user_id}", params=params
+            )
+            cursor = response.json().get("nextCursor") if response is not None and response.ok else None
+            if not cursor:
+                break
+            params = {"limit": 20, "cursor": cursor}
+
+
+def seed_accounts(base, app, users, trades, concurrency):
+    # Every account exists and has some history to scroll before timing starts
+    def seed(user):
+        session = requests.Session()
+        session.get(f"{base}/my-portfolio/{user}", timeout=30)
+        rng = random.Random(user)
+        for i in range(trades):
+            # Buy and sell back in turn, so cash never runs out
+            if i % 2 == 0:
+                symbol = rng.choice(SYMBOLS)
+            session.post(f"{base}{app['trade']}", timeout=30, json=trade_body(app, user, symbol, i % 2 == 0))
+        session.close()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(seed, range(1, users + 1)))
+
+
+def database_label(url):
+    # Scheme only, never credentials
+    return url.split(":", 1)[0] if url else "sqlite"
+
+
+def percentile_ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else None
+
+
+def summarize(recorders, seconds):
+    latencies, outcomes = defaultdict(list), defaultdict(lambda: defaultdict(int))
+    for recorder in recorders:
+        for endpoint, values in recorder.latencies.items():
+            latencies[endpoint].extend(values)
+        for endpoint, counts in recorder.outcomes.items():
+            for outcome, count in counts.items():
+                outcomes[endpoint][outcome] += count
+    results = {}
+    for endpoint in sorted(latencies):
+        values = latencies[endpoint]
+        results[endpoint] = {
+            "requests": len(values),
+            "rps": round(len(values) / seconds, 1),
+            "p50_ms": percentile_ms(values, 50),
+            "p95_ms": percentile_ms(values, 95),
+            "p99_ms": percentile_ms(values, 99),
+            "rejected": outcomes[endpoint]["rejected"],
+            "errors": outcomes[endpoint]["errors"],
+        }
+    every = [v for values in latencies.values() for v in values]
+    total = {
+        "requests": len(every),
+        "rps": round(len(every) / seconds, 1),
+        "p50_ms": percentile_ms(every, 50),
+        "p95_ms": percentile_ms(every, 95),
+        "p99_ms": percentile_ms(every, 99),
+        "rejected": sum(counts["rejected"] for counts in outcomes.values()),
+        "errors": sum(counts["errors"] for counts in outcomes.values()),
+    }
+    return results, total
+
+
+def print_table(results, total):
+    print(f"{'endpoint':<32} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'4xx':>6} {'err':>5}")
+    for endpoint, row in list(results.items()) + [("total", total)]:
+        print(
+            f"{endpoint:<32} {row['requests']:>9} {row['rps']:>9.1f} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+            f"{row['p99_ms']:>8} {row['rejected']:>6} {row['errors']:>5}"
+        )
+
+
+def compare(baseline, results, tolerance):
+    # Prints every endpoint's change; returns the number of regressions
+    regressions = 0
+    print(f"\n{'endpoint':<32} {'metric':<7} {'baseline':>10} {'now':>10} {'change':>8}")
+    for endpoint, before in sorted(baseline["endpoints"].items()):
+        now = results.get(endpoint)
+        if now is None:
+            print(f"{endpoint:<32} missing from this run")
+            regressions += 1
+            continue
+        for metric, worse in (("rps", -1), ("p95_ms", 1)):
+            old, new = before[metric], now[metric]
+            change = (new - old) / old if old else 0.0
+            flag = "  REGRESSED" if change * worse > tolerance else ""
+            regressions += bool(flag)
+            print(f"{endpoint:<32} {metric:<7} {old:>10} {new:>10} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", choices=sorted(APPS), default="main")
+    parser.add_argument("--quotes", choices=("synthetic", "mock"), default="synthetic",
+                        help="synthetic provider in-process, or a local mock_stock_api over HTTP")
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file; use an empty database")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds run before measuring")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--history-trades", type=int, default=45, help="trades per user made before the run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write results to this JSON baseline")
+    parser.add_argument("--baseline", help="compare with this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95/throughput change")
+    args = parser.parse_args()
+
+    app = APPS[args.app]
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    if not app["history"]:
+        mix.pop("history", None)
+    names, weights = list(mix), list(mix.values())
+
+    tmp = tempfile.mkdtemp(prefix="bench_load_")
+    env = {
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(tmp, 'load.db')}",
+        "PRICE_HISTORY_DIR": os.path.join(tmp, "price_history"),
+        "APP_ENV": "test",
+        "SYNTHETIC_SEED": str(args.seed),
+        "MARKET_SEED": str(args.seed),
+        "DB_POOL_SIZE": str(max(5, args.concurrency)),
+        # Fresh database: let main.py bring the schema up on start
+        "DB_AUTO_MIGRATE": "1",
+    }
+    with ExitStack() as stack:
+        if args.quotes == "mock":
+            env["QUOTE_PROVIDER"] = "http"
+            env["QUOTE_API_URL"] = stack.enter_context(
+                serve("mock_stock_api:app", {"APP_ENV": "test"}, os.path.join(tmp, "mock_stock_api.log"))
+            )
+        else:
+            env["QUOTE_PROVIDER"] = "synthetic"
+        base = stack.enter_context(serve(app["target"], env, os.path.join(tmp, f"{args.app}.log")))
+
+        seed_accounts(base, app, args.users, args.history_trades, args.concurrency)
+        started = time.perf_counter()
+        measure_from = started + args.warmup
+        stop_at = measure_from + args.duration
+
+        def worker(index):
+            rng = random.Random(args.seed * 100003 + index)
+            session = requests.Session()
+            recorder = Recorder(measure_from)
+            while time.perf_counter() < stop_at:
+                run_scenario(rng.choices(names, weights)[0], rng, session, recorder, base, app, args.users)
+            session.close()
+            return recorder
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            recorders = list(pool.map(worker, range(args.concurrency)))
+
+    results, total = summarize(recorders, args.duration)
+    print(f"{args.app}, {args.quotes} quotes, {'given database' if args.database_url else 'SQLite'}, "
+          f"{args.concurrency} workers, {args.duration:g}s")
+    print_table(results, total)
+
+    report = {
+        "config": {
+            "app": args.app,
+            "quotes": args.quotes,
+            "database": database_label(args.database_url),
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "users": args.users,
+            "mix": mix,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "endpoints": results,
+        "total": total,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        print(f"{regressions} regression(s) beyond {args.tolerance:.0%}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
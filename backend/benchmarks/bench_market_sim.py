@@ -0,0 +1,68 @@
+"""Throughput of the seeded market simulation.
+
+Times stepping N symbols one tick at a time (a live feed), catching up a
+large jump at once (a fast-forwarded clock), generating a replay path with
+MarketSimulator.path, and a batch quote. Replaying the same seed is checked
+to give the same prices.
+
+    python benchmarks/bench_market_sim.py
+    python benchmarks/bench_market_sim.py --symbols 500 --ticks 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_sim import MarketSimulator  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--ticks", type=int, default=200000, help="ticks for the catch-up and path runs")
+    parser.add_argument("--steps", type=int, default=5000, help="single-tick steps to time")
+    parser.add_argument("--correlation", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    symbols = [f"S{i:04d}" for i in range(args.symbols)]
+    market = MarketSimulator(seed=args.seed, correlation=args.correlation, speed=0)
+    market.quotes(symbols)
+
+    started = time.perf_counter()
+    for _ in range(args.steps):
+        market.advance(1)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    market.advance(args.ticks)
+    jump = time.perf_counter() - started
+
+    started = time.perf_counter()
+    path = market.path(symbols, 0, args.ticks)
+    replay = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        market.quotes(symbols)
+    quotes_ms = (time.perf_counter() - started) / 1000 * 1000
+
+    again = MarketSimulator(seed=args.seed, correlation=args.correlation, speed=0).path(symbols, 0, args.ticks)
+    assert np.array_equal(path, again)
+    returns = np.diff(np.log(path), axis=0)
+    correlation = np.corrcoef(returns.T)[np.triu_indices(args.symbols, 1)].mean() if args.symbols > 1 else 1.0
+
+    print(f"{args.symbols} symbols")
+    print(f"one tick at a time        {args.steps / single:>12.0f} ticks/s")
+    print(f"{f'{args.ticks}-tick jump':<26}{args.ticks / jump:>12.0f} ticks/s")
+    print(f"replay path               {args.ticks / replay:>12.0f} ticks/s  ({path.size / replay / 1e6:.1f}M prices/s)")
+    print(f"batch quote, all symbols  {quotes_ms:>12.3f} ms")
+    print(f"mean pairwise correlation {correlation:>12.3f}  (target {args.correlation})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Throughput of the in-memory order book as the number of open orders grows.
+
+For each book size, fills the book with random limit, stop and stop-limit
+orders around a starting price, then feeds it a random walk of price updates
+and reports updates per second and fills per second. A linear scan over all
+open orders would slow down in proportion to the book size; the heaps only
+touch the orders a price update actually crosses.
+
+    python benchmarks/bench_order_book.py
+    python benchmarks/bench_order_book.py --sizes 1000,100000 --updates 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_book import ORDER_TYPES, BookOrder, OrderBook  # noqa: E402
+
+START_PRICE = 100.0
+
+
+def random_order(rng: random.Random, order_id: int, spread: float) -> BookOrder:
+    order_type = rng.choice(ORDER_TYPES)
+    side = rng.choice(("BUY", "SELL"))
+    # Thresholds spread around the start price so the walk keeps crossing some
+    limit = START_PRICE * (1 + rng.uniform(-spread, spread))
+    stop = START_PRICE * (1 + rng.uniform(-spread, spread))
+    return BookOrder(
+        order_id, rng.randrange(1000), "SYM", side, order_type, 1.0,
+        limit_price=limit if order_type != "STOP" else None,
+        stop_price=stop if order_type != "LIMIT" else None,
+    )
+
+
+def run(size: int, updates: int, spread: float, seed: int):
+    rng = random.Random(seed)
+    book = OrderBook()
+    started = time.perf_counter()
+    book.load(random_order(rng, i, spread) for i in range(size))
+    load_seconds = time.perf_counter() - started
+
+    price = START_PRICE
+    fills = triggered = 0
+    started = time.perf_counter()
+    for _ in range(updates):
+        price *= 1 + rng.gauss(0, 0.001)
+        filled, fired = book.on_price("SYM", price)
+        fills += len(filled)
+        triggered += len(fired)
+    elapsed = time.perf_counter() - started
+    return load_seconds, elapsed, fills, triggered, book.stats()["openOrders"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--updates", type=int, default=50000, help="price updates per book size")
+    parser.add_argument("--spread", type=float, default=0.2, help="order thresholds within +/- this fraction of the price")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'orders':>9} {'load s':>8} {'updates/s':>11} {'fills':>8} {'fills/s':>10} {'triggered':>9} {'left':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        load_seconds, elapsed, fills, triggered, left = run(size, args.updates, args.spread, args.seed)
+        print(
+            f"{size:>9} {load_seconds:>8.2f} {args.updates / elapsed:>11.0f} {fills:>8} "
+            f"{fills / elapsed:>10.0f} {triggered:>9} {left:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
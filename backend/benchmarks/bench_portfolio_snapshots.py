@@ -0,0 +1,89 @@
+"""Point-in-time portfolio reconstruction cost as a trade history grows.
+
+Writes a synthetic history of N trades for one portfolio, numbers it and
+builds its checkpoints with rebuild_checkpoints(), then times portfolio_at()
+at random moments. With checkpoints the time per lookup should stay flat as
+N grows; --interval 1000000000 effectively disables them for comparison.
+
+    python benchmarks/bench_portfolio_snapshots.py
+    python benchmarks/bench_portfolio_snapshots.py --sizes 10000,1000000 --interval 100
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SYMBOLS = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "META", "NVDA", "NFLX"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--interval", type=int, default=100, help="PORTFOLIO_CHECKPOINT_INTERVAL")
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["PORTFOLIO_CHECKPOINT_INTERVAL"] = str(args.interval)
+
+    from sqlalchemy import insert
+    from sqlalchemy.orm import sessionmaker
+
+    import models
+    from db_engine import make_engine
+    from portfolio_snapshots import portfolio_at, rebuild_checkpoints
+
+    tmp = tempfile.mkdtemp()
+    print(f"{'trades':>9} {'write s':>8} {'rebuild s':>10} {'lookup ms':>10} {'max replayed':>13}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        engine = make_engine(f"sqlite:///{tmp}/bench_snapshots_{size}.db")
+        models.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        portfolio = models.Portfolio(user_id=1, cash=10000.00)
+        db.add(portfolio)
+        db.commit()
+
+        # Alternate small buys and sells so every trade is valid to replay
+        rng = random.Random(args.seed)
+        start = datetime(2024, 1, 1)
+        held = {symbol: 0.0 for symbol in SYMBOLS}
+        rows = []
+        started = time.perf_counter()
+        for i in range(size):
+            symbol = rng.choice(SYMBOLS)
+            action = "SELL" if held[symbol] >= 1 and rng.random() < 0.5 else "BUY"
+            held[symbol] += -1 if action == "SELL" else 1
+            rows.append({
+                "portfolio_id": portfolio.id, "symbol": symbol, "trade_type": action, "quantity": 1.0,
+                "price": 0.5 + rng.randrange(16) / 32, "timestamp": start + timedelta(seconds=i),
+            })
+            if len(rows) == 50000:
+                db.execute(insert(models.Trade), rows)
+                rows = []
+        if rows:
+            db.execute(insert(models.Trade), rows)
+        db.commit()
+        write_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        rebuild_checkpoints(db, portfolio.id)
+        db.commit()
+        rebuild_seconds = time.perf_counter() - started
+
+        max_replayed = 0
+        started = time.perf_counter()
+        for _ in range(args.lookups):
+            state = portfolio_at(db, portfolio.id, start + timedelta(seconds=rng.randrange(size)))
+            max_replayed = max(max_replayed, state["replayed"])
+        lookup_ms = (time.perf_counter() - started) / args.lookups * 1000
+        db.close()
+        print(f"{size:>9} {write_seconds:>8.2f} {rebuild_seconds:>10.2f} {lookup_ms:>10.2f} {max_replayed:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Append and range-read speed of the memory-mapped price history store.
+
+Appends N one-minute bars for a symbol (in chunks and one at a time), then
+times random range reads of --window bars: the zero-copy slice, the slice
+plus the .tolist() conversion the HTTP endpoint does, and the same range
+from an indexed SQLite table for comparison.
+
+    python benchmarks/bench_price_history.py
+    python benchmarks/bench_price_history.py --bars 5000000 --window 1000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_history import PriceHistoryStore  # noqa: E402
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bars", type=int, default=1000000)
+    parser.add_argument("--window", type=int, default=500, help="bars per range read")
+    parser.add_argument("--singles", type=int, default=2000, help="one-bar appends to time")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    timestamps = 1_700_000_000 + np.arange(args.bars, dtype="<i8") * 60
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, args.bars)))
+    high, low, volume = close * 1.001, close * 0.999, rng.integers(100, 10000, args.bars).astype("<f8")
+
+    tmp = tempfile.mkdtemp()
+    store = PriceHistoryStore(os.path.join(tmp, "history"))
+    started = time.perf_counter()
+    for i in range(0, args.bars, 10000):
+        part = slice(i, i + 10000)
+        store.append("BENCH", timestamps[part], close[part], high[part], low[part], close[part], volume[part])
+    chunked = time.perf_counter() - started
+
+    next_ts = int(timestamps[-1])
+
+    def append_one():
+        nonlocal next_ts
+        next_ts += 60
+        store.append("BENCH", next_ts, 1.0, 1.0, 1.0, 1.0, 1.0)
+
+    single_ms = timed(append_one, args.singles)
+
+    db = sqlite3.connect(os.path.join(tmp, "bars.db"))
+    db.execute("CREATE TABLE bars (symbol TEXT, ts INTEGER, open REAL, high REAL, low REAL, close REAL, volume REAL)")
+    db.execute("CREATE INDEX ix_bars_symbol_ts ON bars (symbol, ts)")
+    db.executemany(
+        "INSERT INTO bars VALUES ('BENCH', ?, ?, ?, ?, ?, ?)",
+        zip(timestamps.tolist(), close.tolist(), high.tolist(), low.tolist(), close.tolist(), volume.tolist()),
+    )
+    db.commit()
+
+    starts = [int(timestamps[random.randrange(args.bars - args.window)]) for _ in range(1000)]
+    picks = iter(starts * 10)
+    span = args.window * 60
+
+    def slice_only():
+        start = next(picks)
+        store.bars("BENCH", start, start + span)
+
+    def slice_to_lists():
+        start = next(picks)
+        {name: column.tolist() for name, column in store.bars("BENCH", start, start + span).items()}
+
+    def sqlite_range():
+        start = next(picks)
+        db.execute(
+            "SELECT ts, open, high, low, close, volume FROM bars WHERE symbol = 'BENCH' AND ts >= ? AND ts < ? ORDER BY ts",
+            (start, start + span),
+        ).fetchall()
+
+    print(f"{args.bars} bars, {args.window}-bar windows")
+    print(f"append, 10k-bar chunks   {args.bars / chunked:>12.0f} bars/s")
+    print(f"append, one bar          {single_ms:>12.3f} ms")
+    print(f"range slice (views)      {timed(slice_only, 1000):>12.4f} ms")
+    print(f"range slice + tolist     {timed(slice_to_lists, 1000):>12.4f} ms")
+    print(f"sqlite indexed range     {timed(sqlite_range, 1000):>12.4f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""How much of a request goes into turning the response into JSON, on the
+hot endpoints of main.app, before and after orjson + response models.
+
+Seeds a throwaway SQLite database (synthetic quotes) with one portfolio,
+then for each endpoint builds the content its handler returns and times
+
+    before  no response_model: jsonable_encoder walks the dicts, json.dumps
+    after   what the route does now: pydantic validates and serializes the
+            response_model, orjson writes it (trade history skips the model
+            and hands its rows to orjson directly)
+
+next to the whole request through the ASGI app, with no client or network
+in between. The "before" share assumes the rest of the request is the same.
+
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --positions 50 --history-limit 500 --rounds 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USER_ID = 1
+
+
+async def call(app, path: str, query: str = "") -> bytes:
+    # One GET straight into the ASGI app
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query.encode(), "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    body = []
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    if status[0] != 200:
+        raise RuntimeError(f"GET {path}?{query} returned {status[0]}: {b''.join(body)[:200]!r}")
+    return b"".join(body)
+
+
+async def timed(rounds: int, func) -> float:
+    # Median seconds per call
+    await func()
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def seed(positions: int, trades: int) -> list:
+    import models
+    from database import SessionLocal
+    from trading import get_or_create_portfolio
+
+    symbols = [f"SYM{i:03d}" for i in range(positions)]
+    db = SessionLocal()
+    portfolio = get_or_create_portfolio(db, USER_ID)
+    db.add_all(
+        models.Position(portfolio_id=portfolio.id, symbol=symbol, quantity=10.0, average_price=100.0)
+        for symbol in symbols
+    )
+    started = datetime(2024, 1, 2, 14, 30, 0, 250000)
+    db.add_all(
+        models.Trade(
+            portfolio_id=portfolio.id, symbol=symbols[i % positions], quantity=1.0 + i % 7,
+            price=100.0 + i % 13 * 0.25, trade_type="BUY" if i % 3 else "SELL",
+            timestamp=started + timedelta(seconds=37 * i)
+        )
+        for i in range(trades)
+    )
+    db.commit()
+    db.close()
+    return symbols
+
+
+async def run(args):
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import APIRoute, serialize_response
+
+    import main
+    import migrations
+    from database import SessionLocal, engine
+    from portfolio_valuation import value_positions
+    from quote_providers import split_quote_results
+    from trade_history import trade_page, trade_totals
+    from trading import get_or_create_portfolio
+
+    migrations.upgrade(engine)
+    symbols = seed(args.positions, args.trades)
+    routes = {route.path: route for route in main.app.routes if isinstance(route, APIRoute)}
+
+    async def portfolio_content():
+        db = SessionLocal()
+        try:
+            portfolio = get_or_create_portfolio(db, USER_ID)
+            quotes = await main.quote_cache.get_many([position.symbol for position in portfolio.positions])
+            return {"cash": portfolio.cash, "positions": value_positions(portfolio.positions, quotes)}
+        finally:
+            db.close()
+
+    async def history_content():
+        db = SessionLocal()
+        try:
+            portfolio = get_or_create_portfolio(db, USER_ID, with_positions=False)
+            trades, next_cursor = trade_page(db, portfolio.id, args.history_limit)
+            return {"trades": trades, "nextCursor": next_cursor, "totals": trade_totals(db, portfolio.id)}
+        finally:
+            db.close()
+
+    batch = ",".join(symbols[:args.batch])
+    cases = [
+        ("/stock/{symbol}", "/stock/AAPL", "", await main.quote_cache.get("AAPL")),
+        ("/stocks", "/stocks", f"symbols={batch}", split_quote_results(await main.quote_cache.get_many(symbols[:args.batch]))),
+        ("/my-portfolio/{user_id}", f"/my-portfolio/{USER_ID}", "", await portfolio_content()),
+        ("/trade-history/{user_id}", f"/trade-history/{USER_ID}", f"limit={args.history_limit}", await history_content()),
+    ]
+
+    print(f"{'endpoint':<26} {'bytes':>8} {'before us':>10} {'after us':>9} {'request us':>11} {'share before':>13} {'share after':>12}")
+    for template, path, query, content in cases:
+        route = routes[template]
+
+        async def before():
+            return JSONResponse(jsonable_encoder(content)).body
+
+        async def after():
+            if route.response_field is None or template == "/trade-history/{user_id}":
+                return ORJSONResponse(content).body
+            serialized = await serialize_response(
+                field=route.response_field, response_content=content,
+                exclude_none=route.response_model_exclude_none
+            )
+            return ORJSONResponse(serialized).body
+
+        size = len(await call(main.app, path, query))
+        before_s = await timed(args.rounds, before)
+        after_s = await timed(args.rounds, after)
+        request_s = await timed(args.rounds, lambda: call(main.app, path, query))
+        # The request without its serialization, plus the old serialization
+        request_before = request_s - after_s + before_s
+        print(
+            f"{template:<26} {size:>8} {before_s * 1e6:>10.0f} {after_s * 1e6:>9.0f} {request_s * 1e6:>11.0f}"
+            f" {before_s / request_before:>12.1%} {after_s / request_s:>12.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--positions", type=int, default=20, help="positions in the portfolio")
+    parser.add_argument("--trades", type=int, default=2000, help="trades in its history")
+    parser.add_argument("--history-limit", type=int, default=500, help="trades per history page")
+    parser.add_argument("--batch", type=int, default=20, help="symbols per /stocks request")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench_serialization.db"
+    os.environ["PRICE_HISTORY_DIR"] = os.path.join(workdir, "history")
+    os.environ.setdefault("QUOTE_PROVIDER", "synthetic")
+    os.environ.setdefault("APP_ENV", "test")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
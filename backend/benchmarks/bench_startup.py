@@ -0,0 +1,169 @@
+"""Cold start of the API, measured in fresh interpreters.
+
+Each run starts a new Python process that imports the app module, builds
+the app, runs its startup (lifespan) and answers GET / straight through
+ASGI, timing every step, and lists the heavy libraries the import pulled in.
+main.py runs against a throwaway SQLite database migrated beforehand with
+migrations.py. --uvicorn also times a real server from spawn to first 200.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --app my_stock_app --runs 10 --uvicorn
+    python benchmarks/bench_startup.py --max-import-ms 1500   # exit 1 when slower
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# module, app factory (called) or attribute (read), uvicorn target
+APPS = {
+    "main": ("main", "create_app", None, "main:app"),
+    "my_stock_app": ("my_stock_app", None, "my_app", "my_stock_app:my_app"),
+}
+# Modules worth knowing about when they show up at import time
+HEAVY_MODULES = ("yfinance", "pandas", "numpy", "requests", "sqlalchemy", "fastapi", "orjson")
+PHASES = ("import", "build", "startup", "first_request", "process")
+
+
+async def get_root(app) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/", "raw_path": b"/", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+async def start_and_get(app):
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        status = await get_root(app)
+        answered = time.perf_counter()
+    if status != 200:
+        raise RuntimeError(f"GET / returned {status}")
+    return ready - started, answered - ready
+
+
+def measure(name: str) -> None:
+    # Runs in the child process, prints one JSON line
+    module_name, factory, attribute, _ = APPS[name]
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    imported = time.perf_counter()
+    loaded = [module for module in HEAVY_MODULES if module in sys.modules]
+    app = getattr(module, factory)() if factory else getattr(module, attribute)
+    built = time.perf_counter()
+    startup, first_request = asyncio.run(start_and_get(app))
+    print(json.dumps({
+        "import": imported - started,
+        "build": built - imported,
+        "startup": startup,
+        "first_request": first_request,
+        "loaded": loaded,
+    }), flush=True)
+    # The log listener and executor threads don't need a tidy exit
+    os._exit(0)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def uvicorn_ready(target: str, env: dict, timeout: float = 60.0) -> float:
+    # Seconds from spawning uvicorn to the first 200 from GET /
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn {target} exited with {server.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError(f"uvicorn {target} not ready after {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", choices=sorted(APPS), default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--uvicorn", action="store_true", help="also time a uvicorn server to its first response")
+    parser.add_argument("--max-import-ms", type=float, help="exit 1 when the median import is slower than this")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.app)
+
+    tmp = tempfile.mkdtemp(prefix="bench_startup_")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'startup.db')}",
+        "PRICE_HISTORY_DIR": os.path.join(tmp, "price_history"),
+        "APP_ENV": "test",
+    }
+    if args.app == "main":
+        subprocess.run([sys.executable, "migrations.py"], cwd=BACKEND, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    runs = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--measure", "--app", args.app],
+            cwd=BACKEND, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["process"] = time.perf_counter() - started
+        runs.append(result)
+
+    print(f"{args.app}: median of {args.runs} fresh processes")
+    for phase in PHASES:
+        values = [run[phase] * 1000 for run in runs]
+        print(f"  {phase:<14} {statistics.median(values):>8.1f} ms  (min {min(values):.1f}, max {max(values):.1f})")
+    print(f"  loaded by import: {', '.join(runs[-1]['loaded']) or 'none'}")
+    if args.uvicorn:
+        ready = [uvicorn_ready(APPS[args.app][3], env) * 1000 for _ in range(args.runs)]
+        print(f"  {'uvicorn ready':<14} {statistics.median(ready):>8.1f} ms  (min {min(ready):.1f}, max {max(ready):.1f})")
+
+    import_ms = statistics.median(run["import"] * 1000 for run in runs)
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"import took {import_ms:.1f} ms, over the {args.max_import_ms:.0f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
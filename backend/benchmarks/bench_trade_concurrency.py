@@ -0,0 +1,99 @@
+"""Stress test for per-portfolio serialized trade execution.
+
+Runs the same random mix of buys and sells over a set of accounts with an
+increasing number of worker threads, reports trades per second, and checks
+every account's cash and shares against the exact expected totals.
+
+    python benchmarks/bench_trade_concurrency.py --accounts 50 --trades 2000
+    python benchmarks/bench_trade_concurrency.py --database-url postgresql://...
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Prices and quantities that are exact in binary floating point, so balances
+# can be compared with ==
+PRICE = 12.5
+SEED_SHARES = 1_000_000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--trades", type=int, default=2000, help="trades per worker-count run")
+    parser.add_argument("--workers", default="1,2,4,8,16")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_trades.db"
+    os.environ.setdefault("DB_POOL_SIZE", "32")
+
+    import models
+    from database import SessionLocal, engine
+    from trading import execute_market_order
+
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    user_ids = list(range(1, args.accounts + 1))
+    for user_id in user_ids:
+        portfolio = models.Portfolio(user_id=user_id, cash=10000.00)
+        db.add(portfolio)
+        db.flush()
+        db.add(models.Position(portfolio_id=portfolio.id, symbol="BENCH", quantity=SEED_SHARES, average_price=PRICE))
+    db.commit()
+    db.close()
+
+    expected = {user_id: [10000.00, SEED_SHARES] for user_id in user_ids}
+    rng = random.Random(args.seed)
+
+    def trade(order):
+        user_id, action = order
+        session = SessionLocal()
+        try:
+            execute_market_order(session, user_id, "BENCH", action, 1.0, PRICE)
+        finally:
+            session.close()
+
+    print(f"{'workers':>8} {'trades':>8} {'seconds':>9} {'trades/s':>10}")
+    for workers in [int(w) for w in args.workers.split(",")]:
+        # Few accounts, many trades: workers regularly collide on one account
+        orders = [(rng.choice(user_ids), rng.choice(("buy", "sell"))) for _ in range(args.trades)]
+        for user_id, action in orders:
+            sign = 1 if action == "buy" else -1
+            expected[user_id][0] -= sign * PRICE
+            expected[user_id][1] += sign
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(trade, orders))
+        elapsed = time.perf_counter() - started
+        print(f"{workers:>8} {len(orders):>8} {elapsed:>9.3f} {len(orders) / elapsed:>10.1f}")
+
+    db = SessionLocal()
+    wrong = 0
+    for portfolio in db.query(models.Portfolio).all():
+        cash, shares = expected[portfolio.user_id]
+        held = portfolio.positions[0].quantity if portfolio.positions else 0.0
+        if portfolio.cash != cash or held != shares:
+            wrong += 1
+            print(f"user {portfolio.user_id}: cash {portfolio.cash} != {cash} or shares {held} != {shares}")
+    trades = db.query(models.Trade).count()
+    db.close()
+    print(f"{trades} trades recorded, {wrong} of {len(user_ids)} balances wrong")
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Sustained trade throughput: per-request commit vs. the group-committed journal.
+
+Runs the same random buy/sell mix through execute_market_order (one database
+commit per trade) and through TradeLedger (one journal fsync per group of
+trades, bulk writes to the database in the background), each against its
+own fresh database, and checks both end with the exact expected balances.
+
+SQLite runs with synchronous=FULL by default so that a per-request commit is
+as durable as a journaled trade; pass --synchronous NORMAL to compare against
+the app's default setting.
+
+    python benchmarks/bench_trade_journal.py --workers 32 --trades 5000
+    python benchmarks/bench_trade_journal.py --database-url postgresql://.../bench
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Exact in binary floating point, so balances can be compared with ==
+PRICE = 12.5
+SEED_SHARES = 1_000_000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to throwaway SQLite files")
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--trades", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--flush-ms", type=float, default=2.0, help="journal group-commit window")
+    parser.add_argument("--synchronous", default="FULL", help="SQLite synchronous pragma")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["SQLITE_SYNCHRONOUS"] = args.synchronous
+    os.environ.setdefault("DB_POOL_SIZE", str(args.workers + 4))
+    os.environ.setdefault("SQLITE_BUSY_TIMEOUT", "60")
+
+    from sqlalchemy.orm import sessionmaker
+
+    import models
+    from db_engine import make_engine
+    from trade_journal import TradeLedger
+    from trading import execute_market_order
+
+    tmp = tempfile.mkdtemp()
+    rng = random.Random(args.seed)
+    user_ids = list(range(1, args.accounts + 1))
+    orders = [(rng.choice(user_ids), rng.choice(("buy", "sell"))) for _ in range(args.trades)]
+    expected = {user_id: [10000.00, SEED_SHARES] for user_id in user_ids}
+    for user_id, action in orders:
+        sign = 1 if action == "buy" else -1
+        expected[user_id][0] -= sign * PRICE
+        expected[user_id][1] += sign
+
+    def fresh_database(name):
+        engine = make_engine(args.database_url or f"sqlite:///{tmp}/{name}.db")
+        models.Base.metadata.drop_all(bind=engine)
+        models.Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = session_factory()
+        for user_id in user_ids:
+            portfolio = models.Portfolio(user_id=user_id, cash=10000.00)
+            db.add(portfolio)
+            db.flush()
+            db.add(models.Position(portfolio_id=portfolio.id, symbol="BENCH", quantity=SEED_SHARES, average_price=PRICE))
+        db.commit()
+        db.close()
+        return session_factory
+
+    def check(session_factory):
+        db = session_factory()
+        wrong = 0
+        for portfolio in db.query(models.Portfolio).all():
+            cash, shares = expected[portfolio.user_id]
+            held = portfolio.positions[0].quantity if portfolio.positions else 0.0
+            if portfolio.cash != cash or held != shares:
+                wrong += 1
+        trades = db.query(models.Trade).count()
+        db.close()
+        return trades, wrong
+
+    def run(trade):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(trade, orders))
+        return time.perf_counter() - started
+
+    results = []
+
+    session_factory = fresh_database("bench_commit")
+
+    def commit_trade(order):
+        session = session_factory()
+        try:
+            execute_market_order(session, order[0], "BENCH", order[1], 1.0, PRICE)
+        finally:
+            session.close()
+
+    elapsed = run(commit_trade)
+    results.append(("commit per trade", elapsed, elapsed, *check(session_factory), ""))
+
+    journal_factory = fresh_database("bench_journal")
+    ledger = TradeLedger(
+        os.path.join(tmp, "bench_journal.log"), journal_factory, flush_interval=args.flush_ms / 1000
+    )
+    ledger.start()
+
+    def journal_trade(order):
+        ledger.execute(order[0], "BENCH", order[1], 1.0, PRICE)
+
+    elapsed = run(journal_trade)
+    started = time.perf_counter()
+    stats = ledger.stats()
+    ledger.close()
+    drained = elapsed + time.perf_counter() - started
+    results.append((
+        "journal + group commit", elapsed, drained, *check(journal_factory),
+        f"{stats['recordsPerFlush']:.1f} trades/fsync",
+    ))
+
+    print(f"{args.trades} trades, {args.accounts} accounts, {args.workers} workers")
+    print(f"{'mode':<24} {'acked/s':>9} {'in db/s':>9} {'trades':>7} {'wrong':>6}")
+    wrong_total = 0
+    for mode, acked, in_db, trades, wrong, note in results:
+        wrong_total += wrong
+        print(f"{mode:<24} {args.trades / acked:>9.0f} {args.trades / in_db:>9.0f} {trades:>7} {wrong:>6}  {note}")
+    sys.exit(1 if wrong_total else 0)
+
+
+if __name__ == "__main__":
+    main()
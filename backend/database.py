@@ -1,16 +1,16 @@
-from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
+from db_engine import make_engine
 
 load_dotenv()
 
 # Use environment variable for database URL or fallback to SQLite for development
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./stock_simulator.db")
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+# Create SQLAlchemy engine (pool and SQLite pragmas are tuned from the environment)
+engine = make_engine(DATABASE_URL)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class QueryCounter:
+    """Statements executed while a ``count_queries()`` block is active."""
+
+    def __init__(self):
+        self.count = 0
+        self.statements: List[str] = []
+
+
+_query_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    # Counts the statements run by the current request/thread on any engine
+    # built by make_engine, e.g. to check a handler runs a fixed number of them
+    counter = QueryCounter()
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+
+
+class QueryTimer:
+    """Statements executed, and seconds spent on them, while a
+    ``time_queries()`` block is active."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._token = None
+
+    def __enter__(self) -> "QueryTimer":
+        self._token = _query_timer.set(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        _query_timer.reset(self._token)
+
+
+_query_timer: ContextVar[Optional[QueryTimer]] = ContextVar("query_timer", default=None)
+
+
+def time_queries() -> QueryTimer:
+    # Like count_queries but cheap enough to wrap every request (metrics), so
+    # a plain context manager rather than a generator
+    return QueryTimer()
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter.count += 1
+        counter.statements.append(statement)
+    if _query_timer.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _time_statement(conn, cursor, statement, parameters, context, executemany):
+    timer = _query_timer.get()
+    started = conn.info.get("query_started")
+    if timer is not None and started:
+        timer.count += 1
+        timer.seconds += time.perf_counter() - started.pop()
+
+
+def _drop_failed_statement(context):
+    # A failed statement never reaches after_cursor_execute
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _listen_for_statements(engine: Engine) -> None:
+    event.listen(engine, "before_cursor_execute", _count_statement)
+    event.listen(engine, "after_cursor_execute", _time_statement)
+    event.listen(engine, "handle_error", _drop_failed_statement)
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+class PoolStats:
+    """Running totals of how long connection checkouts waited on the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def record(self, wait: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if wait <= bound:
+                    self.buckets[i] += 1
+                    break
+            else:
+                self.buckets[-1] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "totalWaitSeconds": self.total_wait,
+                "maxWaitSeconds": self.max_wait,
+                "avgWaitSeconds": self.total_wait / self.checkouts if self.checkouts else 0.0,
+                "waitBuckets": {
+                    **{str(bound): count for bound, count in zip(WAIT_BUCKETS, self.buckets)},
+                    "+Inf": self.buckets[-1],
+                },
+            }
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long every checkout waited for a connection
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside a writer, busy_timeout makes writers wait
+    # for the lock instead of failing with "database is locked"
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(float(os.getenv('SQLITE_BUSY_TIMEOUT', '5')) * 1000)}")
+    cursor.execute(f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute(f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', '20000'))}")
+    cursor.close()
+
+
+def make_engine(database_url: str) -> Engine:
+    # Render hands out postgres:// URLs, SQLAlchemy only accepts postgresql://
+    if database_url.startswith("postgres://"):
+        database_url = "postgresql://" + database_url[len("postgres://"):]
+    url = make_url(database_url)
+
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            engine = create_engine(database_url, connect_args={"check_same_thread": False})
+            _listen_for_statements(engine)
+            return engine
+        engine = create_engine(
+            database_url,
+            poolclass=TimedQueuePool,
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            connect_args={
+                "check_same_thread": False,
+                "timeout": float(os.getenv("SQLITE_BUSY_TIMEOUT", "5")),
+            },
+        )
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        _listen_for_statements(engine)
+        return engine
+
+    engine = create_engine(
+        database_url,
+        poolclass=TimedQueuePool,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pool_pre_ping=_env_flag("DB_POOL_PRE_PING", "1"),
+    )
+    _listen_for_statements(engine)
+    return engine
+
+
+def pool_stats(engine: Engine) -> Dict[str, Any]:
+    pool = engine.pool
+    result: Dict[str, Any] = {"pool": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        result.update({
+            "size": pool.size(),
+            "checkedIn": pool.checkedin(),
+            "checkedOut": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        result.update(stats.snapshot())
+    return result
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import Response
+
+# Per-user data: browsers may keep it but must ask again every time (a cheap
+# 304 when nothing changed), shared caches like nginx must not keep it at all
+PRIVATE_REVALIDATE = "private, no-cache"
+
+# Tags built from in-memory state like monotonic clocks only mean something
+# to the process that made them. After a restart, or from another worker,
+# they just don't match: the client gets a 200 and a new tag, never a wrong 304.
+BOOT_ID = os.urandom(4).hex()
+
+
+def make_etag(*parts, per_process: bool = True) -> str:
+    # Strong ETag over the given values. per_process=False for values read
+    # from the database, which every process and restart agrees on.
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'"{BOOT_ID}-{digest}"' if per_process else f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/"x" matches "x", * matches anything
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate == etag or candidate == "W/" + etag:
+            return True
+    return False
+
+
+def cache_headers(etag: str, cache_control: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    # A 304 carries the same validators and caching rules a 200 would have
+    return Response(status_code=304, headers=headers)
+
+
+def quote_headers(symbol: str, entry, now: float) -> Dict[str, str]:
+    # For a QuoteCache entry: tagged with its fetch time, and shared caches
+    # (nginx, browsers) may keep it as long as the server would
+    max_age = max(0, int(entry.expires_at - now))
+    return cache_headers(make_etag("quote", symbol.upper(), entry.fetched_at), f"public, max-age={max_age}")
+
+
+class PortfolioSymbols:
+    """Which symbols a portfolio held at a given version, so a conditional
+    request can be checked against the quote cache without loading its
+    positions. Keeps the most recently seen ``max_entries`` users.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._symbols: "OrderedDict[int, Tuple[int, Tuple[str, ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, user_id: int, version: int, symbols: Iterable[str]) -> None:
+        with self._lock:
+            self._symbols[user_id] = (version, tuple(sorted(symbol.upper() for symbol in symbols)))
+            self._symbols.move_to_end(user_id)
+            while len(self._symbols) > self.max_entries:
+                self._symbols.popitem(last=False)
+
+    def get(self, user_id: int, version: int) -> Optional[Tuple[str, ...]]:
+        known = self._symbols.get(user_id)
+        if known is None or known[0] != version:
+            return None
+        return known[1]
@@ -0,0 +1,181 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sortedcontainers import SortedList
+from sqlalchemy.orm import Session
+
+import models
+
+# (user_id, cash, {symbol: (quantity, average_price)})
+HoldingsRow = Tuple[int, float, Dict[str, Tuple[float, float]]]
+
+
+def load_holdings(db: Session, user_ids: Optional[Iterable[int]] = None, chunk: int = 1000) -> List[HoldingsRow]:
+    # Cash and positions of the given portfolios (all of them by default),
+    # two column-only queries per chunk rather than ORM objects
+    def rows_for(filter_users):
+        portfolios = db.query(models.Portfolio.id, models.Portfolio.user_id, models.Portfolio.cash)
+        positions = db.query(
+            models.Position.portfolio_id, models.Position.symbol, models.Position.quantity, models.Position.average_price
+        ).join(models.Portfolio, models.Portfolio.id == models.Position.portfolio_id)
+        if filter_users is not None:
+            portfolios = portfolios.filter(models.Portfolio.user_id.in_(filter_users))
+            positions = positions.filter(models.Portfolio.user_id.in_(filter_users))
+        else:
+            # Duplicates set aside by migration 3 have no user
+            portfolios = portfolios.filter(models.Portfolio.user_id.isnot(None))
+            positions = positions.filter(models.Portfolio.user_id.isnot(None))
+        held: Dict[int, Dict[str, Tuple[float, float]]] = {}
+        for portfolio_id, symbol, quantity, average_price in positions:
+            if quantity:
+                held.setdefault(portfolio_id, {})[symbol] = (quantity, average_price)
+        return [(user_id, cash, held.get(portfolio_id, {})) for portfolio_id, user_id, cash in portfolios]
+
+    if user_ids is None:
+        return rows_for(None)
+    user_ids = list(user_ids)
+    rows: List[HoldingsRow] = []
+    for i in range(0, len(user_ids), chunk):
+        rows.extend(rows_for(user_ids[i:i + chunk]))
+    return rows
+
+
+class Leaderboard:
+    """Users ranked by total equity: cash plus positions at the latest prices.
+
+    Rankings live in a sorted list keyed on (-equity, user_id), so adding,
+    removing, top-N and a user's rank are all O(log n). Prices only revalue
+    the users holding the symbols that moved, and a trade only the traders.
+    Both arrive as cheap notes (on_price, mark_dirty) and are applied in
+    batches by the caller (apply_prices, take_dirty). Positions without a
+    known price yet count at their average cost.
+    """
+
+    def __init__(self, rebuild_fraction: float = 0.25):
+        # When one update moves more than this fraction of all users, re-sort
+        # everything at once instead of moving users one by one
+        self.rebuild_fraction = rebuild_fraction
+        self._lock = threading.Lock()
+        self._cash: Dict[int, float] = {}
+        self._holdings: Dict[int, Dict[str, Tuple[float, float]]] = {}
+        self._holders: Dict[str, Set[int]] = {}
+        self._prices: Dict[str, float] = {}
+        self._equity: Dict[int, float] = {}
+        self._ranking = SortedList()
+        self._dirty: Set[int] = set()
+        self._pending_prices: Dict[str, float] = {}
+        self.updates = 0
+        self.rebuilds = 0
+
+    def _value(self, user_id: int) -> float:
+        prices = self._prices
+        return self._cash[user_id] + sum(
+            quantity * prices.get(symbol, average_price)
+            for symbol, (quantity, average_price) in self._holdings[user_id].items()
+        )
+
+    def _rerank(self, user_ids: Iterable[int]) -> None:
+        changed = []
+        for user_id in user_ids:
+            equity = self._value(user_id)
+            old = self._equity.get(user_id)
+            if equity != old:
+                changed.append((user_id, old, equity))
+                self._equity[user_id] = equity
+        if not changed:
+            return
+        self.updates += len(changed)
+        if len(changed) > self.rebuild_fraction * len(self._ranking):
+            self._ranking = SortedList((-equity, user_id) for user_id, equity in self._equity.items())
+            self.rebuilds += 1
+            return
+        for user_id, old, equity in changed:
+            if old is not None:
+                self._ranking.remove((-old, user_id))
+            self._ranking.add((-equity, user_id))
+
+    def set_holdings(self, rows: Iterable[HoldingsRow]) -> None:
+        with self._lock:
+            touched = []
+            for user_id, cash, positions in rows:
+                for symbol in self._holdings.get(user_id, {}):
+                    if symbol not in positions:
+                        holders = self._holders[symbol]
+                        holders.discard(user_id)
+                        if not holders:
+                            del self._holders[symbol]
+                for symbol in positions:
+                    self._holders.setdefault(symbol, set()).add(user_id)
+                self._cash[user_id] = cash
+                self._holdings[user_id] = positions
+                touched.append(user_id)
+            self._rerank(touched)
+
+    def on_price(self, symbol: str, price: float) -> None:
+        # Runs for every fetched quote: only noted, the next apply_prices()
+        # revalues holders once for everything that moved since
+        with self._lock:
+            self._pending_prices[symbol] = price
+
+    def apply_prices(self) -> int:
+        with self._lock:
+            prices, self._pending_prices = self._pending_prices, {}
+        if prices:
+            self.set_prices(prices)
+        return len(prices)
+
+    def set_prices(self, prices: Dict[str, float]) -> None:
+        # Holders of several moved symbols are revalued once
+        with self._lock:
+            touched: Set[int] = set()
+            for symbol, price in prices.items():
+                if self._prices.get(symbol) == price:
+                    continue
+                self._prices[symbol] = price
+                touched.update(self._holders.get(symbol, ()))
+            if touched:
+                self._rerank(touched)
+
+    def mark_dirty(self, user_id: int) -> None:
+        with self._lock:
+            self._dirty.add(user_id)
+
+    def take_dirty(self) -> Set[int]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return dirty
+
+    def symbols(self) -> List[str]:
+        with self._lock:
+            return list(self._holders)
+
+    def top(self, limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"rank": offset + i + 1, "userId": user_id, "equity": -negative_equity}
+                for i, (negative_equity, user_id) in enumerate(self._ranking.islice(offset, offset + limit))
+            ]
+
+    def rank(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            equity = self._equity.get(user_id)
+            if equity is None:
+                return None
+            return {
+                "rank": self._ranking.index((-equity, user_id)) + 1,
+                "userId": user_id,
+                "equity": equity,
+                "of": len(self._ranking),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self._ranking),
+                "symbols": len(self._holders),
+                "pricedSymbols": len(self._prices),
+                "pendingRefresh": len(self._dirty),
+                "pendingPrices": len(self._pending_prices),
+                "updates": self.updates,
+                "rebuilds": self.rebuilds,
+            }
@@ -1,55 +1,214 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import APIRouter, FastAPI, Header, HTTPException, Depends, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from typing import List
-import yfinance as yf
+from typing import Dict, Iterable, Optional
+import anyio
+import asyncio
 import models
+import migrations
 import schemas
 from database import SessionLocal, engine
-from datetime import datetime
+from db_engine import count_queries, pool_stats
+from quote_cache import QuoteCache
+from quote_providers import build_provider, parse_symbol_list, split_quote_results
+from portfolio_snapshots import portfolio_at
+from portfolio_valuation import value_positions
+from leaderboard import Leaderboard, load_holdings
+from order_book import OPEN_STATUSES, ORDER_TYPES, BookOrder, OrderBook
+from price_stream import PriceStreamHub, stream_router
+from trade_history import decode_cursor, trade_page, trade_totals
+from trade_journal import TradeLedger
+from app_logging import RequestLogMiddleware, configure_logging
+from http_cache import (
+    PRIVATE_REVALIDATE, PortfolioSymbols, cache_headers, etag_matches, make_etag, not_modified, quote_headers,
+)
+from metrics import MetricsMiddleware, metrics_response, pool_collector, registry
+import trading
+from trading import (
+    TradeRejected, close_empty_positions, execute_market_order, fill_order, fill_pending_order,
+    get_or_create_portfolio, load_portfolio, serialized, update_pending_order
+)
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 import os
 import logging
-import sys
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+import time
+
+# Importing this module sets nothing in motion: logging is configured and the
+# quote cache, journal, order book and the rest are built by create_app(), the
+# database is first touched when the app starts (lifespan) and its schema is
+# managed by migrations.py
 logger = logging.getLogger(__name__)
 
-# Create database tables
-logger.info("Initializing database...")
-models.Base.metadata.create_all(bind=engine)
-logger.info("Database initialization complete")
-
-# Create the FastAPI app
-app = FastAPI(title="Stock Market Simulator API")
-
-# CORS middleware configuration - allow all origins
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Most orders one POST /trades/batch may carry
+MAX_BATCH_ORDERS = int(os.getenv("MAX_BATCH_ORDERS", "100"))
+ORDER_POLL_INTERVAL = float(os.getenv("ORDER_POLL_INTERVAL", "5"))
+LEADERBOARD_REFRESH_INTERVAL = float(os.getenv("LEADERBOARD_REFRESH_INTERVAL", "1"))
+LEADERBOARD_PRICE_INTERVAL = float(os.getenv("LEADERBOARD_PRICE_INTERVAL", "30"))
+
+# Set by build_services(); the routes use the services of the app built last
+quote_provider = None
+quote_cache = None
+trade_ledger = None
+history_store = None
+bar_builder = None
+analytics = None
+portfolio_symbols = None
+price_hub = None
+order_book = None
+leaderboard = None
+_order_tasks = set()
+
+def build_services():
+    global quote_provider, quote_cache, trade_ledger, history_store, bar_builder, analytics
+    global portfolio_symbols, price_hub, order_book, leaderboard
+    # Both pull in numpy
+    from analytics import PortfolioAnalytics
+    from price_history import BarBuilder, PriceHistoryStore
+        
+    # Quote backend (QUOTE_PROVIDER, yfinance by default) behind a shared cache,
+    # every quote lookup in this module goes through the cache
+    quote_provider = build_provider(default="yfinance")
+    quote_cache = QuoteCache.from_env(quote_provider)
+
+    # Optional journaled trade mode (TRADE_JOURNAL_PATH): /trade is acknowledged
+    # after a group-committed journal fsync and reaches the database in bulk
+    trade_ledger = TradeLedger.from_env(SessionLocal)
+
+    # Local OHLCV history (PRICE_HISTORY_DIR), built from the quotes we fetch
+    history_store = PriceHistoryStore.from_env()
+    bar_builder = BarBuilder.from_env(history_store)
+    quote_cache.add_listener(bar_builder.on_quote)
+
+    # Per-portfolio performance analytics, refreshed from new trades on request
+    analytics = PortfolioAnalytics.from_env(history_store)
+
+    # ETags: a portfolio's come from its Portfolio.version (bumped by every
+    # write, whichever process made it) plus the quotes it was valued at, a
+    # quote's from the time it was fetched. Conditional quote requests are
+    # answered from memory, conditional portfolio requests with a single
+    # version lookup.
+    portfolio_symbols = PortfolioSymbols()
+
+    # Live price streaming (/ws/prices and /stream/prices), one ticker per symbol
+    price_hub = PriceStreamHub.from_env(quote_cache.get)
+
+    # Pending limit/stop orders, evaluated on every freshly fetched quote
+    order_book = OrderBook()
+    quote_cache.add_listener(on_quote)
+
+    # Equity leaderboard: traders are revalued after their trades commit, holders
+    # of a symbol with the quotes fetched since the last refresh
+    leaderboard = Leaderboard()
+    quote_cache.add_listener(lambda symbol, quote: leaderboard.on_price(symbol, quote["price"]))
 
-# Add request logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info(f"Request: {request.method} {request.url.path}")
+def wait_for_journal(user_id: int):
+    # Reads see journaled trades only once they are in the database
+    if trade_ledger:
+        try:
+            trade_ledger.wait_applied(user_id)
+        except TradeRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+def portfolio_etag(user_id: int, version: int, symbols: Iterable[str], quotes: Optional[Dict] = None) -> Optional[str]:
+    # None when a quote isn't cached any more (or was refetched after the
+    # portfolio was valued): there's nothing to compare without fetching it
+    stamps = []
+    for symbol in sorted(symbol.upper() for symbol in symbols):
+        entry = quote_cache.peek(symbol)
+        if entry is None or (quotes is not None and entry.quote is not quotes.get(symbol)):
+            return None
+        stamps.append((symbol, entry.fetched_at))
+    return make_etag("portfolio", user_id, version, stamps)
+
+def get_quote_sync(symbol: str):
+    # Sync handlers run in the threadpool, hop back onto the event loop so they
+    # share the cache and its in-flight fetches with the async handlers
+    return anyio.from_thread.run(quote_cache.get, symbol)
+
+def settle_orders(fills, triggered, price: float):
+    # Runs in the threadpool: record triggered stop-limits and fill crossed
+    # orders through the same accounting as /trade
+    db = SessionLocal()
     try:
-        response = await call_next(request)
-        logger.info(f"Response status: {response.status_code}")
-        return response
-    except Exception as e:
-        logger.error(f"Request error: {str(e)}")
-        raise
+        for order in triggered:
+            update_pending_order(db, order.id, "TRIGGERED")
+        for order in fills:
+            try:
+                if fill_pending_order(db, order.id, order.user_id, order.symbol, order.side, order.quantity, price):
+                    logger.info(f"Filled order {order.id}: {order.side} {order.quantity} {order.symbol} @ {price}")
+            except TradeRejected as e:
+                update_pending_order(db, order.id, "REJECTED", e.detail)
+                logger.info(f"Rejected order {order.id}: {e.detail}")
+    finally:
+        db.close()
+
+def on_quote(symbol: str, quote):
+    fills, triggered = order_book.on_price(symbol, quote["price"])
+    if fills or triggered:
+        task = asyncio.ensure_future(run_in_threadpool(settle_orders, fills, triggered, quote["price"]))
+        _order_tasks.add(task)
+        task.add_done_callback(_order_tasks.discard)
+
+def load_open_orders():
+    db = SessionLocal()
+    try:
+        rows = db.query(models.Order).filter(models.Order.status.in_(OPEN_STATUSES)).all()
+        return order_book.load(BookOrder.from_row(row) for row in rows)
+    finally:
+        db.close()
+
+async def watch_open_orders():
+    # Keep quotes flowing for symbols with open orders even when nobody polls them
+    while True:
+        await asyncio.sleep(ORDER_POLL_INTERVAL)
+        symbols = order_book.symbols()
+        if symbols:
+            await quote_cache.get_many(symbols)
+
+def load_leaderboard_holdings(user_ids=None):
+    db = SessionLocal()
+    try:
+        return load_holdings(db, user_ids)
+    finally:
+        db.close()
+
+async def refresh_leaderboard_prices():
+    quotes = await quote_cache.get_many(leaderboard.symbols())
+    leaderboard.set_prices({
+        symbol: quote["price"] for symbol, quote in quotes.items() if not isinstance(quote, Exception)
+    })
+
+async def maintain_leaderboard():
+    leaderboard.set_holdings(await run_in_threadpool(load_leaderboard_holdings))
+    await refresh_leaderboard_prices()
+    prices_refreshed = time.monotonic()
+    while True:
+        await asyncio.sleep(LEADERBOARD_REFRESH_INTERVAL)
+        try:
+            dirty = leaderboard.take_dirty()
+            if dirty:
+                leaderboard.set_holdings(await run_in_threadpool(load_leaderboard_holdings, dirty))
+            # Reranking many holders takes a while, keep it off the event loop
+            await run_in_threadpool(leaderboard.apply_prices)
+            if time.monotonic() - prices_refreshed >= LEADERBOARD_PRICE_INTERVAL:
+                await refresh_leaderboard_prices()
+                prices_refreshed = time.monotonic()
+        except Exception as e:
+            logger.error(f"Leaderboard refresh failed: {str(e)}")
+
+def quote_cache_metrics():
+    stats = quote_cache.stats()
+    return [
+        ("quote_cache_lookups_total", "counter", "Quote cache lookups by outcome", [
+            ("quote_cache_lookups_total", {"outcome": outcome}, stats[outcome])
+            for outcome in ("hits", "misses", "coalesced")
+        ]),
+        ("quote_cache_entries", "gauge", "Quotes held in the cache", [("quote_cache_entries", {}, stats["size"])]),
+    ]
 
 # Dependency to get database session
 def get_db():
@@ -59,161 +218,464 @@ def get_db():
     finally:
         db.close()
 
-@app.get("/")
+# Every route below; create_app() mounts them on a new app
+router = APIRouter()
+
+@router.get("/")
 def read_root():
     logger.info("Root endpoint called")
     return {"message": "Welcome to Stock Market Simulator API"}
 
-@app.get("/stock/{symbol}")
-async def get_stock_price(symbol: str):
-    logger.info(f"Fetching stock data for symbol: {symbol}")
+@router.get("/stock/{symbol}", response_model=schemas.StockPrice)
+async def get_stock_price(symbol: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    cached = quote_cache.peek(symbol)
+    if cached and if_none_match:
+        headers = quote_headers(symbol, cached, quote_cache.clock())
+        if etag_matches(if_none_match, headers["ETag"]):
+            return not_modified(headers)
     try:
-        stock = yf.Ticker(symbol)
-        info = stock.info
-        if not info or "regularMarketPrice" not in info:
-            logger.error(f"Could not fetch data for {symbol}")
-            raise HTTPException(status_code=404, detail=f"Stock {symbol} not found or no data available")
-        
-        result = {
-            "symbol": symbol.upper(),
-            "name": info.get("longName", symbol.upper()),
-            "price": info.get("regularMarketPrice", 0),
-            "change": info.get("regularMarketChange", 0),
-            "changePercent": info.get("regularMarketChangePercent", 0)
-        }
-        logger.info(f"Successfully fetched data for {symbol}: {result}")
+        result = await quote_cache.get(symbol)
+        logger.debug("Fetched stock data for %s: %s", symbol, result)
+        entry = quote_cache.peek(symbol)
+        if entry is not None and entry.quote is result:
+            response.headers.update(quote_headers(symbol, entry, quote_cache.clock()))
         return result
     except Exception as e:
         logger.error(f"Error fetching stock {symbol}: {str(e)}")
         raise HTTPException(status_code=404, detail=f"Stock {symbol} not found: {str(e)}")
 
-@app.get("/my-portfolio/{user_id}")
-def get_my_portfolio(user_id: int, db: Session = Depends(get_db)):
-    portfolio = db.query(models.Portfolio).filter(models.Portfolio.user_id == user_id).first()
-    if not portfolio:
-        portfolio = models.Portfolio(user_id=user_id, cash=10000.00)
-        db.add(portfolio)
-        db.commit()
-        db.refresh(portfolio)
-    
-    positions = []
-    for position in portfolio.positions:
-        if position.quantity > 0:
-            try:
-                stock = yf.Ticker(position.symbol)
-                current_price = stock.info.get("regularMarketPrice", 0)
-                total_value = current_price * position.quantity
-                profit_loss = ((current_price - position.average_price) / position.average_price) * 100
-                
-                positions.append({
-                    "symbol": position.symbol,
-                    "quantity": position.quantity,
-                    "averagePrice": position.average_price,
-                    "currentPrice": current_price,
-                    "totalValue": total_value,
-                    "profitLoss": profit_loss
-                })
-            except Exception as e:
-                print(f"Error fetching data for {position.symbol}: {e}")
-    
-    return {
+@router.get("/stock/{symbol}/history")
+def get_stock_history(
+    symbol: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(500, ge=1, le=10000)
+):
+    # Columnar bars, the latest ``limit`` in [start, end). Timestamps are epoch
+    # seconds (UTC when start/end carry no timezone).
+    symbol = symbol.upper()
+    try:
+        bars = history_store.bars(
+            symbol,
+            start=int(start.replace(tzinfo=start.tzinfo or timezone.utc).timestamp()) if start else None,
+            end=int(end.replace(tzinfo=end.tzinfo or timezone.utc).timestamp()) if end else None,
+            limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"symbol": symbol, "count": len(bars["timestamp"]), **{name: column.tolist() for name, column in bars.items()}}
+
+@router.get("/stocks", response_model=schemas.BatchQuoteResponse)
+async def get_stock_prices(symbols: str):
+    # Batch quotes: ?symbols=AAPL,MSFT,... (up to MAX_QUOTE_BATCH)
+    try:
+        requested = parse_symbol_list(symbols)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.debug("Fetching stock data for %d symbols", len(requested))
+    return split_quote_results(await quote_cache.get_many(requested))
+
+@router.get("/quote-cache/stats")
+def get_quote_cache_stats():
+    return quote_cache.stats()
+
+@router.get("/trade-journal/stats")
+def get_trade_journal_stats():
+    if not trade_ledger:
+        return {"enabled": False}
+    return {"enabled": True, **trade_ledger.stats()}
+
+@router.get("/db-pool/stats")
+def get_db_pool_stats():
+    return pool_stats(engine)
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # Prometheus text format
+    return metrics_response()
+
+@router.get("/my-portfolio/{user_id}", response_model=schemas.PortfolioResponse, response_model_exclude_none=True)
+def get_my_portfolio(
+    user_id: int,
+    response: Response,
+    debug: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    wait_for_journal(user_id)
+    if if_none_match and not debug:
+        version = db.query(models.Portfolio.version).filter(models.Portfolio.user_id == user_id).scalar()
+        symbols = portfolio_symbols.get(user_id, version) if version is not None else None
+        etag = portfolio_etag(user_id, version, symbols) if symbols is not None else None
+        if etag and etag_matches(if_none_match, etag):
+            return not_modified(cache_headers(etag, PRIVATE_REVALIDATE))
+
+    with count_queries() as queries:
+        portfolio = get_or_create_portfolio(db, user_id)
+        held = [position for position in portfolio.positions if position.quantity > 0]
+
+    # Fetch every distinct symbol in one concurrent batch, then value them all
+    fetch_started = time.perf_counter()
+    quotes = anyio.from_thread.run(quote_cache.get_many, [position.symbol for position in held])
+    fetch_finished = time.perf_counter()
+    for symbol, quote in quotes.items():
+        if isinstance(quote, Exception):
+            logger.warning(f"Error fetching data for {symbol}: {quote}")
+    positions = value_positions(held, quotes)
+    compute_finished = time.perf_counter()
+
+    if not debug:
+        portfolio_symbols.remember(user_id, portfolio.version, quotes)
+        etag = portfolio_etag(user_id, portfolio.version, quotes, quotes)
+        if etag:
+            response.headers.update(cache_headers(etag, PRIVATE_REVALIDATE))
+
+    result = {
         "cash": portfolio.cash,
         "positions": positions
     }
+    if debug:
+        result["timings"] = {
+            "fetchMs": round((fetch_finished - fetch_started) * 1000, 3),
+            "computeMs": round((compute_finished - fetch_finished) * 1000, 3),
+            "symbols": len(quotes),
+            "queries": queries.count
+        }
+    return result
 
-@app.get("/trade-history/{user_id}")
-def get_trade_history(user_id: int, db: Session = Depends(get_db)):
+@router.get("/trade-history/{user_id}", response_model=schemas.TradeHistoryPage)
+def get_trade_history(
+    user_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    symbol: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    # Newest first, one page at a time. Pass nextCursor back as ?cursor= for
+    # the next page; totals cover the whole filtered history and are only
+    # computed for the first page.
     logger.info(f"Fetching trade history for user: {user_id}")
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    wait_for_journal(user_id)
     try:
-        portfolio = db.query(models.Portfolio).filter(models.Portfolio.user_id == user_id).first()
-        if not portfolio:
-            logger.warning(f"Portfolio not found for user {user_id}")
-            # Create a new portfolio instead of failing
-            portfolio = models.Portfolio(user_id=user_id, cash=10000.00)
-            db.add(portfolio)
-            db.commit()
-            db.refresh(portfolio)
-            logger.info(f"Created new portfolio for user {user_id}")
-            return []
-        
-        trades = db.query(models.Trade).filter(models.Trade.portfolio_id == portfolio.id).order_by(models.Trade.timestamp.desc()).all()
+        # Create a new portfolio instead of failing
+        portfolio = get_or_create_portfolio(db, user_id, with_positions=False)
         
-        result = [
-            {
-                "id": trade.id,
-                "symbol": trade.symbol,
-                "action": trade.trade_type.lower(),
-                "quantity": trade.quantity,
-                "price": trade.price,
-                "total": trade.price * trade.quantity,
-                "timestamp": trade.timestamp.isoformat()
-            }
-            for trade in trades
-        ]
-        logger.info(f"Retrieved {len(result)} trades for user {user_id}")
-        return result
+        trades, next_cursor = trade_page(db, portfolio.id, limit, cursor, symbol, start, end)
+        result = {
+            "trades": trades,
+            "nextCursor": next_cursor,
+            "totals": None if cursor else trade_totals(db, portfolio.id, symbol, start, end)
+        }
+        logger.info(f"Retrieved {len(trades)} trades for user {user_id}")
+        # Pages run to 500 rows: hand the rows (already shaped like
+        # TradeHistoryPage) straight to orjson rather than validating a copy
+        return ORJSONResponse(result)
     except Exception as e:
         logger.error(f"Error getting trade history: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get trade history: {str(e)}")
 
-@app.post("/trade")
-def execute_trade(trade: schemas.TradeRequest, db: Session = Depends(get_db)):
-    portfolio = db.query(models.Portfolio).filter(models.Portfolio.user_id == trade.user_id).first()
+@router.get("/portfolio-at/{user_id}")
+def get_portfolio_at(user_id: int, at: datetime, db: Session = Depends(get_db)):
+    # Cash and holdings as of a past moment, rebuilt from the nearest
+    # checkpoint plus the trades after it
+    wait_for_journal(user_id)
+    portfolio = load_portfolio(db, user_id, with_positions=False)
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
+    state = portfolio_at(db, portfolio.id, at)
+    return {
+        "at": at.isoformat(),
+        "cash": state["cash"],
+        "positions": [
+            {"symbol": symbol, "quantity": quantity, "averagePrice": average_price}
+            for symbol, (quantity, average_price) in sorted(state["positions"].items())
+        ],
+        "tradeCount": state["tradeCount"],
+        "replayed": state["replayed"]
+    }
+
+@router.get("/portfolio-analytics/{user_id}")
+def get_portfolio_analytics(user_id: int, series: bool = True, db: Session = Depends(get_db)):
+    # Equity curve, realized/unrealized P&L, risk metrics and per-symbol
+    # attribution. Cached per portfolio; new trades are read when the
+    # portfolio's trade_count has moved, whichever process wrote them.
+    wait_for_journal(user_id)
+    portfolio = load_portfolio(db, user_id, with_positions=False)
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+
+    def quote_prices(symbols):
+        quotes = anyio.from_thread.run(quote_cache.get_many, symbols)
+        prices = {}
+        for symbol, quote in quotes.items():
+            if isinstance(quote, Exception):
+                logger.warning(f"Error fetching data for {symbol}: {quote}")
+            else:
+                prices[symbol] = quote["price"]
+        return prices
+
+    return analytics.report(db, user_id, portfolio.id, portfolio.trade_count, quote_prices, series)
+
+@router.get("/analytics-cache/stats")
+def get_portfolio_analytics_stats():
+    return analytics.stats()
+
+@router.post("/trade", response_model=schemas.TradeResponse)
+def execute_trade(trade: schemas.TradeRequest, db: Session = Depends(get_db)):
+    symbol = trade.symbol.upper()
+    try:
+        current_price = get_quote_sync(symbol)["price"]
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     
-    stock = yf.Ticker(trade.symbol)
-    current_price = stock.info.get("regularMarketPrice", 0)
-    
-    total_cost = current_price * trade.quantity
-    
-    # Get or create position
-    position = db.query(models.Position).filter(
-        models.Position.portfolio_id == portfolio.id,
-        models.Position.symbol == trade.symbol
-    ).first()
-    
-    if trade.action == "buy":
-        if portfolio.cash < total_cost:
-            raise HTTPException(status_code=400, detail="Insufficient funds")
-        
-        portfolio.cash -= total_cost
-        
-        if position:
-            # Update existing position
-            new_total = (position.average_price * position.quantity) + (current_price * trade.quantity)
-            position.quantity += trade.quantity
-            position.average_price = new_total / position.quantity
+    # Serialized per portfolio, trades on other accounts run in parallel
+    try:
+        if trade_ledger:
+            new_balance = trade_ledger.execute(trade.user_id, symbol, trade.action, trade.quantity, current_price)
         else:
-            # Create new position
-            position = models.Position(
-                portfolio_id=portfolio.id,
-                symbol=trade.symbol,
-                quantity=trade.quantity,
-                average_price=current_price
-            )
-            db.add(position)
-            
-    else:  # sell
-        if not position or position.quantity < trade.quantity:
-            raise HTTPException(status_code=400, detail="Insufficient shares")
-        
-        portfolio.cash += total_cost
-        position.quantity -= trade.quantity
-        
-        if position.quantity == 0:
-            db.delete(position)
-    
-    # Record the trade
-    trade_record = models.Trade(
+            new_balance = execute_market_order(db, trade.user_id, symbol, trade.action, trade.quantity, current_price)
+    except TradeRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {"message": "Trade executed successfully", "new_balance": new_balance}
+
+@router.post("/trades/batch")
+def execute_trade_batch(batch: schemas.BatchTradeRequest, db: Session = Depends(get_db)):
+    # Many orders for one user in a single transaction. "atomic" applies all
+    # of them or none, "best_effort" skips the ones that can't be filled.
+    if batch.mode not in ("atomic", "best_effort"):
+        raise HTTPException(status_code=400, detail="mode must be 'atomic' or 'best_effort'")
+    if not batch.orders:
+        raise HTTPException(status_code=400, detail="No orders given")
+    if len(batch.orders) > MAX_BATCH_ORDERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ORDERS} orders per batch")
+
+    # One concurrent fetch for every symbol in the batch
+    quotes = anyio.from_thread.run(quote_cache.get_many, [order.symbol for order in batch.orders], False)
+
+    def work():
+        portfolio = load_portfolio(db, batch.user_id, for_update=True)
+        if not portfolio:
+            raise TradeRejected("Portfolio not found", status_code=404)
+        positions = {position.symbol: position for position in portfolio.positions}
+        timestamp = datetime.utcnow()
+        trade_rows = []
+        results = []
+        for index, order in enumerate(batch.orders):
+            symbol = order.symbol.upper()
+            result = {"index": index, "symbol": symbol, "action": order.action, "quantity": order.quantity}
+            quote = quotes[symbol]
+            try:
+                if isinstance(quote, Exception):
+                    raise TradeRejected(str(quote), status_code=404)
+                # Validated against the running cash and share totals of the batch
+                trade_rows.append(fill_order(db, portfolio, positions, symbol, order.action, order.quantity, quote["price"], timestamp))
+                result.update(status="filled", price=quote["price"], total=quote["price"] * order.quantity)
+            except TradeRejected as e:
+                result.update(status="rejected", detail=e.detail)
+            results.append(result)
+
+        rejected = sum(1 for result in results if result["status"] == "rejected")
+        if rejected and batch.mode == "atomic":
+            for result in results:
+                if result["status"] == "filled":
+                    result["status"] = "not_executed"
+            raise HTTPException(status_code=400, detail={
+                "message": f"{rejected} of {len(results)} orders rejected, nothing was executed",
+                "results": results
+            })
+
+        close_empty_positions(db, positions)
+        if trade_rows:
+            db.execute(insert(models.Trade), trade_rows)
+        return portfolio.cash, len(trade_rows), rejected, results
+
+    try:
+        new_balance, filled, rejected, results = serialized(db, batch.user_id, work)
+    except TradeRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except HTTPException:
+        db.rollback()
+        raise
+    logger.info(f"Batch for user {batch.user_id}: {filled} filled, {rejected} rejected")
+    return {
+        "message": "Batch executed",
+        "filled": filled,
+        "rejected": rejected,
+        "new_balance": new_balance,
+        "results": results
+    }
+
+def order_to_dict(order: models.Order):
+    return {
+        "id": order.id,
+        "symbol": order.symbol,
+        "action": order.side.lower(),
+        "orderType": order.order_type.lower(),
+        "quantity": order.quantity,
+        "limitPrice": order.limit_price,
+        "stopPrice": order.stop_price,
+        "status": order.status.lower(),
+        "detail": order.detail,
+        "fillPrice": order.fill_price,
+        "createdAt": order.created_at.isoformat(),
+        "filledAt": order.filled_at.isoformat() if order.filled_at else None
+    }
+
+@router.post("/orders")
+def place_order(request: schemas.OrderRequest, db: Session = Depends(get_db)):
+    # Limit, stop and stop-limit orders wait in the order book until the price
+    # crosses them, then fill at the market price through the /trade accounting
+    order_type = request.order_type.upper()
+    if order_type not in ORDER_TYPES:
+        raise HTTPException(status_code=400, detail=f"order_type must be one of {', '.join(t.lower() for t in ORDER_TYPES)}")
+    if request.action not in ("buy", "sell"):
+        raise HTTPException(status_code=400, detail="action must be 'buy' or 'sell'")
+    if request.quantity <= 0:
+        raise HTTPException(status_code=400, detail="quantity must be positive")
+    if order_type in ("LIMIT", "STOP_LIMIT") and request.limit_price is None:
+        raise HTTPException(status_code=400, detail=f"{order_type.lower()} orders need a limit_price")
+    if order_type in ("STOP", "STOP_LIMIT") and request.stop_price is None:
+        raise HTTPException(status_code=400, detail=f"{order_type.lower()} orders need a stop_price")
+
+    portfolio = load_portfolio(db, request.user_id, with_positions=False)
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+
+    order = models.Order(
         portfolio_id=portfolio.id,
-        symbol=trade.symbol,
-        trade_type=trade.action.upper(),
-        quantity=trade.quantity,
-        price=current_price,
-        timestamp=datetime.utcnow()
+        user_id=request.user_id,
+        symbol=request.symbol.upper(),
+        side=request.action.upper(),
+        order_type=order_type,
+        quantity=request.quantity,
+        limit_price=request.limit_price if order_type != "STOP" else None,
+        stop_price=request.stop_price if order_type != "LIMIT" else None,
+        status="OPEN"
     )
-    db.add(trade_record)
-    
+    db.add(order)
     db.commit()
-    return {"message": "Trade executed successfully", "new_balance": portfolio.cash} 
\ No newline at end of file
+    db.refresh(order)
+    order_book.add(BookOrder.from_row(order))
+    logger.info(f"Placed order {order.id}: {order.order_type} {order.side} {order.quantity} {order.symbol}")
+
+    # Already marketable at the current cached price? Don't wait for the next quote.
+    cached = quote_cache.peek(order.symbol)
+    if cached:
+        fills, triggered = order_book.on_price(order.symbol, cached.quote["price"])
+        if fills or triggered:
+            settle_orders(fills, triggered, cached.quote["price"])
+            db.refresh(order)
+    return order_to_dict(order)
+
+@router.get("/orders/{user_id}")
+def get_orders(user_id: int, open_only: bool = True, limit: int = Query(100, ge=1, le=500), db: Session = Depends(get_db)):
+    query = db.query(models.Order).filter(models.Order.user_id == user_id)
+    if open_only:
+        query = query.filter(models.Order.status.in_(OPEN_STATUSES))
+    orders = query.order_by(models.Order.id.desc()).limit(limit).all()
+    return [order_to_dict(order) for order in orders]
+
+@router.delete("/orders/{order_id}")
+def cancel_order(order_id: int, db: Session = Depends(get_db)):
+    if not update_pending_order(db, order_id, "CANCELLED"):
+        raise HTTPException(status_code=404, detail="No open order with that id")
+    order_book.cancel(order_id)
+    return {"message": "Order cancelled", "id": order_id}
+
+@router.get("/order-book/stats")
+def get_order_book_stats():
+    return order_book.stats()
+
+@router.get("/leaderboard")
+def get_leaderboard(limit: int = Query(10, ge=1, le=100), offset: int = Query(0, ge=0)):
+    return {"leaders": leaderboard.top(limit, offset), **leaderboard.stats()}
+
+@router.get("/leaderboard/{user_id}")
+def get_leaderboard_rank(user_id: int):
+    rank = leaderboard.rank(user_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="User is not on the leaderboard")
+    return rank
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything that needs the database, the journal file or background tasks,
+    # plus the hooks into trading and metrics, which are undone on the way out
+    listeners = [leaderboard.mark_dirty]
+    collectors = [pool_collector(engine), quote_cache_metrics]
+    trading.portfolio_listeners.extend(listeners)
+    for collector in collectors:
+        registry.add_collector(collector)
+    if trade_ledger:
+        trading.write_barrier = trade_ledger.wait_applied
+    try:
+        await run_in_threadpool(migrations.ensure_schema, engine)
+        if trade_ledger:
+            replayed = await run_in_threadpool(trade_ledger.start)
+            logger.info(f"Trade journal ready, replayed {replayed} trades")
+        count = await run_in_threadpool(load_open_orders)
+        logger.info(f"Loaded {count} open orders into the order book")
+        order_watcher = asyncio.ensure_future(watch_open_orders())
+        leaderboard_task = asyncio.ensure_future(maintain_leaderboard())
+        try:
+            yield
+        finally:
+            await price_hub.close()
+            order_watcher.cancel()
+            leaderboard_task.cancel()
+            if trade_ledger:
+                await run_in_threadpool(trade_ledger.close)
+            await run_in_threadpool(bar_builder.close)
+    finally:
+        for listener in listeners:
+            trading.portfolio_listeners.remove(listener)
+        for collector in collectors:
+            registry.remove_collector(collector)
+        trading.write_barrier = None
+
+def create_app() -> FastAPI:
+    """Build the API. Configures logging (JSON lines written from a background
+    thread, level per APP_ENV / LOG_LEVEL, see app_logging) and builds the
+    services behind the routes (build_services), but leaves the database alone
+    until a server starts the app. One app per process: a second create_app()
+    replaces the first one's services.
+
+    Responses are written with orjson; hot routes also declare a
+    response_model so FastAPI serializes them with pydantic instead of walking
+    plain dicts with jsonable_encoder.
+    """
+    configure_logging(default_level="DEBUG")
+    build_services()
+    app = FastAPI(title="Stock Market Simulator API", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+    # CORS middleware configuration - allow all origins
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Request ids and one access log line per request (sampled per LOG_SAMPLE_RATES)
+    app.add_middleware(RequestLogMiddleware)
+    # Per-route latency and DB time for /metrics
+    app.add_middleware(MetricsMiddleware)
+
+    app.include_router(stream_router(price_hub))
+    app.include_router(router)
+    return app
+
+def __getattr__(name: str):
+    # `main.app` (uvicorn main:app) is built on first use, not on import;
+    # `uvicorn --factory main:create_app` works too
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,228 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Volatility and drift are annual; a year is this many seconds of trading
+TRADING_YEAR_SECONDS = 252 * 6.5 * 3600
+
+# Ticks generated per NumPy pass when catching up a long way
+CHUNK_TICKS = 65536
+
+# Longer wall-clock gaps (an idle server) are crossed in one closed-form step
+MAX_CATCH_UP_TICKS = 1000
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer: consecutive inputs give independent-looking outputs
+    x = x + _GOLDEN
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _uniform(x: np.ndarray) -> np.ndarray:
+    # (0, 1]
+    return ((x >> np.uint64(11)) + np.uint64(1)) * (1.0 / 2 ** 53)
+
+
+def _normals(keys: np.ndarray, start: int, stop: int) -> np.ndarray:
+    # Standard normal shock for every (tick in [start, stop), key), computed
+    # from the key and tick alone (Box-Muller on two hashed counters)
+    with np.errstate(over="ignore"):
+        counters = keys[None, :] + (np.arange(start, stop, dtype=np.uint64) * np.uint64(2))[:, None]
+        radius = np.sqrt(-2.0 * np.log(_uniform(_mix(counters))))
+        angle = 2.0 * np.pi * _uniform(_mix(counters + np.uint64(1)))
+    return radius * np.cos(angle)
+
+
+def _key(seed: int, name: str) -> np.uint64:
+    digest = hashlib.blake2b(f"{seed}:{name}".encode(), digest_size=8).digest()
+    return np.uint64(int.from_bytes(digest, "little"))
+
+
+class MarketSimulator:
+    """Seeded geometric Brownian motion for every symbol at once.
+
+    Each tick moves every log price by the drift plus volatility times a
+    shock, and the shock mixes a market-wide factor with the symbol's own
+    noise so any two symbols are ``correlation``-correlated. Shocks are a pure
+    function of (seed, symbol, tick), so with ``speed=0`` and advance() the
+    same seed replays the same paths, and path() always does.
+
+    A symbol first asked for late starts at the current tick from its base
+    price, rather than replaying every tick since startup. Simulated time runs
+    ``speed`` times as fast as the wall clock, one tick per ``tick_seconds``
+    of it. A clock gap longer than MAX_CATCH_UP_TICKS is crossed in one step:
+    the sum of that many shocks is itself normal, so one draw stands in for
+    all of them.
+    """
+
+    def __init__(
+        self,
+        table: Optional[Dict[str, Dict[str, Any]]] = None,
+        seed: int = 0,
+        volatility: float = 0.3,
+        drift: float = 0.0,
+        correlation: float = 0.3,
+        tick_seconds: float = 1.0,
+        speed: float = 1.0,
+        clock=time.monotonic,
+    ):
+        if not 0.0 <= correlation <= 1.0:
+            raise ValueError("correlation must be between 0 and 1")
+        if tick_seconds <= 0:
+            raise ValueError("tick_seconds must be positive")
+        self.table = table or {}
+        self.seed = seed
+        self.volatility = volatility
+        self.drift = drift
+        self.correlation = correlation
+        self.tick_seconds = tick_seconds
+        self.speed = speed
+        self.clock = clock
+        dt = tick_seconds / TRADING_YEAR_SECONDS
+        self._log_drift = (drift - volatility ** 2 / 2) * dt
+        self._scale = volatility * np.sqrt(dt)
+        self._market_key = np.array([_key(seed, ":market")])
+        self._started = clock()
+        self.tick = 0
+        self._index: Dict[str, int] = {}
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._base = np.empty(0)
+        # Tick each symbol was added at, its price is _base there
+        self._origin = np.empty(0, dtype=np.int64)
+        # Sum of each symbol's shocks since then
+        self._walk = np.empty(0)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, table: Optional[Dict[str, Dict[str, Any]]] = None) -> "MarketSimulator":
+        return cls(
+            table,
+            seed=int(os.getenv("MARKET_SEED", "0")),
+            volatility=float(os.getenv("MARKET_VOLATILITY", "0.3")),
+            drift=float(os.getenv("MARKET_DRIFT", "0")),
+            correlation=float(os.getenv("MARKET_CORRELATION", "0.3")),
+            tick_seconds=float(os.getenv("MARKET_TICK_SECONDS", "1")),
+            speed=float(os.getenv("MARKET_SPEED", "1")),
+        )
+
+    def _shocks(self, keys: np.ndarray, start: int, stop: int, market_key: Optional[np.ndarray] = None) -> np.ndarray:
+        if not self.correlation:
+            return _normals(keys, start, stop)
+        market_key = self._market_key if market_key is None else market_key
+        shocks = _normals(np.concatenate((market_key, keys)), start, stop)
+        return np.sqrt(self.correlation) * shocks[:, :1] + np.sqrt(1 - self.correlation) * shocks[:, 1:]
+
+    def _walk_to(self, keys: np.ndarray, walk: np.ndarray, start: int, stop: int) -> np.ndarray:
+        # Walks at ``stop`` from walks at ``start``, summed tick by tick so the
+        # result doesn't depend on how the ticks were split up
+        for a in range(start, stop, CHUNK_TICKS):
+            b = min(a + CHUNK_TICKS, stop)
+            walk = np.cumsum(np.vstack([walk, self._shocks(keys, a, b)]), axis=0)[-1]
+        return walk
+
+    def _base_price(self, symbol: str, key: np.uint64) -> float:
+        if symbol in self.table:
+            return float(self.table[symbol]["price"])
+        # Unknown tickers get a stable made-up price between 50 and 500
+        with np.errstate(over="ignore"):
+            return round(50 + 450 * float(_uniform(_mix(np.array([key]) ^ _GOLDEN))[0]), 2)
+
+    def _add(self, symbols: Iterable[str]) -> None:
+        new = [s for s in dict.fromkeys(symbols) if s not in self._index]
+        if not new:
+            return
+        keys = np.array([_key(self.seed, s) for s in new], dtype=np.uint64)
+        for symbol in new:
+            self._index[symbol] = len(self._index)
+        self._keys = np.concatenate((self._keys, keys))
+        self._base = np.concatenate((self._base, [self._base_price(s, k) for s, k in zip(new, keys)]))
+        self._origin = np.concatenate((self._origin, np.full(len(new), self.tick, dtype=np.int64)))
+        self._walk = np.concatenate((self._walk, np.zeros(len(new))))
+
+    def _sync(self) -> None:
+        if self.speed:
+            due = int((self.clock() - self._started) * self.speed / self.tick_seconds)
+            if due - self.tick > MAX_CATCH_UP_TICKS:
+                self._leap(due - self.tick)
+            elif due > self.tick:
+                self._advance(due - self.tick)
+
+    def _advance(self, ticks: int) -> None:
+        self._walk = self._walk_to(self._keys, self._walk, self.tick, self.tick + ticks)
+        self.tick += ticks
+
+    def _leap(self, ticks: int) -> None:
+        # ``ticks`` shocks summed have the distribution of one shock times
+        # sqrt(ticks); drawn from rehashed keys so they differ from tick shocks
+        with np.errstate(over="ignore"):
+            keys, market_key = _mix(self._keys), _mix(self._market_key)
+        shock = self._shocks(keys, self.tick, self.tick + 1, market_key)[0]
+        self._walk = self._walk + np.sqrt(ticks) * shock
+        self.tick += ticks
+
+    def advance(self, ticks: int = 1) -> int:
+        # Step every symbol forward ``ticks`` ticks; returns the new tick.
+        # Like a clock gap, more than MAX_CATCH_UP_TICKS is one leap.
+        with self._lock:
+            if ticks > MAX_CATCH_UP_TICKS:
+                self._leap(ticks)
+            else:
+                self._advance(ticks)
+            return self.tick
+
+    def _prices(self, rows: np.ndarray) -> np.ndarray:
+        ticks = self.tick - self._origin[rows]
+        return self._base[rows] * np.exp(self._log_drift * ticks + self._scale * self._walk[rows])
+
+    def quotes(self, symbols: Iterable[str]) -> Dict[str, Tuple[float, float]]:
+        # {symbol: (price, change since the symbol was first quoted)}, rounded to cents
+        symbols = list(dict.fromkeys(s.upper() for s in symbols))
+        with self._lock:
+            self._sync()
+            self._add(symbols)
+            rows = np.array([self._index[s] for s in symbols], dtype=np.intp)
+            prices = self._prices(rows)
+            base = self._base[rows]
+        return {
+            symbol: (round(float(price), 2), round(float(price - start), 2))
+            for symbol, price, start in zip(symbols, prices, base)
+        }
+
+    def quote(self, symbol: str) -> Tuple[float, float]:
+        return self.quotes([symbol])[symbol.upper()]
+
+    def path(self, symbols: List[str], start: int, stop: int) -> np.ndarray:
+        # Prices at ticks [start, stop) as a (ticks, symbols) array, without
+        # touching the live market. The same seed always gives the same path.
+        symbols = [s.upper() for s in symbols]
+        keys = np.array([_key(self.seed, s) for s in symbols], dtype=np.uint64)
+        base = np.array([self._base_price(s, k) for s, k in zip(symbols, keys)])
+        walk = self._walk_to(keys, np.zeros(len(symbols)), 0, start)
+        walks = [walk[None, :]]
+        for a in range(start, stop - 1, CHUNK_TICKS):
+            b = min(a + CHUNK_TICKS, stop - 1)
+            steps = np.cumsum(np.vstack([walks[-1][-1:], self._shocks(keys, a, b)]), axis=0)[1:]
+            walks.append(steps)
+        walk = np.concatenate(walks)[: max(stop - start, 0)]
+        ticks = np.arange(start, start + len(walk))[:, None]
+        return base * np.exp(self._log_drift * ticks + self._scale * walk)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "seed": self.seed,
+                "tick": self.tick,
+                "symbols": len(self._index),
+                "tickSeconds": self.tick_seconds,
+                "speed": self.speed,
+                "volatility": self.volatility,
+                "correlation": self.correlation,
+            }
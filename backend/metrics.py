@@ -0,0 +1,269 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi.responses import PlainTextResponse
+
+from db_engine import WAIT_BUCKETS, pool_stats, time_queries
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LabelValues = Tuple[str, ...]
+# (sample name, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+# (name, type, help, samples), what collectors return
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _sample_line(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        return f"{name}{{{rendered}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def histogram_samples(
+    name: str, labels: Dict[str, str], bounds: Sequence[float], counts: Sequence[int], total: float
+) -> List[Sample]:
+    # Per-bucket counts (the last one past every bound) to cumulative samples
+    samples: List[Sample] = []
+    running = 0
+    for bound, count in zip(list(bounds) + [float("inf")], counts):
+        running += count
+        samples.append((f"{name}_bucket", {**labels, "le": _format_value(bound)}, running))
+    samples.append((f"{name}_sum", labels, total))
+    samples.append((f"{name}_count", labels, running))
+    return samples
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _labels(self, values: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.label_names, values))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    # Name it with the _total suffix, the text format has no separate family name
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._labels(labels), value) for labels, value in values]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def add(self, amount: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._labels(labels), value) for labels, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.bounds = tuple(sorted(buckets))
+        # label values -> [per-bucket counts, sum]
+        self._series: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.bounds) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        samples: List[Sample] = []
+        for labels, counts, total in series:
+            samples.extend(histogram_samples(self.name, self._labels(labels), self.bounds, counts, total))
+        return samples
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms kept in process, plus collectors that
+    report values owned elsewhere (pool stats, cache stats) when scraped.
+    render() gives the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        # Asking for a metric again (a module imported by two apps) returns the first one
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(
+        self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.remove(collector)
+
+    def render(self) -> str:
+        families: List[Family] = [
+            (metric.name, metric.kind, metric.help, metric.samples()) for metric in list(self._metrics.values())
+        ]
+        for collector in list(self._collectors):
+            families.extend(collector())
+        lines = []
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {_escape(help)}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(_sample_line(*sample) for sample in samples)
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry the app modules and /metrics share
+registry = MetricsRegistry()
+
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Time to handle a request, by route template", ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = registry.gauge("http_requests_in_flight", "Requests being handled right now")
+DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "Database statements run per request", ("route",), QUERY_COUNT_BUCKETS
+)
+DB_TIME = registry.histogram(
+    "http_request_db_seconds", "Time spent executing database statements per request", ("route",)
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording every request's latency, statement count and
+    database time by route template, and the in-flight request gauge.
+
+    Unmatched paths share one "unmatched" route so stray URLs can't blow up
+    the number of series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.add(1)
+        try:
+            with time_queries() as queries:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.add(-1)
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - started, scope["method"], route, str(status))
+            DB_QUERIES.observe(queries.count, route)
+            DB_TIME.observe(queries.seconds, route)
+
+
+def pool_collector(engine, name: str = "default") -> Callable[[], List[Family]]:
+    # Pool state and checkout waits from db_engine's TimedQueuePool stats
+    def collect() -> List[Family]:
+        stats = pool_stats(engine)
+        labels = {"pool": name}
+        families: List[Family] = []
+        for key, metric, help in (
+            ("size", "db_pool_size", "Connections the pool keeps open"),
+            ("checkedOut", "db_pool_checked_out", "Connections in use"),
+            ("overflow", "db_pool_overflow", "Connections opened past the pool size"),
+        ):
+            if key in stats:
+                families.append((metric, "gauge", help, [(metric, labels, stats[key])]))
+        if "waitBuckets" in stats:
+            counts = list(stats["waitBuckets"].values())
+            families.append((
+                "db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a pooled connection",
+                histogram_samples("db_pool_checkout_wait_seconds", labels, WAIT_BUCKETS, counts, stats["totalWaitSeconds"]),
+            ))
+            families.append((
+                "db_pool_checkout_timeouts_total", "counter", "Checkouts that gave up waiting for a connection",
+                [("db_pool_checkout_timeouts_total", labels, stats["timeouts"])],
+            ))
+        return families
+
+    return collect
+
+
+def metrics_response(metrics: Optional[MetricsRegistry] = None) -> PlainTextResponse:
+    return PlainTextResponse((metrics or registry).render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,440 @@
+import argparse
+import logging
+import os
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import (
+    JSON, Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, UniqueConstraint, bindparam,
+    column, func, inspect, select, table, text, tuple_,
+)
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+def _version_table(name: str) -> Table:
+    # One row per applied migration
+    return Table(
+        name,
+        MetaData(),
+        Column("version", Integer, primary_key=True),
+        Column("description", String, nullable=False),
+        Column("applied_at", DateTime, nullable=False),
+    )
+
+
+schema_version = _version_table("schema_version")
+
+# Tables as each step first created them. Steps never import models.py, whose
+# classes always describe the latest schema, not the one a step starts from.
+_tables = MetaData()
+
+_users = Table(
+    "users", _tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String, unique=True, index=True),
+    Column("email", String, unique=True, index=True),
+    Column("hashed_password", String),
+)
+_portfolios = Table(
+    "portfolios", _tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("cash", Float),
+)
+_positions = Table(
+    "positions", _tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("portfolio_id", Integer, ForeignKey("portfolios.id")),
+    Column("symbol", String, index=True),
+    Column("quantity", Float),
+    Column("average_price", Float),
+)
+_trades = Table(
+    "trades", _tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("portfolio_id", Integer, ForeignKey("portfolios.id")),
+    Column("symbol", String, index=True),
+    Column("quantity", Float),
+    Column("price", Float),
+    Column("trade_type", String),
+    Column("timestamp", DateTime),
+)
+_orders = Table(
+    "orders", _tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("portfolio_id", Integer, ForeignKey("portfolios.id")),
+    Column("user_id", Integer),
+    Column("symbol", String),
+    Column("side", String),
+    Column("order_type", String),
+    Column("quantity", Float),
+    Column("limit_price", Float, nullable=True),
+    Column("stop_price", Float, nullable=True),
+    Column("status", String),
+    Column("detail", String, nullable=True),
+    Column("fill_price", Float, nullable=True),
+    Column("created_at", DateTime),
+    Column("filled_at", DateTime, nullable=True),
+    Index("ix_orders_status_symbol", "status", "symbol"),
+    Index("ix_orders_user_status", "user_id", "status"),
+)
+_checkpoints = Table(
+    "portfolio_checkpoints", _tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("portfolio_id", Integer, ForeignKey("portfolios.id")),
+    Column("seq", Integer),
+    Column("timestamp", DateTime),
+    Column("cash", Float),
+    Column("positions", JSON),
+    UniqueConstraint("portfolio_id", "seq", name="uq_portfolio_checkpoints_portfolio_seq"),
+    Index("ix_portfolio_checkpoints_portfolio_timestamp", "portfolio_id", "timestamp", "seq"),
+)
+
+
+# Databases stamped version 1 by the old single create_all step may already
+# have any of what later steps add, so every step checks before it changes
+# anything.
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(info["name"] == column for info in inspect(conn).get_columns(table))
+
+
+def _has_index(conn: Connection, table: str, name: str) -> bool:
+    # A unique constraint and a unique index do the same job; SQLite can only
+    # add the latter to an existing table
+    inspector = inspect(conn)
+    return any(info["name"] == name for info in inspector.get_indexes(table)) or any(
+        info["name"] == name for info in inspector.get_unique_constraints(table)
+    )
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str) -> None:
+    if not _has_column(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _create_index(conn: Connection, table: str, name: str, columns: str, unique: bool = False) -> None:
+    if not _has_index(conn, table, name):
+        conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({columns})"))
+
+
+def _initial_schema(conn: Connection) -> None:
+    # The four tables main.py started out with. Databases from back then
+    # already have them.
+    for table in (_users, _portfolios, _positions, _trades):
+        table.create(conn, checkfirst=True)
+
+
+def _trade_history_indexes(conn: Connection) -> None:
+    # Keyset pagination of a portfolio's history, all of it or one symbol
+    _create_index(conn, "trades", "ix_trades_portfolio_timestamp_id", "portfolio_id, timestamp, id")
+    _create_index(conn, "trades", "ix_trades_portfolio_symbol_timestamp_id", "portfolio_id, symbol, timestamp, id")
+
+
+def _merge_duplicates(conn: Connection, portfolios: Table, positions: Table) -> None:
+    # Racing requests could create a second portfolio for a user or a second
+    # position row for a symbol; clear those up before making them unique
+    duplicate_users = conn.execute(
+        select(portfolios.c.user_id).where(portfolios.c.user_id.isnot(None))
+        .group_by(portfolios.c.user_id).having(func.count() > 1)
+    ).scalars().all()
+    for user_id in duplicate_users:
+        # The app always read the oldest one; the rest keep their rows for
+        # the record but no longer belong to anyone
+        keep = conn.execute(select(func.min(portfolios.c.id)).where(portfolios.c.user_id == user_id)).scalar()
+        conn.execute(
+            portfolios.update().where(portfolios.c.user_id == user_id, portfolios.c.id != keep).values(user_id=None)
+        )
+    if duplicate_users:
+        logger.warning(f"Set aside duplicate portfolios of {len(duplicate_users)} users")
+
+    duplicate_positions = conn.execute(
+        select(positions.c.portfolio_id, positions.c.symbol)
+        .group_by(positions.c.portfolio_id, positions.c.symbol).having(func.count() > 1)
+    ).all()
+    for portfolio_id, symbol in duplicate_positions:
+        # Merge into the oldest row: total quantity at the weighted average price
+        rows = conn.execute(
+            select(positions.c.id, positions.c.quantity, positions.c.average_price)
+            .where(positions.c.portfolio_id == portfolio_id, positions.c.symbol == symbol)
+            .order_by(positions.c.id)
+        ).all()
+        quantity = sum(row.quantity or 0.0 for row in rows)
+        cost = sum((row.quantity or 0.0) * (row.average_price or 0.0) for row in rows)
+        conn.execute(positions.update().where(positions.c.id == rows[0].id).values(
+            quantity=quantity, average_price=cost / quantity if quantity else 0.0
+        ))
+        conn.execute(positions.delete().where(positions.c.id.in_([row.id for row in rows[1:]])))
+    if duplicate_positions:
+        logger.warning(f"Merged {len(duplicate_positions)} duplicate positions")
+
+
+def _unique_portfolios_and_positions(conn: Connection) -> None:
+    # One portfolio per user and one position per symbol
+    _merge_duplicates(conn, _portfolios, _positions)
+    _create_index(conn, "portfolios", "ix_portfolios_user_id", "user_id", unique=True)
+    _create_index(conn, "positions", "uq_positions_portfolio_symbol", "portfolio_id, symbol", unique=True)
+
+
+def _orders_table(conn: Connection) -> None:
+    # Limit and stop orders, so the order book survives a restart
+    _orders.create(conn, checkfirst=True)
+
+
+def _portfolio_version(conn: Connection) -> None:
+    # Optimistic locking counter (Portfolio's version_id_col)
+    _add_column(conn, "portfolios", "version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _trade_journal_seq(conn: Connection) -> None:
+    # Journal entry each trade was written from, so replaying the journal
+    # after a crash skips the ones already in the database
+    if not _has_column(conn, "trades", "journal_seq"):
+        # create_all made the column with an unnamed UNIQUE, so only add the
+        # index together with the column
+        _add_column(conn, "trades", "journal_seq", "INTEGER")
+        _create_index(conn, "trades", "uq_trades_journal_seq", "journal_seq", unique=True)
+
+
+# trades and portfolios once they have their numbering columns
+_numbered_trades = table(
+    "trades", column("id", Integer), column("portfolio_id", Integer), column("symbol", String),
+    column("quantity", Float), column("price", Float), column("trade_type", String),
+    column("timestamp", DateTime), column("seq", Integer),
+)
+_numbered_portfolios = table("portfolios", column("id", Integer), column("trade_count", Integer))
+
+
+def _number_trades(conn: Connection, portfolio_id: int, batch_size: int = 10000) -> None:
+    # Number a portfolio's trades 1, 2, 3... in (timestamp, id) order and
+    # checkpoint them, the way they would have been if Trade.seq had existed
+    # all along. Streams the history in batches.
+    from trading import CHECKPOINT_INTERVAL, STARTING_CASH, TradeRejected, apply_fill
+
+    trades = _numbered_trades
+    conn.execute(_checkpoints.delete().where(_checkpoints.c.portfolio_id == portfolio_id))
+    # Clear any partial numbering first so renumbering can't collide with it
+    conn.execute(trades.update().where(trades.c.portfolio_id == portfolio_id).values(seq=None))
+
+    cash, positions = STARTING_CASH, {}
+    replayable = True
+    seq = 0
+    last: Optional[Tuple[datetime, int]] = None
+    while True:
+        query = select(
+            trades.c.id, trades.c.symbol, trades.c.trade_type, trades.c.quantity, trades.c.price, trades.c.timestamp
+        ).where(trades.c.portfolio_id == portfolio_id)
+        if last:
+            query = query.where(tuple_(trades.c.timestamp, trades.c.id) > tuple_(*last))
+        rows = conn.execute(query.order_by(trades.c.timestamp, trades.c.id).limit(batch_size)).all()
+        if not rows:
+            break
+        numbering = []
+        checkpoints = []
+        for row in rows:
+            seq += 1
+            numbering.append({"trade_id": row.id, "trade_seq": seq})
+            if not replayable:
+                continue
+            held, average_price = positions.get(row.symbol, (0.0, 0.0))
+            try:
+                cash, held, average_price = apply_fill(
+                    cash, held, average_price, row.trade_type.lower(), row.quantity, row.price
+                )
+            except TradeRejected as e:
+                # Old races could record trades the balance didn't allow. The
+                # numbering still holds; checkpoints would be wrong, so stop.
+                logger.warning(f"Portfolio {portfolio_id} trade {seq} does not replay ({e.detail}), no checkpoints after it")
+                replayable = False
+                continue
+            if held:
+                positions[row.symbol] = (held, average_price)
+            else:
+                positions.pop(row.symbol, None)
+            if seq % CHECKPOINT_INTERVAL == 0:
+                checkpoints.append({
+                    "portfolio_id": portfolio_id, "seq": seq, "timestamp": row.timestamp, "cash": cash,
+                    "positions": {symbol: [held, average] for symbol, (held, average) in positions.items()},
+                })
+        conn.execute(
+            trades.update().where(trades.c.id == bindparam("trade_id")).values(seq=bindparam("trade_seq")), numbering
+        )
+        if checkpoints:
+            conn.execute(_checkpoints.insert(), checkpoints)
+        last = (rows[-1].timestamp, rows[-1].id)
+
+    conn.execute(
+        _numbered_portfolios.update().where(_numbered_portfolios.c.id == portfolio_id).values(trade_count=seq)
+    )
+
+
+def _trade_seq_and_checkpoints(conn: Connection) -> None:
+    # Per-portfolio trade numbers (Trade.seq, Portfolio.trade_count) and the
+    # checkpoints /portfolio-at replays from, filled in for existing trades
+    _add_column(conn, "portfolios", "trade_count", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "trades", "seq", "INTEGER")
+    _checkpoints.create(conn, checkfirst=True)
+    unnumbered = conn.execute(
+        select(_numbered_trades.c.portfolio_id).distinct()
+        .where(_numbered_trades.c.seq.is_(None), _numbered_trades.c.portfolio_id.isnot(None))
+    ).scalars().all()
+    for portfolio_id in unnumbered:
+        _number_trades(conn, portfolio_id)
+    if unnumbered:
+        logger.info(f"Numbered the trades of {len(unnumbered)} portfolios")
+    _create_index(conn, "trades", "uq_trades_portfolio_seq", "portfolio_id, seq", unique=True)
+
+
+# (version, description, step), applied in order, each in its own transaction.
+# Schema changes get a new step at the end; never edit one that has shipped.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "initial schema", _initial_schema),
+    (2, "trade history indexes", _trade_history_indexes),
+    (3, "one portfolio per user, one position per symbol", _unique_portfolios_and_positions),
+    (4, "orders", _orders_table),
+    (5, "portfolio version", _portfolio_version),
+    (6, "trade journal sequence numbers", _trade_journal_seq),
+    (7, "trade numbers and portfolio checkpoints", _trade_seq_and_checkpoints),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+# my_stock_app.py's tables: a separate app with its own table layout, so its
+# own steps and version table. The same helpers, and the same rules.
+my_stock_app_version = _version_table("my_stock_app_schema_version")
+
+_my_tables = MetaData()
+
+_my_users = Table(
+    "users", _my_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String, unique=True, index=True),
+    Column("email", String, unique=True, index=True),
+    Column("password", String),
+)
+_my_portfolios = Table(
+    "portfolios", _my_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("cash", Float),
+)
+_my_positions = Table(
+    "stocks_owned", _my_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("portfolio_id", Integer, ForeignKey("portfolios.id")),
+    Column("symbol", String, index=True),
+    Column("quantity", Float),
+    Column("average_price", Float),
+)
+_my_trades = Table(
+    "trading_history", _my_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("portfolio_id", Integer, ForeignKey("portfolios.id")),
+    Column("symbol", String, index=True),
+    Column("quantity", Float),
+    Column("price", Float),
+    Column("trade_type", String),
+    Column("when", DateTime),
+)
+
+
+def _my_initial_schema(conn: Connection) -> None:
+    # The tables my_stock_app made with create_all until now
+    for table in (_my_users, _my_portfolios, _my_positions, _my_trades):
+        table.create(conn, checkfirst=True)
+
+
+def _my_unique_portfolios_and_positions(conn: Connection) -> None:
+    _merge_duplicates(conn, _my_portfolios, _my_positions)
+    _create_index(conn, "portfolios", "ix_portfolios_user_id", "user_id", unique=True)
+    _create_index(conn, "stocks_owned", "uq_stocks_owned_portfolio_symbol", "portfolio_id, symbol", unique=True)
+
+
+def _my_portfolio_version(conn: Connection) -> None:
+    # Optimistic locking counter (my_data_classes.Portfolio's version_id_col)
+    _add_column(conn, "portfolios", "version", "INTEGER NOT NULL DEFAULT 0")
+
+
+MY_STOCK_APP_MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "initial schema", _my_initial_schema),
+    (2, "one portfolio per user, one stock row per symbol", _my_unique_portfolios_and_positions),
+    (3, "portfolio version", _my_portfolio_version),
+]
+
+
+def current_version(engine: Engine, versions: Table = schema_version) -> int:
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(versions.name):
+            return 0
+        return conn.execute(select(func.max(versions.c.version))).scalar() or 0
+
+
+def upgrade(
+    engine: Engine,
+    target: Optional[int] = None,
+    steps: List[Tuple[int, str, Callable[[Connection], None]]] = MIGRATIONS,
+    versions: Table = schema_version,
+) -> List[int]:
+    # Apply the pending migrations up to target (default: all of them),
+    # returns the versions applied. main.py's unless given my_stock_app's
+    # (MY_STOCK_APP_MIGRATIONS, my_stock_app_version).
+    target = steps[-1][0] if target is None else target
+    versions.create(engine, checkfirst=True)
+    applied = []
+    for version, description, step in steps:
+        if version > target:
+            break
+        with engine.begin() as conn:
+            done = conn.execute(select(versions.c.version).where(versions.c.version == version)).first()
+            if done:
+                continue
+            step(conn)
+            conn.execute(versions.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        logger.info(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+def check(engine: Engine) -> int:
+    version = current_version(engine)
+    if version < LATEST:
+        raise RuntimeError(
+            f"Database schema is at version {version}, this code needs {LATEST}. "
+            "Run `python migrations.py` first (or set DB_AUTO_MIGRATE=1)."
+        )
+    return version
+
+
+def ensure_schema(engine: Engine) -> int:
+    # On app start: migrate when DB_AUTO_MIGRATE is set, otherwise only check,
+    # so a server never changes the schema unless asked to
+    if os.getenv("DB_AUTO_MIGRATE", "0").lower() in ("1", "true", "yes", "on"):
+        upgrade(engine)
+    return check(engine)
+
+
+def main():
+    # python migrations.py             bring DATABASE_URL up to date
+    # python migrations.py --status    print the current and latest version
+    parser = argparse.ArgumentParser(description="Versioned schema migrations for main.py's database")
+    parser.add_argument("--status", action="store_true", help="show the schema version and exit")
+    parser.add_argument("--to", type=int, help="stop at this version")
+    args = parser.parse_args()
+
+    from database import engine
+
+    if args.status:
+        print(f"schema version {current_version(engine)}, latest {LATEST}")
+        return
+    applied = upgrade(engine, args.to)
+    for version, description, _ in MIGRATIONS:
+        if version in applied:
+            print(f"applied {version}: {description}")
+    print(f"schema version {current_version(engine)}, latest {LATEST}")
+
+
+if __name__ == "__main__":
+    main()
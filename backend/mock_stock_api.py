@@ -1,16 +1,33 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import random
+import asyncio
 import logging
-from typing import Optional
+import os
+from contextlib import asynccontextmanager
+from account_store import AccountStore
+from app_logging import RequestLogMiddleware, configure_logging
+from market_sim import MarketSimulator
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger("mock_stock_api")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Accounts are saved every SNAPSHOT_INTERVAL seconds and once more on the
+    # way out (see save_accounts below)
+    task = asyncio.ensure_future(snapshot_accounts()) if SNAPSHOT_PATH else None
+    try:
+        yield
+    finally:
+        if task is not None:
+            task.cancel()
+            await save_accounts()
+
 # Create FastAPI app
-app = FastAPI(title="Super Reliable Stock API")
+app = FastAPI(title="Super Reliable Stock API", lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -21,6 +38,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request ids and one access log line per request (sampled per LOG_SAMPLE_RATES)
+app.add_middleware(RequestLogMiddleware)
+
 # Stock data - 100% reliable static data
 STOCKS = {
     "AAPL": {"name": "Apple Inc.", "price": 181.75, "change": 1.35},
@@ -56,123 +76,112 @@ async def root():
     logger.info("Root endpoint called")
     return {"message": "Mock Stock API is running!"}
 
+# Seeded market simulation: every symbol moves together each tick, the same
+# seed always gives the same prices (MARKET_SEED, MARKET_SPEED, ...)
+market = MarketSimulator.from_env(STOCKS)
+
 @app.get("/stock/{symbol}")
 async def get_stock_data(symbol: str):
     symbol = symbol.upper()
-    logger.info(f"Stock data requested for {symbol}")
+    logger.debug("Stock data requested for %s", symbol)
     
-    # Add a tiny random price variation each time
+    price, change = market.quote(symbol)
     if symbol in STOCKS:
-        # Copy the data so we don't modify the original
-        stock_data = STOCKS[symbol].copy()
-        # Add slight variation for realism
-        variation = random.uniform(-2.0, 2.0)
-        stock_data["price"] = round(stock_data["price"] + variation, 2)
-        stock_data["change"] = round(stock_data["change"] + (variation / 10), 2)
-        stock_data["symbol"] = symbol
-        
-        logger.info(f"Returning stock data for {symbol}")
-        return stock_data
+        name = STOCKS[symbol]["name"]
+        logger.debug("Returning stock data for %s", symbol)
     else:
-        # For unknown symbols, generate random but realistic data
-        price = round(random.uniform(50, 500), 2)
-        change = round(random.uniform(-3, 3), 2)
-        
-        logger.info(f"Returning random data for unknown symbol {symbol}")
-        return {
-            "symbol": symbol,
-            "name": f"{symbol} Inc.",
-            "price": price,
-            "change": change
-        }
+        # Unknown symbols get a made-up price that stays put between calls
+        name = f"{symbol} Inc."
+        logger.debug("Returning simulated data for unknown symbol %s", symbol)
+    return {
+        "symbol": symbol,
+        "name": name,
+        "price": price,
+        "change": change
+    }
+
+@app.get("/market")
+async def get_market():
+    return market.stats()
+
+@app.post("/market/advance")
+async def advance_market(ticks: int = Query(1, ge=1, le=10_000_000)):
+    # Step the simulation by hand, e.g. with MARKET_SPEED=0 for repeatable runs
+    # (in a thread, a thousand ticks of every symbol takes a moment)
+    return {"tick": await run_in_threadpool(market.advance, ticks)}
+
+# Most symbols one /stocks request may ask for
+MAX_BATCH = 50
+
+@app.get("/stocks")
+async def get_many_stocks(symbols: str):
+    wanted = list(dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip()))
+    if not wanted:
+        raise HTTPException(status_code=400, detail="No symbols given")
+    if len(wanted) > MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH} symbols per request")
+    
+    logger.debug("Stock data requested for %d symbols", len(wanted))
+    quotes = {}
+    for symbol in wanted:
+        quotes[symbol] = await get_stock_data(symbol)
+    return {"quotes": quotes, "errors": {}}
+
+# User portfolios live in memory in a compact store, saved to MOCK_SNAPSHOT_PATH
+# every MOCK_SNAPSHOT_INTERVAL seconds and on shutdown, and loaded back on start
+accounts = AccountStore.from_env()
+SNAPSHOT_PATH = os.getenv("MOCK_SNAPSHOT_PATH")
+SNAPSHOT_INTERVAL = float(os.getenv("MOCK_SNAPSHOT_INTERVAL", "60"))
 
-# Store user portfolios in memory (would use a database in real app)
-portfolios = {}
+async def save_accounts():
+    # Copy on the event loop (no trade can land halfway), write in a thread
+    arrays = accounts.snapshot()
+    await run_in_threadpool(AccountStore.write_snapshot, SNAPSHOT_PATH, arrays)
+
+async def snapshot_accounts():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await save_accounts()
+        except Exception as e:
+            logger.error(f"Saving account snapshot failed: {str(e)}")
 
 @app.get("/my-portfolio/{user_id}")
 async def get_portfolio(user_id: int):
-    user_id_str = str(user_id)
-    
-    if user_id_str not in portfolios:
-        # Create new portfolio
-        portfolios[user_id_str] = {
-            "cash": 10000.0,
-            "positions": []
-        }
-    
-    return portfolios[user_id_str]
+    try:
+        return accounts.portfolio(user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/accounts/stats")
+async def get_account_stats():
+    return accounts.stats()
 
 @app.post("/make-trade")
 async def execute_trade(trade: TradeRequest):
-    user_id = str(trade.user_id)
     symbol = trade.symbol.upper()
+    if trade.trade_type not in ("BUY", "SELL"):
+        raise HTTPException(status_code=400, detail="trade_type must be BUY or SELL")
     
-    # Ensure user has a portfolio
-    if user_id not in portfolios:
-        portfolios[user_id] = {
-            "cash": 10000.0,
-            "positions": []
-        }
-    
-    portfolio = portfolios[user_id]
-    
-    # Get current stock price
-    stock_data = await get_stock_data(symbol)
-    price = stock_data["price"]
-    total_cost = price * trade.quantity
-    
-    # Process trade
-    if trade.trade_type == "BUY":
-        # Check if user has enough cash
-        if portfolio["cash"] < total_cost:
-            raise HTTPException(status_code=400, detail="Not enough cash for this trade")
-        
-        # Update cash
-        portfolio["cash"] -= total_cost
-        
-        # Update positions
-        position_exists = False
-        for position in portfolio["positions"]:
-            if position["symbol"] == symbol:
-                # Update existing position
-                total_value = (position["quantity"] * position["average_price"]) + total_cost
-                position["quantity"] += trade.quantity
-                position["average_price"] = total_value / position["quantity"]
-                position_exists = True
-                break
-        
-        if not position_exists:
-            # Add new position
-            portfolio["positions"].append({
-                "symbol": symbol,
-                "quantity": trade.quantity,
-                "average_price": price
-            })
-    
-    elif trade.trade_type == "SELL":
-        # Find position
-        position = None
-        for p in portfolio["positions"]:
-            if p["symbol"] == symbol:
-                position = p
-                break
-        
-        if not position or position["quantity"] < trade.quantity:
-            raise HTTPException(status_code=400, detail="Not enough shares to sell")
-        
-        # Update cash
-        portfolio["cash"] += total_cost
-        
-        # Update position
-        position["quantity"] -= trade.quantity
+    # One trade per user at a time, from the price check to the update
+    async with accounts.lock_for(trade.user_id):
+        # Get current stock price
+        stock_data = await get_stock_data(symbol)
+        price = stock_data["price"]
+        total_cost = price * trade.quantity
         
-        # Remove position if quantity is 0
-        if position["quantity"] == 0:
-            portfolio["positions"] = [p for p in portfolio["positions"] if p["symbol"] != symbol]
+        # Process trade
+        try:
+            if trade.trade_type == "BUY":
+                new_balance = accounts.buy(trade.user_id, symbol, trade.quantity, price)
+            else:
+                new_balance = accounts.sell(trade.user_id, symbol, trade.quantity, price)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "message": "Trade executed successfully",
-        "new_balance": portfolio["cash"],
+        "new_balance": new_balance,
         "trade_info": {
             "symbol": symbol,
             "quantity": trade.quantity,
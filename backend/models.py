@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -16,12 +16,18 @@ class Portfolio(Base):
     __tablename__ = "portfolios"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, index=True)
     cash = Column(Float, default=10000.00)
+    # Bumped on every write, a stale concurrent update fails instead of being lost
+    version = Column(Integer, nullable=False, default=0)
+    # Number of trades so far, the last trade's Trade.seq
+    trade_count = Column(Integer, nullable=False, default=0)
     user = relationship("User", back_populates="portfolio")
     positions = relationship("Position", back_populates="portfolio")
     trades = relationship("Trade", back_populates="portfolio")
 
+    __mapper_args__ = {"version_id_col": version}
+
 class Position(Base):
     __tablename__ = "positions"
 
@@ -32,6 +38,11 @@ class Position(Base):
     average_price = Column(Float)
     portfolio = relationship("Portfolio", back_populates="positions")
 
+    __table_args__ = (
+        # One row per symbol per portfolio, also serves (portfolio_id, symbol) lookups
+        UniqueConstraint("portfolio_id", "symbol", name="uq_positions_portfolio_symbol"),
+    )
+
 class Trade(Base):
     __tablename__ = "trades"
 
@@ -42,4 +53,57 @@ class Trade(Base):
     price = Column(Float)
     trade_type = Column(String)  # "BUY" or "SELL"
     timestamp = Column(DateTime, default=datetime.utcnow)
-    portfolio = relationship("Portfolio", back_populates="trades") 
\ No newline at end of file
+    seq = Column(Integer, nullable=True)  # 1, 2, 3... per portfolio, the order trades were applied in
+    journal_seq = Column(Integer, nullable=True, unique=True)  # Set for trades written from the trade journal
+    portfolio = relationship("Portfolio", back_populates="trades")
+
+    __table_args__ = (
+        # Keyset pagination of a portfolio's history, newest first
+        Index("ix_trades_portfolio_timestamp_id", "portfolio_id", "timestamp", "id"),
+        # Same, filtered to one symbol
+        Index("ix_trades_portfolio_symbol_timestamp_id", "portfolio_id", "symbol", "timestamp", "id"),
+        # Replaying a portfolio's trades after a checkpoint
+        UniqueConstraint("portfolio_id", "seq", name="uq_trades_portfolio_seq"),
+    )
+
+class PortfolioCheckpoint(Base):
+    # Cash and positions right after the portfolio's trade number ``seq``
+    __tablename__ = "portfolio_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id"))
+    seq = Column(Integer)
+    timestamp = Column(DateTime)
+    cash = Column(Float)
+    positions = Column(JSON)  # {symbol: [quantity, average_price]}
+
+    __table_args__ = (
+        UniqueConstraint("portfolio_id", "seq", name="uq_portfolio_checkpoints_portfolio_seq"),
+        # Latest checkpoint at or before a timestamp
+        Index("ix_portfolio_checkpoints_portfolio_timestamp", "portfolio_id", "timestamp", "seq"),
+    )
+
+class Order(Base):
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True, index=True)
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id"))
+    user_id = Column(Integer)
+    symbol = Column(String)
+    side = Column(String)  # "BUY" or "SELL"
+    order_type = Column(String)  # "LIMIT", "STOP" or "STOP_LIMIT"
+    quantity = Column(Float)
+    limit_price = Column(Float, nullable=True)
+    stop_price = Column(Float, nullable=True)
+    status = Column(String, default="OPEN")  # "OPEN", "TRIGGERED", "FILLED", "CANCELLED" or "REJECTED"
+    detail = Column(String, nullable=True)
+    fill_price = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    filled_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Rebuilding the order book on startup
+        Index("ix_orders_status_symbol", "status", "symbol"),
+        # A user's open orders
+        Index("ix_orders_user_status", "user_id", "status"),
+    )
\ No newline at end of file
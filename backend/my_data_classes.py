@@ -1,5 +1,5 @@
 # My database tables for the stock market game! 📊
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, UniqueConstraint
 from sqlalchemy.orm import relationship
 from my_database_stuff import Base
 from datetime import datetime
@@ -18,12 +18,17 @@ class Portfolio(Base):
     __tablename__ = "portfolios"  # This is where we track everyone's money and stocks
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))  # Which user owns this portfolio
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, index=True)  # Which user owns this portfolio (just one each!)
     cash = Column(Float, default=10000.00)            # How much money they have (start with $10k!)
+    version = Column(Integer, nullable=False, default=0)  # Goes up by one with every change
     user = relationship("User", back_populates="portfolio")
     stocks = relationship("Position", back_populates="portfolio")  # What stocks they own
     trades = relationship("Trade", back_populates="portfolio")    # Their trading history
 
+    # If two copies of the app change the same portfolio at once, the second
+    # one gets told (StaleDataError) instead of quietly overwriting the first 🛡️
+    __mapper_args__ = {"version_id_col": version}
+
 class Position(Base):
     __tablename__ = "stocks_owned"  # The stocks people own
 
@@ -34,6 +39,11 @@ class Position(Base):
     average_price = Column(Float)            # Average price they paid per share
     portfolio = relationship("Portfolio", back_populates="stocks")
 
+    # Each portfolio has at most one row per stock (and this makes finding it fast!)
+    __table_args__ = (
+        UniqueConstraint("portfolio_id", "symbol", name="uq_stocks_owned_portfolio_symbol"),
+    )
+
 class Trade(Base):
     __tablename__ = "trading_history"  # Keep track of all trades
 
@@ -1,9 +1,9 @@
 # This is where we set up our database connection! 🔌
-from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
+from db_engine import make_engine
 
 # Load our secret settings
 load_dotenv()
@@ -13,7 +13,8 @@ load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./my_stock_game.db")
 
 # Create the database engine (like starting up the database)
-db_engine = create_engine(DATABASE_URL)
+# It keeps a pool of connections ready and turns on SQLite's faster WAL mode
+db_engine = make_engine(DATABASE_URL)
 
 # This helps us talk to the database
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
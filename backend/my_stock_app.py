@@ -1,41 +1,74 @@
 # My first stock market simulator! 🚀
 # Made by: [Your name here]
 
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, Header, HTTPException, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
-import requests
+from fastapi.responses import ORJSONResponse
+import anyio
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.exc import StaleDataError
 from my_database_stuff import SessionLocal, db_engine as engine
-from my_data_classes import Base, Portfolio, Position
-from my_types import TradeRequest, PortfolioResponse
-from datetime import datetime
+from db_engine import pool_stats
+from my_data_classes import Portfolio, Position
+from my_types import PortfolioSummary, StockInfo, StockInfoBatch, TradeRequest, TradeResult
+from price_stream import PriceStreamHub, stream_router
+from app_logging import RequestLogMiddleware, configure_logging
+from http_cache import PRIVATE_REVALIDATE, cache_headers, etag_matches, make_etag, not_modified, quote_headers
+from metrics import MetricsMiddleware, metrics_response, pool_collector, registry
+from quote_cache import QuoteCache
+from quote_providers import STOCK_TABLE, build_provider, parse_symbol_list, split_quote_results
+from migrations import MY_STOCK_APP_MIGRATIONS, my_stock_app_version, upgrade
+from contextlib import asynccontextmanager
+from typing import Optional
 import os
 import logging
-import time
-import random
+import threading
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging! Messages get written by a helper thread so my app never has
+# to wait for them ✍️ (APP_ENV / LOG_LEVEL pick how chatty it is)
+configure_logging(default_level="DEBUG")
 logger = logging.getLogger("stock_app")
 
-# Create my database tables
-Base.metadata.create_all(bind=engine)
-
-# Create my app
-my_app = FastAPI(title="My Cool Stock Market Game 📈")
-
-# Static stock data - always works without any API
-STOCK_DATA = {
-    "AAPL": {"name": "Apple Inc.", "price": 180.75, "change": 1.35},
-    "MSFT": {"name": "Microsoft Corporation", "price": 338.48, "change": 0.89},
-    "GOOGL": {"name": "Alphabet Inc.", "price": 137.12, "change": -0.45},
-    "AMZN": {"name": "Amazon.com Inc.", "price": 127.74, "change": 2.25},
-    "TSLA": {"name": "Tesla Inc.", "price": 237.01, "change": -1.20},
-    "META": {"name": "Meta Platforms Inc.", "price": 324.95, "change": 3.12},
-    "NVDA": {"name": "NVIDIA Corporation", "price": 429.97, "change": 2.37},
-    "NFLX": {"name": "Netflix Inc.", "price": 484.13, "change": -1.54},
-    "PYPL": {"name": "PayPal Holdings Inc.", "price": 63.42, "change": -0.73},
-    "INTC": {"name": "Intel Corporation", "price": 42.32, "change": 0.28},
-}
+def upgrade_my_tables(engine):
+    return upgrade(engine, steps=MY_STOCK_APP_MIGRATIONS, versions=my_stock_app_version)
+
+# Things to do when the app starts and stops (not when someone just imports
+# this file, that should be quick!) 🏁
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Make my database tables, or bring old ones up to date (one step at a
+    # time, see MY_STOCK_APP_MIGRATIONS in migrations.py) 🧱
+    await anyio.to_thread.run_sync(upgrade_my_tables, engine)
+    yield
+    await price_hub.close()
+
+# Create my app! orjson writes the answers super fast, and the busy pages say
+# exactly what they send back (response_model) so nothing has to guess ⚡
+my_app = FastAPI(title="My Cool Stock Market Game 📈", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Static stock data - always works without any API (lives with the quote providers now)
+STOCK_DATA = STOCK_TABLE
+
+# Where our prices come from! Set QUOTE_PROVIDER to switch (static by default,
+# which is our pretend stock market that moves a tiny bit every second 🎲)
+quote_provider = build_provider(default="static")
+
+# Live prices! One ticker per stock shares its updates with everyone watching it 📡
+price_hub = PriceStreamHub.from_env(quote_provider.get_quote)
+my_app.include_router(stream_router(price_hub))
+
+# Name tags (ETags) for answers, so browsers and nginx can ask "did it change?"
+# and get a tiny 304 back when it didn't 🏷️ A portfolio's tag comes from its
+# version number in the database, which goes up with every trade (no matter
+# which copy of the app made it) and stays the same across restarts.
+def portfolio_headers(user_id: int, version: int):
+    return cache_headers(make_etag("portfolio", user_id, version, per_process=False), PRIVATE_REVALIDATE)
+
+# Prices get remembered for QUOTE_MAX_AGE seconds, so "did it change?" can be
+# answered without asking for the price again
+QUOTE_MAX_AGE = float(os.getenv("QUOTE_MAX_AGE", "1"))
+quote_cache = QuoteCache(quote_provider, ttl=QUOTE_MAX_AGE)
 
 # Get frontend URL from environment variable or use localhost for development
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:3000")
@@ -49,17 +82,17 @@ my_app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add logging middleware
-@my_app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info(f"Request: {request.method} {request.url.path}")
-    try:
-        response = await call_next(request)
-        logger.info(f"Response: {response.status_code}")
-        return response
-    except Exception as e:
-        logger.error(f"Error: {str(e)}")
-        raise
+# Log every request (with an id and how long it took), or just some of them
+# for busy pages like /stock/{symbol} - see LOG_SAMPLE_RATES
+my_app.add_middleware(RequestLogMiddleware)
+
+# Count how long every page takes and how much database work it does, for /metrics 📊
+my_app.add_middleware(MetricsMiddleware)
+registry.add_collector(pool_collector(engine))
+
+# One trade at a time for each player (players with different numbers don't
+# wait for each other), so two clicks at once can't spend the same money twice 🔒
+trade_locks = [threading.Lock() for _ in range(64)]
 
 # Get database connection
 def get_db():
@@ -69,68 +102,117 @@ def get_db():
     finally:
         db.close()
 
+# Someone's portfolio and the stocks they own, in one trip to the database
+def load_portfolio(db, user_id: int):
+    return db.query(Portfolio).options(joinedload(Portfolio.stocks)).filter(Portfolio.user_id == user_id).first()
+
 @my_app.get("/")
 def say_hello():
     logger.info("Root endpoint called")
     return {"message": "Welcome to my stock market game! 🎮"}
 
-@my_app.get("/stock/{symbol}")
-async def get_stock_info(symbol: str):
+@my_app.get("/stock/{symbol}", response_model=StockInfo)
+async def get_stock_info(symbol: str, response: Response, if_none_match: Optional[str] = Header(None)):
     symbol = symbol.upper()
-    logger.info(f"Stock info requested for {symbol}")
-    
-    # Add a small delay to simulate network request
-    time.sleep(0.1)
+    logger.debug("Stock info requested for %s", symbol)
+
+    # Still have the price they already got? Then say so right away 🙌
+    cached = quote_cache.peek(symbol)
+    if cached and if_none_match:
+        headers = quote_headers(symbol, cached, quote_cache.clock())
+        if etag_matches(if_none_match, headers["ETag"]):
+            return not_modified(headers)  # Same price as last time!
+
+    # Ask our quote provider (never blocks the event loop, even with a fake delay)
+    try:
+        stock_info = await quote_cache.get(symbol)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=f"Couldn't find {symbol} 🔍: {str(e)}")
+
+    logger.debug("Returning stock info for %s: %s", symbol, stock_info)
+    entry = quote_cache.peek(symbol)
+    if entry is not None and entry.quote is stock_info:
+        response.headers.update(quote_headers(symbol, entry, quote_cache.clock()))
+    return stock_info
+
+@my_app.get("/stocks", response_model=StockInfoBatch)
+async def get_lots_of_stocks(symbols: str):
+    # Get a bunch of stocks at once! Like /stocks?symbols=AAPL,MSFT,TSLA
+    try:
+        wanted = parse_symbol_list(symbols)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.debug("Stock info requested for %d symbols", len(wanted))
     
-    # If symbol exists in our data
-    if symbol in STOCK_DATA:
-        # Add a tiny random price variation each time
-        stock_info = STOCK_DATA[symbol].copy()
-        # Add a little randomness to prices for realism
-        variation = random.uniform(-2.0, 2.0)
-        stock_info["price"] = round(stock_info["price"] + variation, 2)
-        stock_info["change"] = round(stock_info["change"] + (variation / 10), 2)
-        stock_info["symbol"] = symbol
-        
-        logger.info(f"Returning stock info for {symbol}: {stock_info}")
-        return stock_info
-    else:
-        # Generate random data for unknown symbols
-        price = round(random.uniform(50, 500), 2)
-        change = round(random.uniform(-3, 3), 2)
-        
-        result = {
-            "symbol": symbol,
-            "price": price,
-            "name": f"{symbol} Inc.",
-            "change": change
-        }
-        
-        logger.info(f"Generated random stock data for {symbol}: {result}")
-        return result
+    # One batch for everything, anything that breaks shows up in "errors" 🧯
+    return split_quote_results(await quote_provider.get_many(wanted))
+
+@my_app.get("/db-pool/stats")
+def how_busy_is_the_database():
+    # How many connections are in use and how long people waited for one ⏱️
+    return pool_stats(engine)
+
+@my_app.get("/metrics", include_in_schema=False)
+async def all_my_numbers():
+    # All the numbers at once, in the format Prometheus likes to read 🔢
+    return metrics_response()
+
+@my_app.get("/my-portfolio/{user_id}", response_model=PortfolioSummary)
+def check_my_portfolio(user_id: int, response: Response, if_none_match: Optional[str] = Header(None), db = Depends(get_db)):
+    # No trades since last time? Then the version number is the same, and
+    # that's all we have to ask the database 🙌
+    if if_none_match:
+        version = db.query(Portfolio.version).filter(Portfolio.user_id == user_id).scalar()
+        if version is not None:
+            headers = portfolio_headers(user_id, version)
+            if etag_matches(if_none_match, headers["ETag"]):
+                return not_modified(headers)
 
-@my_app.get("/my-portfolio/{user_id}")
-def check_my_portfolio(user_id: int, db = Depends(get_db)):
     # Find or create new portfolio with $10,000 starting money!
-    portfolio = db.query(Portfolio).filter(Portfolio.user_id == user_id).first()
+    # (and grab the stocks it owns in the same trip to the database)
+    portfolio = load_portfolio(db, user_id)
     if not portfolio:
         portfolio = Portfolio(user_id=user_id, cash=10000.00)  # Free money! 🤑
         db.add(portfolio)
-        db.commit()
-        db.refresh(portfolio)
+        try:
+            db.commit()
+            db.refresh(portfolio)
+        except IntegrityError:
+            # Somebody made it a split second before us, just use theirs
+            db.rollback()
+            portfolio = load_portfolio(db, user_id)
+    response.headers.update(portfolio_headers(user_id, portfolio.version))
     return portfolio
 
-@my_app.post("/make-trade")
+@my_app.post("/make-trade", response_model=TradeResult)
 def buy_or_sell_stock(trade: TradeRequest, db = Depends(get_db)):
-    # Get user's portfolio
-    portfolio = db.query(Portfolio).filter(Portfolio.user_id == trade.user_id).first()
+    # Get current stock price using our stock API
+    # (this runs in a worker thread, so hop over to the event loop to ask the provider)
+    try:
+        stock_info = anyio.from_thread.run(quote_provider.get_quote, trade.symbol)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=f"Couldn't find {trade.symbol} 🔍: {str(e)}")
+
+    # If another copy of the app changed the same stocks at the same moment,
+    # the database says no (IntegrityError / StaleDataError) - so we just look
+    # again and redo the trade with the fresh numbers 🔁
+    for attempt in range(3):
+        try:
+            with trade_locks[trade.user_id % len(trade_locks)]:
+                result = trade_at_price(db, trade, stock_info["price"])
+        except (IntegrityError, StaleDataError):
+            db.rollback()
+            logger.warning("Portfolio %s changed while trading, trying again (%d)", trade.user_id, attempt + 1)
+            continue
+        return result
+    raise HTTPException(status_code=409, detail="Your portfolio was busy, try again! ⏳")
+
+def trade_at_price(db, trade: TradeRequest, current_price: float):
+    # Get user's portfolio (and the stocks they own, all in one go!)
+    portfolio = load_portfolio(db, trade.user_id)
     if not portfolio:
         raise HTTPException(status_code=404, detail="Couldn't find your portfolio 😢")
     
-    # Get current stock price using our stock API
-    stock_info = get_stock_info(trade.symbol)
-    current_price = stock_info["price"]
-    
     # Calculate total cost
     total_cost = current_price * trade.quantity
     
@@ -141,10 +223,7 @@ def buy_or_sell_stock(trade: TradeRequest, db = Depends(get_db)):
         portfolio.cash -= total_cost
         
         # Add to existing position or create new one
-        position = db.query(Position).filter(
-            Position.portfolio_id == portfolio.id,
-            Position.symbol == trade.symbol
-        ).first()
+        position = next((p for p in portfolio.stocks if p.symbol == trade.symbol), None)
         
         if position:
             position.quantity += trade.quantity
@@ -158,10 +237,7 @@ def buy_or_sell_stock(trade: TradeRequest, db = Depends(get_db)):
             db.add(new_position)
             
     else:  # SELL
-        position = db.query(Position).filter(
-            Position.portfolio_id == portfolio.id,
-            Position.symbol == trade.symbol
-        ).first()
+        position = next((p for p in portfolio.stocks if p.symbol == trade.symbol), None)
         
         if not position or position.quantity < trade.quantity:
             raise HTTPException(status_code=400, detail="You don't have enough shares! 📉")
@@ -172,10 +248,11 @@ def buy_or_sell_stock(trade: TradeRequest, db = Depends(get_db)):
         if position.quantity == 0:
             db.delete(position)
     
+    new_balance = portfolio.cash  # Read it now, after saving it would mean asking the database again
     db.commit()
     return {
         "message": "Trade successful! 🎉",
-        "new_balance": portfolio.cash,
+        "new_balance": new_balance,
         "trade_info": {
             "symbol": trade.symbol,
             "quantity": trade.quantity,
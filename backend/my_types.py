@@ -1,6 +1,6 @@
 # These are like templates for our data! 🏗️
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List
 from datetime import datetime
 
 # User stuff
@@ -55,9 +55,39 @@ class PortfolioResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# What /my-portfolio sends back: money and stocks, but not the trade history
+# (that gets really long!)
+class PortfolioSummary(BaseModel):
+    id: int
+    user_id: int
+    cash: float
+    stocks: List[StockPosition] = []
+
+    class Config:
+        from_attributes = True
+
 # Stock price info
 class StockInfo(BaseModel):
     symbol: str   # Stock symbol
     price: float  # Current price
     name: str     # Company name
-    change: float # Price change today 
\ No newline at end of file
+    change: float # Price change today
+    changePercent: float  # Price change today in %
+
+# Lots of stocks at once (and the ones that didn't work)
+class StockInfoBatch(BaseModel):
+    quotes: Dict[str, StockInfo]
+    errors: Dict[str, str]
+
+# What a trade looked like
+class TradeInfo(BaseModel):
+    symbol: str
+    quantity: float
+    price: float
+    total: float
+    type: str
+
+class TradeResult(BaseModel):
+    message: str
+    new_balance: float
+    trade_info: TradeInfo
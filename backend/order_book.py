@@ -0,0 +1,171 @@
+import heapq
+import itertools
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ORDER_TYPES = ("LIMIT", "STOP", "STOP_LIMIT")
+OPEN_STATUSES = ("OPEN", "TRIGGERED")
+
+
+class BookOrder:
+    __slots__ = (
+        "id", "user_id", "symbol", "side", "order_type", "quantity",
+        "limit_price", "stop_price", "triggered", "active",
+    )
+
+    def __init__(self, id, user_id, symbol, side, order_type, quantity,
+                 limit_price=None, stop_price=None, triggered=False):
+        self.id = id
+        self.user_id = user_id
+        self.symbol = symbol
+        self.side = side
+        self.order_type = order_type
+        self.quantity = quantity
+        self.limit_price = limit_price
+        self.stop_price = stop_price
+        self.triggered = triggered
+        self.active = True
+
+    @classmethod
+    def from_row(cls, row) -> "BookOrder":
+        return cls(row.id, row.user_id, row.symbol, row.side, row.order_type, row.quantity,
+                   row.limit_price, row.stop_price, row.status == "TRIGGERED")
+
+
+class SymbolBook:
+    """Pending orders for one symbol, indexed by the price that sets them off.
+
+    Four heaps keep the order closest to triggering on top, so a price update
+    only pops the orders whose threshold it crossed:
+
+    - buy limits fill at or below their limit (max-heap on limit)
+    - sell limits fill at or above their limit (min-heap on limit)
+    - buy stops trigger at or above their stop (min-heap on stop)
+    - sell stops trigger at or below their stop (max-heap on stop)
+
+    Cancelled orders are only marked inactive and skipped when they surface.
+    """
+
+    def __init__(self):
+        self.buy_limits: List[Tuple[float, int, BookOrder]] = []
+        self.sell_limits: List[Tuple[float, int, BookOrder]] = []
+        self.buy_stops: List[Tuple[float, int, BookOrder]] = []
+        self.sell_stops: List[Tuple[float, int, BookOrder]] = []
+        self._seq = itertools.count()
+        self.live = 0
+
+    def add(self, order: BookOrder) -> None:
+        self.live += 1
+        self._push(order)
+
+    def _push(self, order: BookOrder) -> None:
+        seq = next(self._seq)
+        if order.order_type == "LIMIT" or order.triggered:
+            if order.side == "BUY":
+                heapq.heappush(self.buy_limits, (-order.limit_price, seq, order))
+            else:
+                heapq.heappush(self.sell_limits, (order.limit_price, seq, order))
+        elif order.side == "BUY":
+            heapq.heappush(self.buy_stops, (order.stop_price, seq, order))
+        else:
+            heapq.heappush(self.sell_stops, (-order.stop_price, seq, order))
+
+    def cancel(self, order: BookOrder) -> None:
+        if order.active:
+            order.active = False
+            self.live -= 1
+
+    def cross(self, price: float) -> Tuple[List[BookOrder], List[BookOrder]]:
+        # Returns (orders to fill at this price, stop-limits that just triggered
+        # and now rest as limits)
+        fills: List[BookOrder] = []
+        triggered: List[BookOrder] = []
+
+        for heap, crossed in (
+            (self.buy_stops, lambda key: key <= price),
+            (self.sell_stops, lambda key: -key >= price),
+        ):
+            while heap and crossed(heap[0][0]):
+                order = heapq.heappop(heap)[2]
+                if not order.active:
+                    continue
+                if order.order_type == "STOP":
+                    fills.append(order)
+                else:
+                    order.triggered = True
+                    triggered.append(order)
+                    self._push(order)
+
+        for heap, crossed in (
+            (self.buy_limits, lambda key: -key >= price),
+            (self.sell_limits, lambda key: key <= price),
+        ):
+            while heap and crossed(heap[0][0]):
+                order = heapq.heappop(heap)[2]
+                if order.active:
+                    fills.append(order)
+
+        for order in fills:
+            order.active = False
+        self.live -= len(fills)
+        return fills, triggered
+
+    def __len__(self) -> int:
+        return self.live
+
+
+class OrderBook:
+    """Per-symbol books of pending limit, stop and stop-limit orders.
+
+    Thread-safe: orders are placed and cancelled from request threads while
+    price updates arrive on the event loop.
+    """
+
+    def __init__(self):
+        self._books: Dict[str, SymbolBook] = {}
+        self._orders: Dict[int, BookOrder] = {}
+        self._lock = threading.Lock()
+
+    def add(self, order: BookOrder) -> None:
+        with self._lock:
+            self._orders[order.id] = order
+            self._books.setdefault(order.symbol, SymbolBook()).add(order)
+
+    def load(self, orders: Iterable[BookOrder]) -> int:
+        count = 0
+        for order in orders:
+            self.add(order)
+            count += 1
+        return count
+
+    def cancel(self, order_id: int) -> Optional[BookOrder]:
+        with self._lock:
+            order = self._orders.pop(order_id, None)
+            if order is not None:
+                self._books[order.symbol].cancel(order)
+                self._drop_if_empty(order.symbol)
+            return order
+
+    def on_price(self, symbol: str, price: float) -> Tuple[List[BookOrder], List[BookOrder]]:
+        with self._lock:
+            book = self._books.get(symbol)
+            if book is None:
+                return [], []
+            fills, triggered = book.cross(price)
+            for order in fills:
+                self._orders.pop(order.id, None)
+            self._drop_if_empty(symbol)
+            return fills, triggered
+
+    def _drop_if_empty(self, symbol: str) -> None:
+        book = self._books.get(symbol)
+        if book is not None and not book.live:
+            del self._books[symbol]
+
+    def symbols(self) -> List[str]:
+        with self._lock:
+            return list(self._books)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"symbols": len(self._books), "openOrders": len(self._orders)}
@@ -0,0 +1,112 @@
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+import models
+from trading import CHECKPOINT_INTERVAL, STARTING_CASH, apply_fill, make_checkpoint
+
+# The trades table is the event log: a portfolio's state at any point is
+# STARTING_CASH plus its trades replayed in Trade.seq order. Checkpoints taken
+# every CHECKPOINT_INTERVAL trades bound that replay to one checkpoint load
+# plus at most CHECKPOINT_INTERVAL trades, however long the history gets.
+
+
+def _replay(state: Tuple[float, Dict[str, Tuple[float, float]]], trades) -> Tuple[float, Dict[str, Tuple[float, float]], int]:
+    # Same arithmetic as the live fill, so the results match it exactly
+    cash, positions = state
+    count = 0
+    for trade in trades:
+        held, average_price = positions.get(trade.symbol, (0.0, 0.0))
+        cash, held, average_price = apply_fill(
+            cash, held, average_price, trade.trade_type.lower(), trade.quantity, trade.price
+        )
+        if held:
+            positions[trade.symbol] = (held, average_price)
+        else:
+            positions.pop(trade.symbol, None)
+        count += 1
+    return cash, positions, count
+
+
+def portfolio_at(db: Session, portfolio_id: int, when: datetime) -> Dict[str, Any]:
+    # Cash and positions as they were right after the last trade at or before
+    # ``when``
+    checkpoints = db.query(models.PortfolioCheckpoint).filter(
+        models.PortfolioCheckpoint.portfolio_id == portfolio_id
+    )
+    checkpoint = checkpoints.filter(models.PortfolioCheckpoint.timestamp <= when).order_by(
+        models.PortfolioCheckpoint.timestamp.desc(), models.PortfolioCheckpoint.seq.desc()
+    ).first()
+    if checkpoint:
+        seq = checkpoint.seq
+        state = (checkpoint.cash, {symbol: tuple(value) for symbol, value in checkpoint.positions.items()})
+    else:
+        seq, state = 0, (STARTING_CASH, {})
+    # The first checkpoint after ``when`` caps the seq range to scan
+    following = checkpoints.with_entities(models.PortfolioCheckpoint.seq).filter(
+        models.PortfolioCheckpoint.timestamp > when
+    ).order_by(models.PortfolioCheckpoint.timestamp, models.PortfolioCheckpoint.seq).first()
+
+    trades = db.query(
+        models.Trade.seq, models.Trade.symbol, models.Trade.trade_type, models.Trade.quantity, models.Trade.price
+    ).filter(
+        models.Trade.portfolio_id == portfolio_id,
+        models.Trade.seq > seq,
+        models.Trade.timestamp <= when
+    )
+    if following:
+        trades = trades.filter(models.Trade.seq < following.seq)
+    trades = trades.order_by(models.Trade.seq).all()
+    cash, positions, replayed = _replay(state, trades)
+    return {
+        "cash": cash,
+        "positions": positions,
+        "tradeCount": trades[-1].seq if trades else seq,
+        "checkpointSeq": seq,
+        "replayed": replayed,
+    }
+
+
+def rebuild_checkpoints(db: Session, portfolio_id: int, batch_size: int = 10000) -> int:
+    # Number a portfolio's trades in (timestamp, id) order and write all of its
+    # checkpoints from scratch, e.g. for trades recorded before Trade.seq
+    # existed. Streams the history, so it works for millions of trades.
+    # Returns the number of trades; the caller commits.
+    db.query(models.PortfolioCheckpoint).filter(
+        models.PortfolioCheckpoint.portfolio_id == portfolio_id
+    ).delete(synchronize_session=False)
+    # Clear the old numbering first so renumbering can't collide with it
+    db.query(models.Trade).filter(
+        models.Trade.portfolio_id == portfolio_id
+    ).update({"seq": None}, synchronize_session=False)
+
+    state: Tuple[float, Dict[str, Tuple[float, float]]] = (STARTING_CASH, {})
+    seq = 0
+    last: Optional[Tuple[datetime, int]] = None
+    while True:
+        query = db.query(
+            models.Trade.id, models.Trade.symbol, models.Trade.trade_type, models.Trade.quantity,
+            models.Trade.price, models.Trade.timestamp
+        ).filter(models.Trade.portfolio_id == portfolio_id)
+        if last:
+            query = query.filter(tuple_(models.Trade.timestamp, models.Trade.id) > tuple_(*last))
+        trades = query.order_by(models.Trade.timestamp, models.Trade.id).limit(batch_size).all()
+        if not trades:
+            break
+        numbering = []
+        for trade in trades:
+            seq += 1
+            cash, positions, _ = _replay(state, [trade])
+            state = (cash, positions)
+            numbering.append({"id": trade.id, "seq": seq})
+            if seq % CHECKPOINT_INTERVAL == 0:
+                db.add(make_checkpoint(portfolio_id, seq, trade.timestamp, cash, positions))
+        db.bulk_update_mappings(models.Trade, numbering)
+        last = (trades[-1].timestamp, trades[-1].id)
+
+    db.query(models.Portfolio).filter(models.Portfolio.id == portfolio_id).update(
+        {"trade_count": seq}, synchronize_session=False
+    )
+    return seq
@@ -0,0 +1,27 @@
+from typing import Any, Dict, Iterable, List
+
+
+def value_positions(positions: Iterable[Any], quotes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Value every open position in one pass over already-fetched quotes.
+    # A symbol whose quote failed (an exception in ``quotes``) is left out
+    # rather than failing the whole portfolio.
+    valued = []
+    for position in positions:
+        if position.quantity <= 0:
+            continue
+        quote = quotes.get(position.symbol.upper())
+        if quote is None or isinstance(quote, Exception):
+            continue
+        current_price = quote["price"]
+        total_value = current_price * position.quantity
+        profit_loss = ((current_price - position.average_price) / position.average_price) * 100
+
+        valued.append({
+            "symbol": position.symbol,
+            "quantity": position.quantity,
+            "averagePrice": position.average_price,
+            "currentPrice": current_price,
+            "totalValue": total_value,
+            "profitLoss": profit_loss
+        })
+    return valued
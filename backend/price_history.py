@@ -0,0 +1,231 @@
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# One raw little-endian file per column, timestamps are epoch seconds
+COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("timestamp", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+)
+VALUE_COLUMNS = COLUMNS[1:]
+
+_SYMBOL_RE = re.compile(r"^[A-Z0-9.^=-]{1,15}$")
+
+
+class PriceHistoryStore:
+    """OHLCV bars stored per symbol as memory-mapped column files.
+
+    ``<root>/<SYMBOL>/<column>.bin`` holds one fixed-width value per bar, bars
+    in increasing timestamp order. Reads map the files read-only and return
+    NumPy views, so a range is a binary search plus a slice with no copy,
+    and every process serving the same directory shares the OS page cache.
+
+    The timestamp file is written last on append and defines how many bars
+    exist, so readers never see a half-written bar. The maps of the
+    ``max_mapped`` most recently read symbols are kept open.
+    """
+
+    def __init__(self, root: str, max_mapped: int = 256):
+        self.root = root
+        self.max_mapped = max_mapped
+        self._maps: "OrderedDict[str, Tuple[int, Dict[str, np.ndarray]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._append_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "PriceHistoryStore":
+        return cls(
+            os.getenv("PRICE_HISTORY_DIR", "price_history"),
+            max_mapped=int(os.getenv("PRICE_HISTORY_MAX_MAPPED", "256")),
+        )
+
+    def _path(self, symbol: str, column: str) -> str:
+        if not _SYMBOL_RE.match(symbol):
+            raise ValueError(f"Invalid symbol: {symbol}")
+        return os.path.join(self.root, symbol, f"{column}.bin")
+
+    def count(self, symbol: str) -> int:
+        try:
+            return os.path.getsize(self._path(symbol, "timestamp")) // 8
+        except FileNotFoundError:
+            return 0
+
+    def symbols(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if _SYMBOL_RE.match(name) and self.count(name))
+
+    def _columns(self, symbol: str) -> Dict[str, np.ndarray]:
+        # Read-only maps of all columns, remapped when the file has grown
+        rows = self.count(symbol)
+        with self._lock:
+            cached = self._maps.get(symbol)
+            if cached and cached[0] == rows:
+                self._maps.move_to_end(symbol)
+                return cached[1]
+            if rows:
+                columns = {
+                    name: np.memmap(self._path(symbol, name), dtype=dtype, mode="r", shape=(rows,))
+                    for name, dtype in COLUMNS
+                }
+            else:
+                columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+            self._maps[symbol] = (rows, columns)
+            self._maps.move_to_end(symbol)
+            # Views already handed out keep their map alive until dropped
+            while len(self._maps) > self.max_mapped:
+                self._maps.popitem(last=False)
+            return columns
+
+    def bars(
+        self, symbol: str, start: Optional[int] = None, end: Optional[int] = None, limit: Optional[int] = None
+    ) -> Dict[str, np.ndarray]:
+        # Bars with start <= timestamp < end (epoch seconds), the latest
+        # ``limit`` of them if given. The arrays are views into the files.
+        columns = self._columns(symbol)
+        timestamps = columns["timestamp"]
+        lo = int(np.searchsorted(timestamps, start, "left")) if start is not None else 0
+        hi = int(np.searchsorted(timestamps, end, "left")) if end is not None else len(timestamps)
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return {name: column[lo:hi] for name, column in columns.items()}
+
+    def append(self, symbol: str, timestamps, opens, highs, lows, closes, volumes) -> int:
+        # Append bars in increasing timestamp order. Bars not newer than the
+        # last stored one are skipped (e.g. a second worker recording the same
+        # bar). Returns how many were written.
+        timestamp = np.atleast_1d(np.asarray(timestamps, dtype="<i8"))
+        values = [np.atleast_1d(np.asarray(v, dtype="<f8")) for v in (opens, highs, lows, closes, volumes)]
+        if any(len(v) != len(timestamp) for v in values):
+            raise ValueError("All columns must have the same length")
+        if len(timestamp) > 1 and not np.all(np.diff(timestamp) > 0):
+            raise ValueError("Timestamps must be strictly increasing")
+
+        directory = os.path.dirname(self._path(symbol, "timestamp"))
+        os.makedirs(directory, exist_ok=True)
+        with self._append_lock, _FileLock(os.path.join(directory, ".lock")):
+            rows = self.count(symbol)
+            if rows:
+                last = np.fromfile(self._path(symbol, "timestamp"), dtype="<i8", count=1, offset=(rows - 1) * 8)[0]
+                keep = timestamp > last
+                if not keep.all():
+                    timestamp = timestamp[keep]
+                    values = [v[keep] for v in values]
+            if not len(timestamp):
+                return 0
+            for (name, _), column in zip(VALUE_COLUMNS, values):
+                path = self._path(symbol, name)
+                with _open_rw(path) as f:
+                    # Drop the leftovers of an append that died before its timestamps
+                    f.truncate(rows * 8)
+                    f.seek(rows * 8)
+                    f.write(column.tobytes())
+            with _open_rw(self._path(symbol, "timestamp")) as f:
+                f.seek(rows * 8)
+                f.write(timestamp.tobytes())
+        return len(timestamp)
+
+    def stats(self) -> Dict[str, Any]:
+        symbols = self.symbols()
+        return {"root": self.root, "symbols": len(symbols), "bars": sum(self.count(s) for s in symbols)}
+
+
+def _open_rw(path: str):
+    # Read/write without truncating, created if missing
+    return os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+
+
+class _FileLock:
+    # Exclusive flock on ``path`` so workers sharing the directory append one at a time
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+
+class BarBuilder:
+    """Rolls live quotes up into fixed-length bars.
+
+    A bar is closed once a quote for a later period arrives and appended to
+    the store by a writer thread: on_quote runs on the event loop, appends do
+    file I/O and wait for other workers' file locks. close() writes out what
+    is still queued. Quotes don't carry volume, so bars built this way record 0.
+    """
+
+    def __init__(self, store: PriceHistoryStore, seconds: int = 60, clock=time.time):
+        self.store = store
+        self.seconds = seconds
+        self.clock = clock
+        self._open: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._closed: "queue.SimpleQueue[Optional[Tuple[str, List[float]]]]" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, store: PriceHistoryStore) -> "BarBuilder":
+        return cls(store, seconds=int(os.getenv("PRICE_HISTORY_BAR_SECONDS", "60")))
+
+    def on_quote(self, symbol: str, quote: Dict[str, Any]) -> None:
+        price = quote["price"]
+        period = int(self.clock()) // self.seconds * self.seconds
+        with self._lock:
+            bar = self._open.get(symbol)
+            if bar is not None and bar[0] == period:
+                bar[2] = max(bar[2], price)
+                bar[3] = min(bar[3], price)
+                bar[4] = price
+                bar[5] += quote.get("volume", 0.0)
+                return
+            self._open[symbol] = [period, price, price, price, price, quote.get("volume", 0.0)]
+        if bar is not None:
+            self._closed.put((symbol, bar))
+            with self._lock:
+                # Started on first use, and again after close()
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="price-history-writer", daemon=True)
+                    self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._closed.get()
+            if item is None:
+                return
+            symbol, bar = item
+            try:
+                self.store.append(symbol, *bar)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Couldn't record {symbol} bar: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._closed.put(None)
+            writer.join()
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from quote_providers import MAX_QUOTE_BATCH, parse_symbol_list
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """One streaming client.
+
+    Holds only the newest undelivered quote per symbol, so a slow consumer
+    skips stale ticks instead of building up a backlog.
+    """
+
+    __slots__ = ("symbols", "dropped", "_latest", "_ready")
+
+    def __init__(self):
+        self.symbols: Set[str] = set()
+        self.dropped = 0
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._ready = asyncio.Event()
+
+    def push(self, symbol: str, quote: Dict[str, Any]) -> None:
+        if symbol in self._latest:
+            self.dropped += 1
+        self._latest[symbol] = quote
+        self._ready.set()
+
+    async def next_batch(self) -> Dict[str, Dict[str, Any]]:
+        await self._ready.wait()
+        self._ready.clear()
+        batch, self._latest = self._latest, {}
+        return batch
+
+
+class PriceStreamHub:
+    """Fans quote updates out to every subscriber of a symbol.
+
+    Each subscribed symbol has a single background ticker that fetches a
+    quote every ``interval`` seconds and pushes it to all of its subscribers
+    only when it changed. The ticker stops once its last subscriber leaves.
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable[Dict[str, Any]]], interval: float = 1.0):
+        self.fetch = fetch
+        self.interval = interval
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        self._tickers: Dict[str, asyncio.Task] = {}
+        self._last: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_env(cls, fetch: Callable[[str], Awaitable[Dict[str, Any]]]) -> "PriceStreamHub":
+        return cls(fetch, interval=float(os.getenv("STREAM_TICK_INTERVAL", "1")))
+
+    def subscribe(self, subscriber: Subscriber, symbols: Iterable[str]) -> None:
+        for symbol in symbols:
+            if symbol in subscriber.symbols:
+                continue
+            if len(subscriber.symbols) >= MAX_QUOTE_BATCH:
+                raise ValueError(f"At most {MAX_QUOTE_BATCH} symbols per subscriber")
+            subscriber.symbols.add(symbol)
+            self._subscribers.setdefault(symbol, set()).add(subscriber)
+            if symbol in self._last:
+                # Late joiners get the current price right away
+                subscriber.push(symbol, self._last[symbol])
+            if symbol not in self._tickers:
+                self._tickers[symbol] = asyncio.ensure_future(self._tick(symbol))
+
+    def unsubscribe(self, subscriber: Subscriber, symbols: Optional[Iterable[str]] = None) -> None:
+        for symbol in list(subscriber.symbols if symbols is None else symbols):
+            subscriber.symbols.discard(symbol)
+            subscribers = self._subscribers.get(symbol)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[symbol]
+                self._last.pop(symbol, None)
+                ticker = self._tickers.pop(symbol, None)
+                if ticker is not None:
+                    ticker.cancel()
+
+    async def _tick(self, symbol: str) -> None:
+        while symbol in self._subscribers:
+            try:
+                quote = await self.fetch(symbol)
+            except Exception as e:
+                logger.warning(f"Price stream fetch failed for {symbol}: {e}")
+            else:
+                if quote != self._last.get(symbol):
+                    self._last[symbol] = quote
+                    for subscriber in self._subscribers.get(symbol, ()):
+                        subscriber.push(symbol, quote)
+            await asyncio.sleep(self.interval)
+
+    async def close(self) -> None:
+        tickers = list(self._tickers.values())
+        self._tickers.clear()
+        self._subscribers.clear()
+        for ticker in tickers:
+            ticker.cancel()
+        await asyncio.gather(*tickers, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "symbols": len(self._tickers),
+            "subscriptions": sum(len(s) for s in self._subscribers.values()),
+            "interval": self.interval,
+        }
+
+
+def parse_subscription(text: str) -> Dict[str, List[str]]:
+    # {"subscribe": [...], "unsubscribe": [...]} from a websocket client, both
+    # optional. Raises ValueError for anything else.
+    try:
+        message = json.loads(text)
+    except ValueError:
+        raise ValueError("Messages must be JSON")
+    if not isinstance(message, dict):
+        raise ValueError('Expected an object like {"subscribe": ["AAPL"]}')
+    changes = {}
+    for action in ("subscribe", "unsubscribe"):
+        symbols = message.get(action)
+        if not symbols:
+            continue
+        if not isinstance(symbols, list) or not all(isinstance(symbol, str) for symbol in symbols):
+            raise ValueError(f"{action} must be a list of symbols")
+        changes[action] = parse_symbol_list(",".join(symbols))
+    return changes
+
+
+def stream_router(hub: PriceStreamHub, heartbeat: float = 15.0) -> APIRouter:
+    router = APIRouter()
+
+    @router.websocket("/ws/prices")
+    async def stream_prices_ws(websocket: WebSocket):
+        # Clients send {"subscribe": [...]} / {"unsubscribe": [...]} and receive
+        # {"type": "quotes", "quotes": {symbol: quote}} as prices move
+        await websocket.accept()
+        subscriber = Subscriber()
+
+        async def send_updates():
+            while True:
+                batch = await subscriber.next_batch()
+                await websocket.send_json({"type": "quotes", "quotes": batch})
+
+        sender = asyncio.ensure_future(send_updates())
+        try:
+            while True:
+                text = await websocket.receive_text()
+                try:
+                    changes = parse_subscription(text)
+                    if "subscribe" in changes:
+                        hub.subscribe(subscriber, changes["subscribe"])
+                    if "unsubscribe" in changes:
+                        hub.unsubscribe(subscriber, changes["unsubscribe"])
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "detail": str(e)})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+            hub.unsubscribe(subscriber)
+
+    @router.get("/stream/prices")
+    async def stream_prices_sse(symbols: str):
+        # Server-sent events: one "data:" line of {symbol: quote} per update
+        try:
+            wanted = parse_symbol_list(symbols)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        subscriber = Subscriber()
+        hub.subscribe(subscriber, wanted)
+
+        async def events():
+            try:
+                while True:
+                    try:
+                        batch = await asyncio.wait_for(subscriber.next_batch(), timeout=heartbeat)
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+                        continue
+                    yield f"data: {json.dumps(batch)}\n\n"
+            finally:
+                hub.unsubscribe(subscriber)
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    return router
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Union
+
+logger = logging.getLogger(__name__)
+
+
+def parse_ttl_overrides(raw: Optional[str]) -> Dict[str, float]:
+    # "AAPL=2,TSLA=0.5" -> {"AAPL": 2.0, "TSLA": 0.5}
+    overrides = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        symbol, ttl = item.split("=", 1)
+        overrides[symbol.strip().upper()] = float(ttl)
+    return overrides
+
+
+class CacheEntry(NamedTuple):
+    quote: Dict[str, Any]
+    fetched_at: float
+    expires_at: float
+
+
+class QuoteCache:
+    """Shared in-process quote cache in front of a ``QuoteProvider``.
+
+    Quotes expire after a per-symbol TTL and the least recently used symbol is
+    evicted once ``max_entries`` is reached. Concurrent misses for one symbol
+    wait on a single upstream fetch instead of each making their own.
+    """
+
+    def __init__(
+        self,
+        provider: Any,
+        ttl: float = 5.0,
+        max_entries: int = 1024,
+        ttl_overrides: Optional[Dict[str, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.provider = provider
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.ttl_overrides = {k.upper(): v for k, v in (ttl_overrides or {}).items()}
+        self.clock = clock
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loads: Set[asyncio.Task] = set()
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, provider: Any) -> "QuoteCache":
+        return cls(
+            provider,
+            ttl=float(os.getenv("QUOTE_CACHE_TTL", "5")),
+            max_entries=int(os.getenv("QUOTE_CACHE_MAX_ENTRIES", "1024")),
+            ttl_overrides=parse_ttl_overrides(os.getenv("QUOTE_CACHE_TTL_OVERRIDES")),
+        )
+
+    def ttl_for(self, symbol: str) -> float:
+        return self.ttl_overrides.get(symbol.upper(), self.ttl)
+
+    def peek(self, symbol: str, allow_stale: bool = False) -> Optional[CacheEntry]:
+        # Look at a cached entry without counting it or triggering a fetch
+        entry = self._entries.get(symbol.upper())
+        if entry is None:
+            return None
+        if not allow_stale and entry.expires_at <= self.clock():
+            return None
+        return entry
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        # Called on the event loop with (symbol, quote) for every freshly
+        # fetched quote, not for cache hits
+        self._listeners.append(listener)
+
+    def _lookup(self, symbol: str) -> Union[Dict[str, Any], asyncio.Future, None]:
+        # A fresh quote, the future of a fetch already in flight, or None
+        entry = self._entries.get(symbol)
+        if entry is not None and entry.expires_at > self.clock():
+            self._entries.move_to_end(symbol)
+            self.hits += 1
+            return entry.quote
+        pending = self._inflight.get(symbol)
+        if pending is not None:
+            self.coalesced += 1
+        return pending
+
+    def _start(self, symbols: List[str]) -> Dict[str, asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        futures = {symbol: loop.create_future() for symbol in symbols}
+        self._inflight.update(futures)
+        self.misses += len(symbols)
+        task = loop.create_task(self._load(futures))
+        self._loads.add(task)
+        task.add_done_callback(self._loads.discard)
+        return futures
+
+    async def _load(self, futures: Dict[str, asyncio.Future]) -> None:
+        symbols = list(futures)
+        try:
+            if len(symbols) == 1:
+                try:
+                    results = {symbols[0]: await self.provider.get_quote(symbols[0])}
+                except Exception as exc:
+                    results = {symbols[0]: exc}
+            else:
+                results = await self.provider.get_many(symbols)
+        except BaseException as exc:
+            for symbol, future in futures.items():
+                self._inflight.pop(symbol, None)
+                if future.done():
+                    continue
+                if isinstance(exc, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(exc)
+            raise
+
+        now = self.clock()
+        for symbol, future in futures.items():
+            self._inflight.pop(symbol, None)
+            result = results.get(symbol)
+            if result is None:
+                result = LookupError(f"No quote returned for {symbol}")
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+                continue
+            self._entries[symbol] = CacheEntry(result, now, now + self.ttl_for(symbol))
+            self._entries.move_to_end(symbol)
+            future.set_result(result)
+            for listener in self._listeners:
+                try:
+                    listener(symbol, result)
+                except Exception:
+                    logger.exception(f"Quote listener failed for {symbol}")
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, symbol: str) -> Dict[str, Any]:
+        symbol = symbol.upper()
+        found = self._lookup(symbol)
+        if isinstance(found, dict):
+            return found
+        if found is None:
+            found = self._start([symbol])[symbol]
+        # Shield the shared fetch so one cancelled caller doesn't cancel it for
+        # everyone else waiting on the same symbol
+        return await asyncio.shield(found)
+
+    async def get_many(
+        self, symbols: Iterable[str], stale_on_error: bool = True
+    ) -> Dict[str, Any]:
+        # Serve what's cached and fetch the rest in one provider batch. Maps
+        # each distinct symbol to its quote, or to the exception raised
+        # fetching it so one bad symbol doesn't fail the whole batch.
+        unique = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        quotes: Dict[str, Any] = {}
+        pending: Dict[str, asyncio.Future] = {}
+        missing = []
+        for symbol in unique:
+            found = self._lookup(symbol)
+            if isinstance(found, dict):
+                quotes[symbol] = found
+            elif found is not None:
+                pending[symbol] = found
+            else:
+                missing.append(symbol)
+        if missing:
+            pending.update(self._start(missing))
+        if pending:
+            results = await asyncio.gather(
+                *(asyncio.shield(future) for future in pending.values()), return_exceptions=True
+            )
+            quotes.update(zip(pending, results))
+
+        if stale_on_error:
+            for symbol, quote in quotes.items():
+                if isinstance(quote, Exception):
+                    stale = self.peek(symbol, allow_stale=True)
+                    if stale is not None:
+                        quotes[symbol] = stale.quote
+        return {symbol: quotes[symbol] for symbol in unique}
+
+    def invalidate(self, symbol: Optional[str] = None) -> None:
+        if symbol is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(symbol.upper(), None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "inflight": len(self._inflight),
+            "maxEntries": self.max_entries,
+            "ttl": self.ttl,
+            "provider": getattr(self.provider, "name", type(self.provider).__name__),
+        }
@@ -0,0 +1,316 @@
+import asyncio
+import os
+import random
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from metrics import registry
+
+# Static stock data - always works without any API
+STOCK_TABLE = {
+    "AAPL": {"name": "Apple Inc.", "price": 180.75, "change": 1.35},
+    "MSFT": {"name": "Microsoft Corporation", "price": 338.48, "change": 0.89},
+    "GOOGL": {"name": "Alphabet Inc.", "price": 137.12, "change": -0.45},
+    "AMZN": {"name": "Amazon.com Inc.", "price": 127.74, "change": 2.25},
+    "TSLA": {"name": "Tesla Inc.", "price": 237.01, "change": -1.20},
+    "META": {"name": "Meta Platforms Inc.", "price": 324.95, "change": 3.12},
+    "NVDA": {"name": "NVIDIA Corporation", "price": 429.97, "change": 2.37},
+    "NFLX": {"name": "Netflix Inc.", "price": 484.13, "change": -1.54},
+    "PYPL": {"name": "PayPal Holdings Inc.", "price": 63.42, "change": -0.73},
+    "INTC": {"name": "Intel Corporation", "price": 42.32, "change": 0.28},
+}
+
+
+# Most symbols a single batch quote request may ask for
+MAX_QUOTE_BATCH = int(os.getenv("MAX_QUOTE_BATCH", "50"))
+
+QUOTE_LATENCY = registry.histogram(
+    "quote_provider_call_seconds", "Time spent in quote provider calls", ("provider", "call")
+)
+QUOTE_ERRORS = registry.counter(
+    "quote_provider_errors_total", "Quotes a provider failed to return, by error type", ("provider", "error")
+)
+
+
+class QuoteNotFound(LookupError):
+    pass
+
+
+def parse_symbol_list(raw: str, limit: int = MAX_QUOTE_BATCH) -> List[str]:
+    # "aapl, MSFT,aapl" -> ["AAPL", "MSFT"]
+    symbols = list(dict.fromkeys(s.strip().upper() for s in raw.split(",") if s.strip()))
+    if not symbols:
+        raise ValueError("No symbols given")
+    if len(symbols) > limit:
+        raise ValueError(f"At most {limit} symbols per request, got {len(symbols)}")
+    return symbols
+
+
+def split_quote_results(results: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    # Shape a get_many() result for the batch endpoints: failures are reported
+    # per symbol instead of failing the whole request
+    quotes = {}
+    errors = {}
+    for symbol, result in results.items():
+        if isinstance(result, Exception):
+            errors[symbol] = str(result) or type(result).__name__
+        else:
+            quotes[symbol] = result
+    return {"quotes": quotes, "errors": errors}
+
+
+def make_quote(symbol: str, name: str, price: float, change: float) -> Dict[str, Any]:
+    previous = price - change
+    return {
+        "symbol": symbol,
+        "name": name,
+        "price": price,
+        "change": change,
+        "changePercent": round(change / previous * 100, 2) if previous else 0,
+    }
+
+
+class QuoteProvider:
+    """Async source of stock quotes.
+
+    Subclasses implement ``get_quote``. ``get_many`` fetches concurrently by
+    default and maps each symbol to its quote or to the exception raised for
+    it; backends with a real batch call override it.
+    """
+
+    name = "base"
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("QUOTE_FETCH_CONCURRENCY", "8"))
+
+    async def get_quote(self, symbol: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def get_many(self, symbols: Iterable[str]) -> Dict[str, Any]:
+        unique = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        limit = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch_one(symbol: str) -> Dict[str, Any]:
+            async with limit:
+                return await self.get_quote(symbol)
+
+        results = await asyncio.gather(*(fetch_one(s) for s in unique), return_exceptions=True)
+        return dict(zip(unique, results))
+
+    async def close(self) -> None:
+        pass
+
+
+class YFinanceProvider(QuoteProvider):
+    name = "yfinance"
+
+    def _fetch(self, symbol: str) -> Dict[str, Any]:
+        import yfinance as yf
+
+        info = yf.Ticker(symbol).info
+        if not info or "regularMarketPrice" not in info:
+            raise QuoteNotFound(f"Stock {symbol} not found or no data available")
+        return {
+            "symbol": symbol,
+            "name": info.get("longName", symbol),
+            "price": info.get("regularMarketPrice", 0),
+            "change": info.get("regularMarketChange", 0),
+            "changePercent": info.get("regularMarketChangePercent", 0),
+        }
+
+    async def get_quote(self, symbol: str) -> Dict[str, Any]:
+        # yfinance is blocking, keep it off the event loop
+        return await run_in_threadpool(self._fetch, symbol.upper())
+
+
+class StaticTableProvider(QuoteProvider):
+    """Prices from the built-in market simulation, starting at the table's
+    prices. Unknown symbols get a stable made-up price."""
+
+    name = "static"
+
+    def __init__(
+        self,
+        table: Optional[Dict[str, Dict[str, Any]]] = None,
+        latency: float = 0.0,
+        market: Optional[Any] = None,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        # market_sim pulls in numpy, only load it for the provider that uses it
+        from market_sim import MarketSimulator
+
+        self.table = STOCK_TABLE if table is None else table
+        self.latency = latency
+        self.market = market or MarketSimulator.from_env(self.table)
+
+    def _quotes(self, symbols: Iterable[str]) -> Dict[str, Any]:
+        quotes = {}
+        for symbol, (price, change) in self.market.quotes(symbols).items():
+            name = self.table[symbol]["name"] if symbol in self.table else f"{symbol} Inc."
+            quotes[symbol] = make_quote(symbol, name, price, change)
+        return quotes
+
+    async def get_quote(self, symbol: str) -> Dict[str, Any]:
+        if self.latency:
+            # Simulated network delay, without stalling the event loop
+            await asyncio.sleep(self.latency)
+        symbol = symbol.upper()
+        return self._quotes([symbol])[symbol]
+
+    async def get_many(self, symbols: Iterable[str]) -> Dict[str, Any]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._quotes(symbols)
+
+
+class HttpQuoteProvider(QuoteProvider):
+    """Quotes from a running ``mock_stock_api`` (or anything serving its API)."""
+
+    name = "http"
+
+    def __init__(self, base_url: str, timeout: float = 5.0, **kwargs):
+        super().__init__(**kwargs)
+        import requests
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _fetch(self, symbol: str) -> Dict[str, Any]:
+        response = self.session.get(f"{self.base_url}/stock/{symbol}", timeout=self.timeout)
+        if response.status_code == 404:
+            raise QuoteNotFound(f"Stock {symbol} not found")
+        response.raise_for_status()
+        data = response.json()
+        return make_quote(symbol, data.get("name", symbol), data["price"], data.get("change", 0))
+
+    def _fetch_many(self, symbols: List[str]) -> Dict[str, Any]:
+        response = self.session.get(
+            f"{self.base_url}/stocks", params={"symbols": ",".join(symbols)}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        results: Dict[str, Any] = {}
+        for symbol in symbols:
+            if symbol in data["quotes"]:
+                quote = data["quotes"][symbol]
+                results[symbol] = make_quote(symbol, quote.get("name", symbol), quote["price"], quote.get("change", 0))
+            else:
+                results[symbol] = QuoteNotFound(data["errors"].get(symbol, f"Stock {symbol} not found"))
+        return results
+
+    async def get_quote(self, symbol: str) -> Dict[str, Any]:
+        return await run_in_threadpool(self._fetch, symbol.upper())
+
+    async def get_many(self, symbols: Iterable[str]) -> Dict[str, Any]:
+        # One round trip per MAX_QUOTE_BATCH symbols using the batch endpoint,
+        # at most max_concurrency of them at a time
+        unique = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        chunks = [unique[i:i + MAX_QUOTE_BATCH] for i in range(0, len(unique), MAX_QUOTE_BATCH)]
+        limit = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch_chunk(chunk: List[str]) -> Dict[str, Any]:
+            async with limit:
+                return await run_in_threadpool(self._fetch_many, chunk)
+
+        results: Dict[str, Any] = {}
+        for chunk, outcome in zip(chunks, await asyncio.gather(
+            *(fetch_chunk(chunk) for chunk in chunks), return_exceptions=True
+        )):
+            if isinstance(outcome, Exception):
+                results.update((symbol, outcome) for symbol in chunk)
+            else:
+                results.update(outcome)
+        return results
+
+    async def close(self) -> None:
+        self.session.close()
+
+
+class SyntheticProvider(QuoteProvider):
+    """Random-walk prices that are reproducible for a given seed."""
+
+    name = "synthetic"
+
+    def __init__(self, seed: int = 0, volatility: float = 0.002, **kwargs):
+        super().__init__(**kwargs)
+        self.seed = seed
+        self.volatility = volatility
+        self._walks: Dict[str, List[Any]] = {}
+
+    def _quote(self, symbol: str) -> Dict[str, Any]:
+        walk = self._walks.get(symbol)
+        if walk is None:
+            # Every symbol gets its own stream and a stable starting price
+            rng = random.Random(self.seed * 1_000_003 + zlib.crc32(symbol.encode()))
+            base = STOCK_TABLE[symbol]["price"] if symbol in STOCK_TABLE else round(rng.uniform(50, 500), 2)
+            walk = self._walks[symbol] = [rng, base, base]
+        rng, open_price, price = walk
+        price = max(0.01, price * (1 + rng.gauss(0, self.volatility)))
+        walk[2] = price
+        name = STOCK_TABLE[symbol]["name"] if symbol in STOCK_TABLE else f"{symbol} Inc."
+        return make_quote(symbol, name, round(price, 2), round(price - open_price, 2))
+
+    async def get_quote(self, symbol: str) -> Dict[str, Any]:
+        return self._quote(symbol.upper())
+
+    async def get_many(self, symbols: Iterable[str]) -> Dict[str, Any]:
+        return {symbol: self._quote(symbol) for symbol in dict.fromkeys(s.upper() for s in symbols)}
+
+
+class MeteredProvider(QuoteProvider):
+    """Another provider with its call latency and errors recorded for /metrics."""
+
+    def __init__(self, inner: QuoteProvider):
+        self.inner = inner
+        self.name = inner.name
+        self.max_concurrency = inner.max_concurrency
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.inner, attr)
+
+    async def _timed(self, call: str, fetch):
+        started = time.perf_counter()
+        try:
+            return await fetch
+        except Exception as exc:
+            QUOTE_ERRORS.inc(self.name, type(exc).__name__)
+            raise
+        finally:
+            QUOTE_LATENCY.observe(time.perf_counter() - started, self.name, call)
+
+    async def get_quote(self, symbol: str) -> Dict[str, Any]:
+        return await self._timed("quote", self.inner.get_quote(symbol))
+
+    async def get_many(self, symbols: Iterable[str]) -> Dict[str, Any]:
+        results = await self._timed("batch", self.inner.get_many(symbols))
+        for result in results.values():
+            if isinstance(result, Exception):
+                QUOTE_ERRORS.inc(self.name, type(result).__name__)
+        return results
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+
+def build_provider(name: Optional[str] = None, default: str = "yfinance") -> QuoteProvider:
+    # Pick the quote backend from QUOTE_PROVIDER, falling back to the app's default
+    name = (name or os.getenv("QUOTE_PROVIDER") or default).lower()
+    if name == "yfinance":
+        provider: QuoteProvider = YFinanceProvider()
+    elif name == "static":
+        provider = StaticTableProvider(latency=float(os.getenv("STATIC_QUOTE_LATENCY", "0.1")))
+    elif name == "http":
+        provider = HttpQuoteProvider(
+            os.getenv("QUOTE_API_URL", "http://127.0.0.1:8000"),
+            timeout=float(os.getenv("QUOTE_API_TIMEOUT", "5")),
+        )
+    elif name == "synthetic":
+        provider = SyntheticProvider(seed=int(os.getenv("SYNTHETIC_SEED", "0")))
+    else:
+        raise ValueError(f"Unknown quote provider: {name}")
+    return MeteredProvider(provider)
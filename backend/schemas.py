@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -43,6 +43,18 @@ class TradeBase(BaseModel):
 class TradeRequest(TradeBase):
     user_id: int
 
+class BatchTradeRequest(BaseModel):
+    user_id: int
+    orders: List[TradeBase]
+    mode: str = "atomic"  # "atomic" or "best_effort"
+
+class OrderRequest(TradeBase):
+    user_id: int
+    order_type: str  # "limit", "stop" or "stop_limit"
+    # A sell limit at 0 would fill at any price, a buy limit below 0 never
+    limit_price: Optional[float] = Field(None, gt=0)
+    stop_price: Optional[float] = Field(None, gt=0)
+
 class TradeResponse(BaseModel):
     message: str
     new_balance: float
@@ -56,9 +68,16 @@ class Trade(TradeBase):
     class Config:
         from_attributes = True
 
+class PortfolioTimings(BaseModel):
+    fetchMs: float
+    computeMs: float
+    symbols: int
+    queries: int
+
 class PortfolioResponse(BaseModel):
     cash: float
     positions: List[PositionResponse]
+    timings: Optional[PortfolioTimings] = None  # only with ?debug=true
 
 class StockPrice(BaseModel):
     symbol: str
@@ -67,6 +86,10 @@ class StockPrice(BaseModel):
     change: float
     changePercent: float
 
+class BatchQuoteResponse(BaseModel):
+    quotes: Dict[str, StockPrice]
+    errors: Dict[str, str]
+
 class TradeHistoryResponse(BaseModel):
     id: int
     symbol: str
@@ -74,4 +97,18 @@ class TradeHistoryResponse(BaseModel):
     quantity: float
     price: float
     total: float
-    timestamp: datetime 
\ No newline at end of file
+    timestamp: datetime 
+
+class TradeTotals(BaseModel):
+    count: int
+    buyCount: int
+    sellCount: int
+    totalBought: float
+    totalSold: float
+    firstTrade: Optional[datetime]
+    lastTrade: Optional[datetime]
+
+class TradeHistoryPage(BaseModel):
+    trades: List[TradeHistoryResponse]
+    nextCursor: Optional[str]
+    totals: Optional[TradeTotals]  # first page only
@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import MetaData
+from sqlalchemy.orm import sessionmaker
+
+# The app modules read their settings on import, and pytest loads this file
+# before any test module imports them
+_workdir = tempfile.mkdtemp(prefix="stock_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'stock_simulator.db')}"
+os.environ["PRICE_HISTORY_DIR"] = os.path.join(_workdir, "price_history")
+os.environ["QUOTE_PROVIDER"] = "synthetic"
+os.environ["APP_ENV"] = "test"
+os.environ.pop("DB_AUTO_MIGRATE", None)
+os.environ.pop("TRADE_JOURNAL_PATH", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def empty_db():
+    # main.py's database with every table dropped
+    from database import engine
+
+    existing = MetaData()
+    existing.reflect(engine)
+    existing.drop_all(engine)
+    return engine
+
+
+@pytest.fixture
+def app_db(empty_db):
+    # main.py's database, migrated to the latest schema
+    import migrations
+
+    migrations.upgrade(empty_db)
+    return empty_db
+
+
+@pytest.fixture
+def stock_app_db(tmp_path, monkeypatch):
+    # my_stock_app on a database of its own; its tables share names with
+    # main.py's
+    import my_stock_app
+    from db_engine import make_engine
+
+    engine = make_engine(f"sqlite:///{tmp_path / 'my_stock_game.db'}")
+    my_stock_app.upgrade_my_tables(engine)
+    monkeypatch.setattr(my_stock_app, "engine", engine)
+    monkeypatch.setattr(my_stock_app, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    yield my_stock_app.SessionLocal
+    engine.dispose()
@@ -0,0 +1,133 @@
+import random
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from account_store import AccountStore, _IntTable
+
+
+class DictStore:
+    # The plain dicts AccountStore replaced
+    def __init__(self, starting_cash=10000.0):
+        self.starting_cash = starting_cash
+        self.accounts = {}
+
+    def _account(self, user_id):
+        return self.accounts.setdefault(user_id, {"cash": self.starting_cash, "positions": {}})
+
+    def buy(self, user_id, symbol, quantity, price):
+        account = self._account(user_id)
+        total = price * quantity
+        if account["cash"] < total:
+            raise ValueError("Not enough cash for this trade")
+        account["cash"] -= total
+        held, average = account["positions"].get(symbol, (0, 0.0))
+        account["positions"][symbol] = (held + quantity, (held * average + total) / (held + quantity))
+        return account["cash"]
+
+    def sell(self, user_id, symbol, quantity, price):
+        account = self._account(user_id)
+        held, average = account["positions"].get(symbol, (0, 0.0))
+        if held < quantity:
+            raise ValueError("Not enough shares to sell")
+        account["cash"] += price * quantity
+        if held == quantity:
+            del account["positions"][symbol]
+        else:
+            account["positions"][symbol] = (held - quantity, average)
+        return account["cash"]
+
+    def portfolio(self, user_id):
+        account = self._account(user_id)
+        return account["cash"], account["positions"]
+
+
+def as_dicts(store, user_id):
+    portfolio = store.portfolio(user_id)
+    positions = {p["symbol"]: (p["quantity"], p["average_price"]) for p in portfolio["positions"]}
+    return portfolio["cash"], positions
+
+
+def random_trades(stores, rng, trades=3000, users=40, symbols=("AAPL", "MSFT", "TSLA", "NVDA", "META")):
+    for _ in range(trades):
+        user_id, symbol = rng.randrange(users), rng.choice(symbols)
+        price = rng.randrange(4, 400) / 4
+        # Sells often empty a position exactly
+        action, quantity = rng.choice((("buy", rng.randrange(1, 20)), ("sell", rng.randrange(1, 20))))
+        outcomes = []
+        for store in stores:
+            try:
+                outcomes.append(getattr(store, action)(user_id, symbol, quantity, price))
+            except ValueError:
+                outcomes.append(None)
+        assert outcomes.count(outcomes[0]) == len(outcomes)
+    return range(users)
+
+
+def test_int_table_matches_a_dict_through_deletes_and_reinserts():
+    rng = random.Random(11)
+    table, expected = _IntTable(), {}
+    # Few keys, many operations: probe chains full of tombstones
+    keys = [rng.randrange(-2 ** 62, 2 ** 62) for _ in range(200)]
+    for step in range(20000):
+        key = rng.choice(keys)
+        if rng.random() < 0.5:
+            table.put(key, step)
+            expected[key] = step
+        else:
+            assert table.pop(key) == expected.pop(key, None)
+        if step % 2500 == 0:
+            assert all(table.get(k) == expected.get(k) for k in keys)
+    assert len(table) == len(expected)
+    assert all(table.get(k) == expected.get(k) for k in keys)
+
+
+def test_int_table_bulk_insert_matches_put():
+    keys = np.arange(0, 5000 * 7, 7, dtype=np.int64)
+    bulk, one_by_one = _IntTable(), _IntTable()
+    bulk.insert_new(keys[:100], keys[:100] + 1)
+    bulk.insert_new(keys[100:], keys[100:] + 1)
+    for key in keys.tolist():
+        one_by_one.put(key, key + 1)
+    assert len(bulk) == len(one_by_one) == len(keys)
+    assert all(bulk.get(key) == key + 1 for key in keys.tolist())
+    assert bulk.get(3) is None
+
+
+def test_trades_match_plain_dicts():
+    store, reference = AccountStore(), DictStore()
+    for user_id in random_trades((store, reference), random.Random(5)):
+        assert as_dicts(store, user_id) == reference.portfolio(user_id)
+    assert store.stats()["positions"] == sum(len(a["positions"]) for a in reference.accounts.values())
+
+
+def test_snapshot_round_trip(tmp_path):
+    store, reference = AccountStore(starting_cash=5000.0), DictStore(5000.0)
+    users = random_trades((store, reference), random.Random(9))
+    path = str(tmp_path / "accounts.npz")
+    store.save(path)
+    loaded = AccountStore.load(path)
+
+    assert loaded.stats() == {**store.stats(), "bytes": loaded.stats()["bytes"]}
+    for user_id in users:
+        assert loaded.portfolio(user_id) == store.portfolio(user_id)
+    # The reloaded store keeps trading like the original, including
+    # positions opened and closed again after the reload
+    for user_id in random_trades((loaded, reference), random.Random(10)):
+        assert as_dicts(loaded, user_id) == reference.portfolio(user_id)
+    assert loaded.portfolio(1000)["cash"] == 5000.0
+
+
+def test_mock_api_rejects_unknown_trade_type_and_saves_on_shutdown(tmp_path, monkeypatch):
+    import mock_stock_api
+
+    path = str(tmp_path / "accounts.npz")
+    monkeypatch.setattr(mock_stock_api, "accounts", AccountStore())
+    monkeypatch.setattr(mock_stock_api, "SNAPSHOT_PATH", path)
+    with TestClient(mock_stock_api.app) as client:
+        trade = {"user_id": 1, "symbol": "AAPL", "quantity": 2, "trade_type": "HOLD"}
+        rejected = client.post("/make-trade", json=trade)
+        assert rejected.status_code == 400
+        assert client.post("/make-trade", json={**trade, "trade_type": "BUY"}).status_code == 200
+    saved = AccountStore.load(path).portfolio(1)
+    assert [(p["symbol"], p["quantity"]) for p in saved["positions"]] == [("AAPL", 2)]
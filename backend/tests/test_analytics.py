@@ -0,0 +1,31 @@
+from fastapi.testclient import TestClient
+
+
+def test_analytics_pick_up_trades_from_other_processes(app_db):
+    import main
+    from database import SessionLocal
+    from trading import STARTING_CASH, execute_market_order, get_or_create_portfolio
+
+    db = SessionLocal()
+    get_or_create_portfolio(db, 1)
+    execute_market_order(db, 1, "AAPL", "buy", 2.0, 100.0)
+    db.close()
+
+    with TestClient(main.create_app()) as client:
+        first = client.get("/portfolio-analytics/1", params={"series": False}).json()
+        assert first["cash"] == STARTING_CASH - 200.0
+        client.get("/portfolio-analytics/1")
+        assert client.get("/analytics-cache/stats").json()["updates"] == 0
+
+        # Written like another worker or the journal would: this process's
+        # analytics hear nothing about it
+        db = SessionLocal()
+        execute_market_order(db, 1, "AAPL", "sell", 1.0, 150.0)
+        db.close()
+
+        second = client.get("/portfolio-analytics/1", params={"series": False}).json()
+        stats = client.get("/analytics-cache/stats").json()
+    assert second["cash"] == STARTING_CASH - 50.0
+    assert second["realizedPnl"] == 50.0
+    assert [(row["symbol"], row["quantity"]) for row in second["bySymbol"]] == [("AAPL", 1.0)]
+    assert (stats["builds"], stats["updates"]) == (1, 1)
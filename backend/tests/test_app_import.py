@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_main_builds_nothing():
+    code = (
+        "import sys, main, trading\n"
+        "assert main.quote_cache is None and main.trade_ledger is None\n"
+        "assert not trading.portfolio_listeners and trading.write_barrier is None\n"
+        "assert 'numpy' not in sys.modules, 'numpy imported'\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND, check=True)
+
+
+def test_lifespan_unwires_its_hooks(app_db):
+    import main
+    import trading
+    from metrics import registry
+
+    collectors = len(registry._collectors)
+    with TestClient(main.create_app()) as client:
+        assert client.get("/").status_code == 200
+        assert main.leaderboard.mark_dirty in trading.portfolio_listeners
+    assert trading.portfolio_listeners == []
+    assert len(registry._collectors) == collectors
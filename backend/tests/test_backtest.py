@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+import backtest
+from backtest import average_cost, run_backtest
+from trading import TradeRejected, apply_fill
+
+
+def reference_backtest(prices, orders, cash):
+    # The same simulation as a plain loop over apply_fill
+    bars, width = prices.shape
+    held, average = [0.0] * width, [0.0] * width
+    cash_path, positions, averages = [], [], []
+    rejected = np.zeros(orders.shape, dtype=bool)
+    for t in range(bars):
+        for s in range(width):
+            quantity = orders[t, s]
+            if not quantity:
+                continue
+            action = "buy" if quantity > 0 else "sell"
+            try:
+                cash, held[s], average[s] = apply_fill(cash, held[s], average[s], action, abs(quantity), prices[t, s])
+            except TradeRejected:
+                rejected[t, s] = True
+        cash_path.append(cash)
+        positions.append(list(held))
+        averages.append(list(average))
+    return np.array(cash_path), np.array(positions), np.array(averages), rejected
+
+
+@pytest.mark.parametrize("block_bars, max_passes", [(4096, 4), (7, 1), (16, 3)])
+def test_matches_a_plain_loop(monkeypatch, block_bars, max_passes):
+    # Small blocks and few passes also exercise the block seams and the
+    # order-by-order fallback
+    monkeypatch.setattr(backtest, "BLOCK_BARS", block_bars)
+    monkeypatch.setattr(backtest, "MAX_PASSES", max_passes)
+    rng = np.random.default_rng(3)
+    bars, width = 300, 3
+    # Quarter prices and whole shares keep every balance exact
+    prices = rng.integers(40, 400, size=(bars, width)) / 4
+    orders = rng.integers(-6, 7, size=(bars, width)).astype(float)
+    orders[rng.random((bars, width)) < 0.3] = 0.0
+
+    result = run_backtest(prices, orders, cash=2000.0)
+    cash, positions, averages, rejected = reference_backtest(prices, orders, 2000.0)
+
+    assert result["summary"]["rejected"] > 0
+    np.testing.assert_array_equal(result["cash"], cash)
+    np.testing.assert_array_equal(result["positions"], positions)
+    skipped = np.column_stack([result["rejected"]["bar"], result["rejected"]["symbol"]])
+    np.testing.assert_array_equal(skipped, np.argwhere(rejected))
+    np.testing.assert_allclose(result["averagePrice"], averages)
+    np.testing.assert_allclose(result["equity"], cash + (positions * prices).sum(axis=1))
+
+
+def test_sell_to_zero_and_buy_again():
+    prices = [10.0, 20.0, 30.0, 40.0, 50.0, 60.0]
+    orders = [2.0, 2.0, -4.0, -1.0, 3.0, 1.0]
+    result = run_backtest(prices, orders, cash=100.0)
+
+    # The sell from flat at bar 3 is rejected, the buy at bar 4 starts a new
+    # average from its own price and the one at bar 5 can't be paid for
+    assert result["positions"].tolist() == [2.0, 4.0, 0.0, 0.0, 3.0, 3.0]
+    assert result["averagePrice"].tolist() == [10.0, 15.0, 15.0, 15.0, 50.0, 50.0]
+    assert result["cash"].tolist() == [80.0, 40.0, 160.0, 160.0, 10.0, 10.0]
+    assert result["rejected"]["bar"].tolist() == [3, 5]
+    assert result["summary"]["trades"] == 4
+
+
+def test_buy_with_exactly_the_cash_left():
+    result = run_backtest([25.0, 25.0], [4.0, 1.0], cash=100.0)
+    assert result["positions"].tolist() == [4.0, 4.0]
+    assert result["cash"].tolist() == [0.0, 0.0]
+    assert result["rejected"]["bar"].tolist() == [1]
+
+
+def test_average_cost_matches_running_average():
+    rng = np.random.default_rng(5)
+    fills = rng.integers(1, 5, size=50).astype(float)
+    prices = rng.uniform(10, 20, size=50)
+    before = np.concatenate(([0.0], np.cumsum(fills)[:-1]))
+    expected, average, held = [], 0.0, 0.0
+    for fill, price in zip(fills, prices):
+        average = (average * held + price * fill) / (held + fill)
+        held += fill
+        expected.append(average)
+    np.testing.assert_allclose(average_cost(before, fills, prices), expected)
@@ -0,0 +1,83 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+
+def test_portfolio_etag_follows_database_version(app_db):
+    import main
+    import models
+    from database import SessionLocal
+    from trading import execute_market_order, get_or_create_portfolio
+
+    db = SessionLocal()
+    get_or_create_portfolio(db, 1)
+    execute_market_order(db, 1, "AAPL", "buy", 1.0, 100.0)
+    db.close()
+
+    with TestClient(main.create_app()) as client:
+        first = client.get("/my-portfolio/1")
+        etag = first.headers["ETag"]
+        assert client.get("/my-portfolio/1", headers={"If-None-Match": etag}).status_code == 304
+
+        # A write from another worker runs none of this process's listeners
+        db = SessionLocal()
+        db.execute(
+            update(models.Portfolio)
+            .where(models.Portfolio.user_id == 1)
+            .values(cash=models.Portfolio.cash - 1, version=models.Portfolio.version + 1)
+        )
+        db.commit()
+        db.close()
+
+        changed = client.get("/my-portfolio/1", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["cash"] == first.json()["cash"] - 1
+
+
+def test_stock_app_quote_not_modified_without_fetching(stock_app_db, monkeypatch):
+    import my_stock_app
+
+    fetched = []
+    provider = my_stock_app.quote_cache.provider
+    real_get_quote = provider.get_quote
+
+    async def counting_get_quote(symbol):
+        fetched.append(symbol)
+        return await real_get_quote(symbol)
+
+    monkeypatch.setattr(my_stock_app.quote_cache, "ttl", 60.0)
+    monkeypatch.setattr(provider, "get_quote", counting_get_quote)
+    with TestClient(my_stock_app.my_app) as client:
+        first = client.get("/stock/aapl")
+        assert first.status_code == 200
+        again = client.get("/stock/AAPL", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == first.headers["ETag"]
+    assert fetched == ["AAPL"]
+
+
+def test_stock_app_portfolio_etag_follows_database_version(stock_app_db, monkeypatch):
+    import http_cache
+    import my_stock_app
+    from my_data_classes import Portfolio
+
+    with TestClient(my_stock_app.my_app) as client:
+        first = client.get("/my-portfolio/7")
+        etag = first.headers["ETag"]
+        # Tags come from the database only, so a restart doesn't change them
+        monkeypatch.setattr(http_cache, "BOOT_ID", "restarted")
+        assert client.get("/my-portfolio/7", headers={"If-None-Match": etag}).status_code == 304
+
+        # A trade from another copy of the app
+        db = stock_app_db()
+        db.execute(
+            update(Portfolio).where(Portfolio.user_id == 7)
+            .values(cash=Portfolio.cash - 1, version=Portfolio.version + 1)
+        )
+        db.commit()
+        db.close()
+
+        changed = client.get("/my-portfolio/7", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["cash"] == first.json()["cash"] - 1
@@ -0,0 +1,31 @@
+from leaderboard import Leaderboard
+
+
+def test_quotes_are_applied_in_batches():
+    board = Leaderboard(rebuild_fraction=1.0)
+    board.set_holdings([
+        (1, 500.0, {"AAPL": (10.0, 100.0)}),
+        (2, 1500.0, {"MSFT": (1.0, 300.0)}),
+        (3, 1900.0, {}),
+    ])
+    assert [row["userId"] for row in board.top()] == [3, 2, 1]
+    updates = board.updates
+
+    # Every fetched quote only notes the latest price
+    for price in (150.0, 180.0, 200.0):
+        board.on_price("AAPL", price)
+    board.on_price("MSFT", 50.0)
+    assert board.updates == updates
+    assert board.rank(1)["equity"] == 1500.0
+    assert board.stats()["pendingPrices"] == 2
+
+    assert board.apply_prices() == 2
+    # Users 1 and 2 revalued once each, 3 holds nothing
+    assert board.updates == updates + 2
+    assert board.stats()["pendingPrices"] == 0
+    assert board.top() == [
+        {"rank": 1, "userId": 1, "equity": 2500.0},
+        {"rank": 2, "userId": 3, "equity": 1900.0},
+        {"rank": 3, "userId": 2, "equity": 1550.0},
+    ]
+    assert board.apply_prices() == 0
@@ -0,0 +1,26 @@
+import time
+
+from market_sim import MAX_CATCH_UP_TICKS, MarketSimulator
+
+
+def test_long_advance_is_one_leap():
+    market = MarketSimulator({"AAPL": {"price": 100.0}}, seed=3, speed=0)
+    market.quote("AAPL")
+    started = time.perf_counter()
+    assert market.advance(10_000_000) == 10_000_000
+    assert time.perf_counter() - started < 0.5
+    price, _ = market.quote("AAPL")
+    assert price > 0
+
+    again = MarketSimulator({"AAPL": {"price": 100.0}}, seed=3, speed=0)
+    again.quote("AAPL")
+    again.advance(10_000_000)
+    assert again.quote("AAPL")[0] == price
+
+
+def test_short_advance_follows_the_path():
+    market = MarketSimulator(seed=3, speed=0)
+    market.quote("AAPL")
+    market.advance(MAX_CATCH_UP_TICKS)
+    path = MarketSimulator(seed=3, speed=0).path(["AAPL"], 0, MAX_CATCH_UP_TICKS + 1)
+    assert abs(market.quote("AAPL")[0] - path[-1, 0]) < 0.01
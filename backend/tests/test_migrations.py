@@ -0,0 +1,230 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+import migrations
+import models
+
+# What create_all made from the original models.py, on SQLite
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER NOT NULL, username VARCHAR, email VARCHAR, hashed_password VARCHAR, PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE INDEX ix_users_id ON users (id);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE TABLE portfolios (
+    id INTEGER NOT NULL, user_id INTEGER, cash FLOAT,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id)
+);
+CREATE INDEX ix_portfolios_id ON portfolios (id);
+CREATE TABLE positions (
+    id INTEGER NOT NULL, portfolio_id INTEGER, symbol VARCHAR, quantity FLOAT, average_price FLOAT,
+    PRIMARY KEY (id), FOREIGN KEY(portfolio_id) REFERENCES portfolios (id)
+);
+CREATE INDEX ix_positions_id ON positions (id);
+CREATE INDEX ix_positions_symbol ON positions (symbol);
+CREATE TABLE trades (
+    id INTEGER NOT NULL, portfolio_id INTEGER, symbol VARCHAR, quantity FLOAT, price FLOAT,
+    trade_type VARCHAR, timestamp DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(portfolio_id) REFERENCES portfolios (id)
+);
+CREATE INDEX ix_trades_symbol ON trades (symbol);
+CREATE INDEX ix_trades_id ON trades (id);
+"""
+TRADES = 250
+STARTED = datetime(2024, 1, 2, 14, 30)
+
+
+@pytest.fixture
+def baseline_db(empty_db):
+    # The app's database as the original code left it: two portfolios for
+    # user 1 (an old get-or-create race), a position split over two rows and
+    # a trade history without sequence numbers, inserted out of time order
+    with empty_db.begin() as conn:
+        for statement in BASELINE_SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(text(statement))
+        conn.execute(text("INSERT INTO portfolios (id, user_id, cash) VALUES (1, 1, 9800.0), (2, 1, 10000.0)"))
+        conn.execute(text(
+            "INSERT INTO positions (portfolio_id, symbol, quantity, average_price) "
+            "VALUES (1, 'AAPL', 1.0, 100.0), (1, 'AAPL', 1.0, 100.0)"
+        ))
+        conn.execute(
+            text(
+                "INSERT INTO trades (portfolio_id, symbol, quantity, price, trade_type, timestamp) "
+                "VALUES (1, 'AAPL', 1.0, 100.0, :trade_type, :timestamp)"
+            ),
+            [
+                {"trade_type": "SELL" if i % 2 else "BUY", "timestamp": STARTED + timedelta(seconds=i)}
+                for i in reversed(range(TRADES))
+            ],
+        )
+    return empty_db
+
+
+def test_upgrade_baseline_database(baseline_db):
+    assert migrations.current_version(baseline_db) == 0
+    assert migrations.upgrade(baseline_db) == [version for version, _, _ in migrations.MIGRATIONS]
+    assert migrations.check(baseline_db) == migrations.LATEST
+    assert migrations.upgrade(baseline_db) == []
+
+    with baseline_db.connect() as conn:
+        assert conn.execute(text("SELECT id, user_id FROM portfolios ORDER BY id")).all() == [(1, 1), (2, None)]
+        assert conn.execute(text("SELECT symbol, quantity, average_price FROM positions")).all() == [
+            ("AAPL", 2.0, 100.0)
+        ]
+        numbered = conn.execute(text("SELECT seq FROM trades ORDER BY timestamp, id")).scalars().all()
+        assert numbered == list(range(1, TRADES + 1))
+        assert conn.execute(text("SELECT trade_count, version FROM portfolios WHERE id = 1")).one() == (TRADES, 0)
+        checkpoints = conn.execute(text("SELECT seq, cash FROM portfolio_checkpoints ORDER BY seq")).all()
+        assert checkpoints == [(100, 10000.0), (200, 10000.0)]
+
+
+def test_upgraded_database_serves_requests(baseline_db):
+    import main
+
+    migrations.upgrade(baseline_db)
+    with TestClient(main.create_app()) as client:
+        response = client.get("/my-portfolio/1")
+        assert response.status_code == 200
+        assert response.json()["cash"] == 9800.0
+
+        response = client.post("/trade", json={"user_id": 1, "symbol": "AAPL", "action": "sell", "quantity": 1})
+        assert response.status_code == 200, response.text
+
+        response = client.get("/portfolio-at/1", params={"at": (STARTED + timedelta(seconds=150)).isoformat()})
+        assert response.status_code == 200
+        assert response.json()["tradeCount"] == 151
+        assert response.json()["replayed"] == 51
+
+        response = client.get("/trade-history/1", params={"limit": 1})
+        assert response.status_code == 200
+        assert response.json()["totals"]["count"] == TRADES + 1
+
+
+def test_migrated_schema_matches_models(tmp_path):
+    migrated = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    created = create_engine(f"sqlite:///{tmp_path / 'created.db'}")
+    migrations.upgrade(migrated)
+    models.Base.metadata.create_all(created)
+    assert _shape(migrated, models.Base.metadata) == _shape(created, models.Base.metadata)
+
+
+def _shape(engine, metadata):
+    # Columns, unique column sets and other indexes of metadata's tables
+    inspector = inspect(engine)
+    tables = {}
+    for name in metadata.tables:
+        unique = {tuple(info["column_names"]) for info in inspector.get_unique_constraints(name)}
+        unique |= {tuple(info["column_names"]) for info in inspector.get_indexes(name) if info["unique"]}
+        tables[name] = (
+            {(info["name"], str(info["type"]), info["nullable"]) for info in inspector.get_columns(name)},
+            unique,
+            {tuple(info["column_names"]) for info in inspector.get_indexes(name) if not info["unique"]},
+        )
+    return tables
+
+
+# What create_all made from the original my_data_classes.py, on SQLite
+MY_STOCK_APP_BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER NOT NULL, username VARCHAR, email VARCHAR, password VARCHAR, PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE INDEX ix_users_id ON users (id);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE TABLE portfolios (
+    id INTEGER NOT NULL, user_id INTEGER, cash FLOAT,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id)
+);
+CREATE INDEX ix_portfolios_id ON portfolios (id);
+CREATE TABLE stocks_owned (
+    id INTEGER NOT NULL, portfolio_id INTEGER, symbol VARCHAR, quantity FLOAT, average_price FLOAT,
+    PRIMARY KEY (id), FOREIGN KEY(portfolio_id) REFERENCES portfolios (id)
+);
+CREATE INDEX ix_stocks_owned_symbol ON stocks_owned (symbol);
+CREATE INDEX ix_stocks_owned_id ON stocks_owned (id);
+CREATE TABLE trading_history (
+    id INTEGER NOT NULL, portfolio_id INTEGER, symbol VARCHAR, quantity FLOAT, price FLOAT,
+    trade_type VARCHAR, "when" DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(portfolio_id) REFERENCES portfolios (id)
+);
+CREATE INDEX ix_trading_history_id ON trading_history (id);
+CREATE INDEX ix_trading_history_symbol ON trading_history (symbol);
+"""
+
+
+@pytest.fixture
+def my_stock_app_baseline(tmp_path, monkeypatch):
+    # my_stock_app's database before it had migrations, with the duplicates
+    # its get-or-create and first-buy races could leave behind
+    import my_stock_app
+    from sqlalchemy.orm import sessionmaker
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'my_stock_game.db'}")
+    with engine.begin() as conn:
+        for statement in MY_STOCK_APP_BASELINE_SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(text(statement))
+        conn.execute(text("INSERT INTO portfolios (id, user_id, cash) VALUES (1, 7, 9700.0), (2, 7, 10000.0)"))
+        conn.execute(text(
+            "INSERT INTO stocks_owned (portfolio_id, symbol, quantity, average_price) "
+            "VALUES (1, 'AAPL', 1.0, 100.0), (1, 'AAPL', 2.0, 100.0)"
+        ))
+    monkeypatch.setattr(my_stock_app, "engine", engine)
+    monkeypatch.setattr(my_stock_app, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_my_stock_app_baseline(my_stock_app_baseline):
+    engine = my_stock_app_baseline
+    steps = migrations.MY_STOCK_APP_MIGRATIONS
+    versions = migrations.my_stock_app_version
+    assert migrations.upgrade(engine, steps=steps, versions=versions) == [version for version, _, _ in steps]
+    assert migrations.upgrade(engine, steps=steps, versions=versions) == []
+    assert migrations.current_version(engine, versions) == steps[-1][0]
+    # main.py's own version table is untouched
+    assert migrations.current_version(engine) == 0
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id, user_id, version FROM portfolios ORDER BY id")).all() == [
+            (1, 7, 0), (2, None, 0)
+        ]
+        assert conn.execute(text("SELECT symbol, quantity, average_price FROM stocks_owned")).all() == [
+            ("AAPL", 3.0, 100.0)
+        ]
+    with pytest.raises(IntegrityError), engine.begin() as conn:
+        conn.execute(text("INSERT INTO portfolios (user_id, cash, version) VALUES (7, 1.0, 0)"))
+    with pytest.raises(IntegrityError), engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO stocks_owned (portfolio_id, symbol, quantity, average_price) VALUES (1, 'AAPL', 1.0, 1.0)"
+        ))
+
+
+def test_upgraded_my_stock_app_serves_requests(my_stock_app_baseline):
+    import my_stock_app
+
+    with TestClient(my_stock_app.my_app) as client:
+        response = client.get("/my-portfolio/7")
+        assert response.status_code == 200
+        assert response.json()["cash"] == 9700.0
+
+        response = client.post("/make-trade", json={"user_id": 7, "symbol": "AAPL", "quantity": 1, "trade_type": "SELL"})
+        assert response.status_code == 200, response.text
+    with my_stock_app_baseline.connect() as conn:
+        assert conn.execute(text("SELECT version FROM portfolios WHERE id = 1")).scalar() == 1
+
+
+def test_migrated_my_stock_app_schema_matches_models(tmp_path):
+    from my_data_classes import Base
+
+    migrated = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    created = create_engine(f"sqlite:///{tmp_path / 'created.db'}")
+    migrations.upgrade(migrated, steps=migrations.MY_STOCK_APP_MIGRATIONS, versions=migrations.my_stock_app_version)
+    Base.metadata.create_all(created)
+    assert _shape(migrated, Base.metadata) == _shape(created, Base.metadata)
@@ -0,0 +1,82 @@
+from fastapi.testclient import TestClient
+
+from order_book import BookOrder, OrderBook
+
+
+def limit(id, side, price):
+    return BookOrder(id, 1, "AAPL", side, "LIMIT", 1.0, limit_price=price)
+
+
+def stop(id, side, price, limit_price=None):
+    order_type = "STOP" if limit_price is None else "STOP_LIMIT"
+    return BookOrder(id, 1, "AAPL", side, order_type, 1.0, limit_price=limit_price, stop_price=price)
+
+
+def ids(orders):
+    return [order.id for order in orders]
+
+
+def test_limits_fill_in_price_time_priority():
+    book = OrderBook()
+    book.load([limit(1, "BUY", 100.0), limit(2, "BUY", 101.0), limit(3, "BUY", 100.0), limit(4, "BUY", 98.0)])
+    book.load([limit(5, "SELL", 103.0), limit(6, "SELL", 102.0)])
+    assert book.on_price("AAPL", 101.5) == ([], [])
+    # Best price first, then whoever came first at that price
+    fills, _ = book.on_price("AAPL", 99.0)
+    assert ids(fills) == [2, 1, 3]
+    fills, _ = book.on_price("AAPL", 103.0)
+    assert ids(fills) == [6, 5]
+    assert book.stats() == {"symbols": 1, "openOrders": 1}
+
+
+def test_stops_trigger_once_crossed():
+    book = OrderBook()
+    book.load([stop(1, "BUY", 105.0), stop(2, "SELL", 95.0)])
+    assert book.on_price("AAPL", 100.0) == ([], [])
+    fills, triggered = book.on_price("AAPL", 105.0)
+    assert (ids(fills), triggered) == ([1], [])
+    fills, triggered = book.on_price("AAPL", 94.0)
+    assert (ids(fills), triggered) == ([2], [])
+    assert book.symbols() == []
+
+
+def test_stop_limit_rests_as_a_limit_after_triggering():
+    book = OrderBook()
+    book.add(stop(1, "BUY", 105.0, limit_price=104.0))
+    fills, triggered = book.on_price("AAPL", 106.0)
+    assert (fills, ids(triggered)) == ([], [1])
+    assert triggered[0].triggered
+    # Triggered once only, then waits for its limit
+    assert book.on_price("AAPL", 106.0) == ([], [])
+    fills, triggered = book.on_price("AAPL", 104.0)
+    assert (ids(fills), triggered) == ([1], [])
+
+
+def test_cancelled_orders_are_skipped_when_reached():
+    book = OrderBook()
+    book.load([limit(1, "BUY", 101.0), limit(2, "BUY", 100.0), stop(3, "SELL", 95.0)])
+    assert book.cancel(1).id == 1
+    assert book.cancel(1) is None
+    assert book.cancel(3).id == 3
+    assert book.stats() == {"symbols": 1, "openOrders": 1}
+    fills, triggered = book.on_price("AAPL", 90.0)
+    assert (ids(fills), triggered) == ([2], [])
+    # Nothing live left, so the symbol's book is gone
+    assert book.symbols() == []
+    assert book.cancel(2) is None
+
+
+def test_order_prices_must_be_positive(app_db):
+    import main
+    from database import SessionLocal
+    from trading import get_or_create_portfolio
+
+    db = SessionLocal()
+    get_or_create_portfolio(db, 1)
+    db.close()
+    order = {"user_id": 1, "symbol": "AAPL", "action": "sell", "quantity": 1}
+    with TestClient(main.create_app()) as client:
+        for prices in ({"limit_price": 0}, {"limit_price": -5}, {"stop_price": 0, "limit_price": 1}):
+            response = client.post("/orders", json={**order, "order_type": "stop_limit", **prices})
+            assert response.status_code == 422, response.text
+        assert client.get("/orders/1").json() == []
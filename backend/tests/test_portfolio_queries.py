@@ -0,0 +1,139 @@
+import threading
+
+import pytest
+from fastapi import Response
+from fastapi.testclient import TestClient
+
+from db_engine import count_queries
+
+
+def test_portfolio_read_is_one_query(app_db):
+    import main
+    from database import SessionLocal
+    from trading import execute_market_order, get_or_create_portfolio
+
+    db = SessionLocal()
+    get_or_create_portfolio(db, 1)
+    for symbol in ("AAPL", "MSFT", "GOOGL"):
+        execute_market_order(db, 1, symbol, "buy", 1.0, 100.0)
+    db.close()
+
+    with TestClient(main.create_app()) as client:
+        response = client.get("/my-portfolio/1", params={"debug": True})
+    assert response.status_code == 200
+    assert len(response.json()["positions"]) == 3
+    assert response.json()["timings"]["queries"] == 1
+
+
+def test_market_order_statements(app_db):
+    # Portfolio with its positions, the cash and position writes, the trade row
+    from database import SessionLocal
+    from trading import execute_market_order, get_or_create_portfolio
+
+    db = SessionLocal()
+    get_or_create_portfolio(db, 1)
+    execute_market_order(db, 1, "AAPL", "buy", 1.0, 100.0)
+    with count_queries() as queries:
+        execute_market_order(db, 1, "AAPL", "buy", 1.0, 100.0)
+    db.close()
+    assert queries.count == 4, queries.statements
+
+
+def test_stock_app_portfolio_read_is_one_query(stock_app_db):
+    import my_stock_app
+    from my_types import TradeRequest
+
+    db = stock_app_db()
+    my_stock_app.check_my_portfolio(7, Response(), None, db)
+    for symbol in ("AAPL", "MSFT", "GOOGL"):
+        my_stock_app.trade_at_price(db, TradeRequest(user_id=7, symbol=symbol, quantity=1, trade_type="BUY"), 100.0)
+    db.close()
+
+    db = stock_app_db()
+    with count_queries() as queries:
+        portfolio = my_stock_app.check_my_portfolio(7, Response(), None, db)
+        held = {stock.symbol: stock.quantity for stock in portfolio.stocks}
+    db.close()
+    assert held == {"AAPL": 1.0, "MSFT": 1.0, "GOOGL": 1.0}
+    assert queries.count == 1, queries.statements
+
+
+@pytest.mark.parametrize("trade_type, quantity, held_before", [
+    ("BUY", 1, 0),   # new position
+    ("BUY", 1, 2),   # add to a position
+    ("SELL", 1, 2),  # part of a position
+    ("SELL", 2, 2),  # all of it
+])
+def test_stock_app_trade_statements(stock_app_db, trade_type, quantity, held_before):
+    # Portfolio with its stocks, then one write each for cash and the stock row
+    import my_stock_app
+    from my_types import TradeRequest
+
+    db = stock_app_db()
+    my_stock_app.check_my_portfolio(7, Response(), None, db)
+    if held_before:
+        my_stock_app.trade_at_price(
+            db, TradeRequest(user_id=7, symbol="AAPL", quantity=held_before, trade_type="BUY"), 100.0
+        )
+    db.close()
+
+    db = stock_app_db()
+    with count_queries() as queries:
+        result = my_stock_app.trade_at_price(
+            db, TradeRequest(user_id=7, symbol="AAPL", quantity=quantity, trade_type=trade_type), 100.0
+        )
+    db.close()
+    assert result["message"] == "Trade successful! 🎉"
+    assert queries.count == 3, queries.statements
+
+
+class _SeparateProcesses:
+    # Stands in for my_stock_app.trade_locks: every trade gets a lock of its
+    # own, as if each request ran in a different worker process
+    def __len__(self):
+        return 1
+
+    def __getitem__(self, index):
+        return threading.Lock()
+
+
+def test_stock_app_concurrent_first_buys(stock_app_db, monkeypatch):
+    # Both requests see no AAPL row and insert one; the unique constraint
+    # turns the second insert into an IntegrityError, which is retried
+    import my_stock_app
+
+    load_portfolio = my_stock_app.load_portfolio
+    both_loaded = threading.Barrier(2)
+    calls = []
+
+    def load_then_wait(db, user_id):
+        portfolio = load_portfolio(db, user_id)
+        calls.append(user_id)
+        if len(calls) <= 2:
+            both_loaded.wait(timeout=10)
+        return portfolio
+
+    with TestClient(my_stock_app.my_app) as client:
+        assert client.get("/my-portfolio/7").status_code == 200
+        monkeypatch.setattr(my_stock_app, "trade_locks", _SeparateProcesses())
+        monkeypatch.setattr(my_stock_app, "load_portfolio", load_then_wait)
+        responses = []
+
+        def buy():
+            responses.append(client.post(
+                "/make-trade", json={"user_id": 7, "symbol": "AAPL", "quantity": 1, "trade_type": "BUY"}
+            ))
+
+        threads = [threading.Thread(target=buy) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        monkeypatch.setattr(my_stock_app, "load_portfolio", load_portfolio)
+        portfolio = client.get("/my-portfolio/7").json()
+
+    assert [response.status_code for response in responses] == [200, 200], [r.text for r in responses]
+    assert len(calls) == 3  # two first tries and one retry
+    assert [(stock["symbol"], stock["quantity"]) for stock in portfolio["stocks"]] == [("AAPL", 2.0)]
+    spent = sum(response.json()["trade_info"]["total"] for response in responses)
+    assert portfolio["cash"] == pytest.approx(10000.0 - spent)
@@ -0,0 +1,37 @@
+import threading
+
+from price_history import BarBuilder, PriceHistoryStore
+
+
+def test_closed_bars_are_written_off_the_calling_thread(tmp_path, monkeypatch):
+    store = PriceHistoryStore(str(tmp_path))
+    writers = []
+    append = store.append
+
+    def recording_append(*args):
+        writers.append(threading.current_thread().name)
+        return append(*args)
+
+    monkeypatch.setattr(store, "append", recording_append)
+    now = [600.0]
+    builder = BarBuilder(store, seconds=60, clock=lambda: now[0])
+    for price in (10.0, 12.0, 9.0):
+        builder.on_quote("AAPL", {"price": price})
+    now[0] = 660.0
+    builder.on_quote("AAPL", {"price": 11.0})
+    builder.close()
+
+    assert writers == ["price-history-writer"]
+    bars = store.bars("AAPL")
+    assert bars["timestamp"].tolist() == [600]
+    assert [bars[name][0] for name in ("open", "high", "low", "close")] == [10.0, 12.0, 9.0, 9.0]
+
+
+def test_mapped_symbols_are_bounded(tmp_path):
+    store = PriceHistoryStore(str(tmp_path), max_mapped=2)
+    for symbol in ("AAPL", "MSFT", "GOOGL"):
+        store.append(symbol, [60], [1.0], [1.0], [1.0], [1.0], [0.0])
+        store.bars(symbol)
+    store.bars("MSFT")
+    store.bars("AAPL")
+    assert list(store._maps) == ["MSFT", "AAPL"]
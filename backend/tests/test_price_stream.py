@@ -0,0 +1,29 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from price_stream import PriceStreamHub, parse_subscription, stream_router
+
+
+@pytest.mark.parametrize("text", ["not json", "[1, 2]", '"AAPL"', '{"subscribe": "AAPL"}', '{"unsubscribe": [1]}'])
+def test_bad_subscriptions_are_rejected(text):
+    with pytest.raises(ValueError):
+        parse_subscription(text)
+
+
+def test_subscription_symbols_are_normalized():
+    assert parse_subscription('{"subscribe": ["aapl", " msft"], "unsubscribe": []}') == {"subscribe": ["AAPL", "MSFT"]}
+
+
+def test_websocket_survives_bad_messages():
+    async def fetch(symbol):
+        return {"symbol": symbol, "price": 1.0}
+
+    app = FastAPI()
+    app.include_router(stream_router(PriceStreamHub(fetch, interval=0.01)))
+    with TestClient(app) as client, client.websocket_connect("/ws/prices") as websocket:
+        for text in ("not json", '["AAPL"]', '{"subscribe": "AAPL"}'):
+            websocket.send_text(text)
+            assert websocket.receive_json()["type"] == "error"
+        websocket.send_text('{"subscribe": ["aapl"]}')
+        assert websocket.receive_json() == {"type": "quotes", "quotes": {"AAPL": {"symbol": "AAPL", "price": 1.0}}}
@@ -0,0 +1,152 @@
+import os
+import threading
+
+import pytest
+
+import trade_journal
+from trade_journal import TradeJournal, TradeLedger
+from trading import STARTING_CASH, TradeRejected
+
+
+def make_ledger(path, **kwargs):
+    from database import SessionLocal
+
+    return TradeLedger(str(path), SessionLocal, flush_interval=0, apply_interval=0.01, **kwargs)
+
+
+@pytest.fixture
+def portfolio(app_db):
+    # User 1's portfolio in main.py's freshly migrated database
+    from database import SessionLocal
+    from trading import get_or_create_portfolio
+
+    db = SessionLocal()
+    get_or_create_portfolio(db, 1)
+    db.close()
+    return 1
+
+
+def stored(user_id):
+    # Cash, positions and trade numbers of a portfolio as the database has them
+    from database import SessionLocal
+    from trading import load_portfolio
+
+    db = SessionLocal()
+    try:
+        portfolio = load_portfolio(db, user_id)
+        trades = sorted((trade.seq, trade.journal_seq) for trade in portfolio.trades)
+        return portfolio.cash, {p.symbol: p.quantity for p in portfolio.positions}, trades
+    finally:
+        db.close()
+
+
+def test_read_drops_torn_and_corrupt_tails(tmp_path):
+    path = tmp_path / "journal.log"
+    journal = TradeJournal(str(path), lambda records: None, flush_interval=0)
+    journal.open(1)
+    for i in range(3):
+        journal.submit({"n": i}).wait()
+    journal.close()
+    intact = path.stat().st_size
+
+    # A crash in the middle of a write: a line without its newline
+    with open(path, "ab") as f:
+        f.write(TradeJournal._encode({"n": 3})[:-5])
+    assert [record["n"] for record in TradeJournal(str(path), None).read()] == [0, 1, 2]
+    assert path.stat().st_size == intact
+
+    # A complete line whose checksum doesn't match, and everything after it
+    line = TradeJournal._encode({"n": 3})
+    with open(path, "ab") as f:
+        f.write(b"00000000" + line[8:] + TradeJournal._encode({"n": 4}))
+    assert [record["n"] for record in TradeJournal(str(path), None).read()] == [0, 1, 2]
+    assert path.stat().st_size == intact
+
+
+def test_acknowledged_only_after_fsync(tmp_path, portfolio, monkeypatch):
+    ledger = make_ledger(tmp_path / "journal.log")
+    ledger.start()
+    gate = threading.Event()
+    synced = []
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        assert gate.wait(5)
+        real_fsync(fd)
+        synced.append(fd)
+
+    monkeypatch.setattr(trade_journal.os, "fsync", slow_fsync)
+    results = []
+    trade = threading.Thread(target=lambda: results.append(ledger.execute(1, "AAPL", "buy", 1.0, 100.0)))
+    trade.start()
+    trade.join(0.2)
+    assert trade.is_alive() and not results
+    assert ledger.journal.durable_seq == 0
+
+    gate.set()
+    trade.join(5)
+    assert results == [STARTING_CASH - 100.0]
+    assert synced and ledger.journal.durable_seq == 1
+    ledger.close()
+    assert stored(1) == (STARTING_CASH - 100.0, {"AAPL": 1.0}, [(1, 1)])
+
+
+def test_failed_journal_write_leaves_nothing_behind(tmp_path, portfolio, monkeypatch):
+    ledger = make_ledger(tmp_path / "journal.log")
+    ledger.start()
+
+    def broken_fsync(fd):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(trade_journal.os, "fsync", broken_fsync)
+    with pytest.raises(TradeRejected) as rejected:
+        ledger.execute(1, "AAPL", "buy", 1.0, 100.0)
+    assert rejected.value.status_code == 503
+    # Nothing pending, so reads don't wait for a write that never happened
+    ledger.wait_applied(1)
+    monkeypatch.undo()
+    with pytest.raises(TradeRejected):
+        ledger.execute(1, "AAPL", "buy", 1.0, 100.0)
+    ledger.close()
+    assert stored(1) == (STARTING_CASH, {}, [])
+
+
+def test_apply_failure_fails_closed_and_replay_is_idempotent(tmp_path, portfolio, monkeypatch):
+    path = tmp_path / "journal.log"
+    ledger = make_ledger(path, apply_retries=1)
+    ledger.start()
+    ledger.execute(1, "AAPL", "buy", 2.0, 100.0)
+    ledger.execute(1, "MSFT", "buy", 1.0, 300.0)
+    ledger.wait_applied(1)
+    assert stored(1)[2] == [(1, 1), (2, 2)]
+
+    # The database stops taking writes: the next trades are acknowledged
+    # (they are in the journal) but never applied
+    def broken_apply(records):
+        raise RuntimeError("database is gone")
+
+    monkeypatch.setattr(ledger, "_apply", broken_apply)
+    ledger.execute(1, "AAPL", "sell", 1.0, 110.0)
+    ledger.execute(1, "MSFT", "sell", 1.0, 310.0)
+    with pytest.raises(TradeRejected) as rejected:
+        ledger.wait_applied(1)
+    assert rejected.value.status_code == 503
+    with pytest.raises(TradeRejected):
+        ledger.execute(1, "AAPL", "buy", 1.0, 100.0)
+    assert not ledger.stats()["healthy"]
+    ledger.close()
+    assert stored(1)[0] == STARTING_CASH - 500.0
+
+    # A restart replays only what's past max(trades.journal_seq)
+    expected = (STARTING_CASH - 500.0 + 110.0 + 310.0, {"AAPL": 1.0}, [(1, 1), (2, 2), (3, 3), (4, 4)])
+    again = make_ledger(path)
+    assert again.start() == 2
+    again.close()
+    assert stored(1) == expected
+
+    # and replaying the same journal once more changes nothing
+    once_more = make_ledger(path)
+    assert once_more.start() == 0
+    once_more.execute(1, "AAPL", "sell", 1.0, 120.0)
+    once_more.close()
+    assert stored(1) == (expected[0] + 120.0, {}, expected[2] + [(5, 5)])
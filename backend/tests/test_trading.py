@@ -0,0 +1,94 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import update
+
+import trading
+from trading import STARTING_CASH, TradeRejected, execute_market_order, get_or_create_portfolio, load_portfolio
+
+# Exact in binary floating point, so balances compare with ==
+PRICE = 12.5
+
+
+@pytest.fixture
+def session(app_db):
+    from database import SessionLocal
+
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+def test_concurrent_trades_on_one_portfolio_are_exact(session):
+    from database import SessionLocal
+
+    get_or_create_portfolio(session, 1)
+    execute_market_order(session, 1, "AAPL", "buy", 100.0, PRICE)
+    rng = random.Random(7)
+    orders = [rng.choice(("buy", "sell")) for _ in range(200)]
+
+    def trade(action):
+        db = SessionLocal()
+        try:
+            execute_market_order(db, 1, "AAPL", action, 1.0, PRICE)
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(trade, orders))
+
+    bought = orders.count("buy") - orders.count("sell")
+    session.expire_all()
+    portfolio = load_portfolio(session, 1)
+    assert portfolio.cash == STARTING_CASH - (100 + bought) * PRICE
+    assert [(p.symbol, p.quantity) for p in portfolio.positions] == [("AAPL", 100.0 + bought)]
+    assert len(portfolio.trades) == 1 + len(orders)
+    assert sorted(trade.seq for trade in portfolio.trades) == list(range(1, 2 + len(orders)))
+
+
+def test_serialized_retries_on_a_concurrent_write(session):
+    import models
+    from database import SessionLocal
+
+    get_or_create_portfolio(session, 1)
+    attempts = []
+
+    def work():
+        portfolio = load_portfolio(session, 1)
+        if not attempts:
+            # Another process commits between our read and our write
+            other = SessionLocal()
+            other.execute(
+                update(models.Portfolio).where(models.Portfolio.user_id == 1)
+                .values(cash=models.Portfolio.cash - 1, version=models.Portfolio.version + 1)
+            )
+            other.commit()
+            other.close()
+        attempts.append(portfolio.cash)
+        portfolio.cash -= 10
+        return portfolio.cash
+
+    assert trading.serialized(session, 1, work) == STARTING_CASH - 11
+    assert attempts == [STARTING_CASH, STARTING_CASH - 1]
+    session.expire_all()
+    assert load_portfolio(session, 1).cash == STARTING_CASH - 11
+
+
+def test_serialized_gives_up_after_its_retries(session, monkeypatch):
+    from sqlalchemy.orm.exc import StaleDataError
+
+    get_or_create_portfolio(session, 1)
+    changed = []
+    monkeypatch.setattr(trading, "portfolio_listeners", [changed.append])
+    calls = []
+
+    def work():
+        calls.append(1)
+        raise StaleDataError("portfolio version changed")
+
+    with pytest.raises(TradeRejected) as rejected:
+        trading.serialized(session, 1, work, retries=3)
+    assert rejected.value.status_code == 409
+    assert len(calls) == 3
+    assert changed == []
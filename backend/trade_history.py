@@ -0,0 +1,118 @@
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, tuple_
+from sqlalchemy.orm import Session
+
+import models
+
+
+def encode_cursor(timestamp: datetime, trade_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{trade_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, trade_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), int(trade_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _filtered(query, portfolio_id: int, symbol: Optional[str], start: Optional[datetime], end: Optional[datetime]):
+    # Every filter is a prefix/range on ix_trades_portfolio_timestamp_id or
+    # ix_trades_portfolio_symbol_timestamp_id
+    query = query.filter(models.Trade.portfolio_id == portfolio_id)
+    if symbol:
+        query = query.filter(models.Trade.symbol == symbol.upper())
+    if start:
+        query = query.filter(models.Trade.timestamp >= start)
+    if end:
+        query = query.filter(models.Trade.timestamp < end)
+    return query
+
+
+def trade_page(
+    db: Session,
+    portfolio_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    symbol: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    # Newest first, keyset-paginated on (timestamp, id). Only the columns we
+    # return are selected and the per-row total is computed by the database.
+    # Timestamps stay datetimes, the JSON encoder writes them as ISO 8601.
+    trade = models.Trade
+    query = _filtered(
+        db.query(
+            trade.id,
+            trade.symbol,
+            trade.trade_type,
+            trade.quantity,
+            trade.price,
+            (trade.price * trade.quantity).label("total"),
+            trade.timestamp,
+        ),
+        portfolio_id, symbol, start, end,
+    )
+    if cursor:
+        timestamp, trade_id = decode_cursor(cursor)
+        query = query.filter(tuple_(trade.timestamp, trade.id) < tuple_(timestamp, trade_id))
+    rows = query.order_by(trade.timestamp.desc(), trade.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    trades = [
+        {
+            "id": row.id,
+            "symbol": row.symbol,
+            "action": row.trade_type.lower(),
+            "quantity": row.quantity,
+            "price": row.price,
+            "total": row.total,
+            "timestamp": row.timestamp
+        }
+        for row in rows
+    ]
+    return trades, next_cursor
+
+
+def trade_totals(
+    db: Session,
+    portfolio_id: int,
+    symbol: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    # Aggregates over the whole filtered history in a single SQL query
+    trade = models.Trade
+    amount = trade.price * trade.quantity
+    is_buy = trade.trade_type == "BUY"
+    row = _filtered(
+        db.query(
+            func.count(trade.id).label("count"),
+            func.sum(case((is_buy, 1), else_=0)).label("buys"),
+            func.sum(case((is_buy, amount), else_=0)).label("bought"),
+            func.sum(case((is_buy, 0), else_=amount)).label("sold"),
+            func.min(trade.timestamp).label("first"),
+            func.max(trade.timestamp).label("last"),
+        ),
+        portfolio_id, symbol, start, end,
+    ).one()
+    count = row.count or 0
+    return {
+        "count": count,
+        "buyCount": row.buys or 0,
+        "sellCount": count - (row.buys or 0),
+        "totalBought": row.bought or 0.0,
+        "totalSold": row.sold or 0.0,
+        "firstTrade": row.first,
+        "lastTrade": row.last,
+    }
@@ -0,0 +1,491 @@
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.orm import Session
+
+import models
+from trading import (
+    CHECKPOINT_INTERVAL, TradeRejected, apply_fill, load_portfolio, make_checkpoint, notify_portfolio_changed,
+    portfolio_locks
+)
+
+logger = logging.getLogger(__name__)
+
+
+class JournalTicket:
+    """Handed back by TradeJournal.submit(); wait() returns once the record is on disk."""
+
+    __slots__ = ("seq", "error", "_done")
+
+    def __init__(self, seq: int):
+        self.seq = seq
+        self.error: Optional[BaseException] = None
+        self._done = threading.Event()
+
+    def wait(self) -> None:
+        self._done.wait()
+        if self.error is not None:
+            raise RuntimeError(f"Trade journal write failed: {self.error}")
+
+
+class TradeJournal:
+    """Append-only log of accepted trades with group commit.
+
+    Records are queued by submit() and a single writer thread appends every
+    queued record to the file, fsyncs once, and only then releases their
+    tickets, so one fsync acknowledges a whole group of trades. Each line is
+    ``<crc32> <json>``; a torn or corrupt tail left by a crash is dropped on
+    read().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        on_durable: Callable[[List[Dict[str, Any]]], None],
+        flush_interval: float = 0.002,
+        max_batch: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.path = path
+        self.on_durable = on_durable
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_bytes = max_bytes
+        self.durable_seq = 0
+        self.flushes = 0
+        self.records = 0
+        self._queue: List[Tuple[Dict[str, Any], JournalTicket]] = []
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._next_seq = 1
+        self._file = None
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        self._failed: Optional[BaseException] = None
+
+    def read(self) -> List[Dict[str, Any]]:
+        # Every intact record in the file, cutting it back to the last good line
+        records: List[Dict[str, Any]] = []
+        if not os.path.exists(self.path):
+            return records
+        good = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    crc, payload = line.rstrip(b"\n").split(b" ", 1)
+                    if not line.endswith(b"\n") or int(crc, 16) != zlib.crc32(payload):
+                        raise ValueError("checksum mismatch")
+                    records.append(json.loads(payload))
+                except ValueError:
+                    logger.warning(f"Trade journal {self.path}: dropping torn tail after {len(records)} records")
+                    break
+                good += len(line)
+        if good != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+        return records
+
+    def open(self, next_seq: int) -> None:
+        self._next_seq = next_seq
+        self.durable_seq = next_seq - 1
+        self._file = open(self.path, "ab")
+        self._writer = threading.Thread(target=self._write_loop, name="trade-journal-writer", daemon=True)
+        self._writer.start()
+
+    def submit(self, record: Dict[str, Any]) -> JournalTicket:
+        with self._cond:
+            if self._closed or self._failed is not None:
+                raise RuntimeError("Trade journal is not accepting writes")
+            ticket = JournalTicket(self._next_seq)
+            self._next_seq += 1
+            record["seq"] = ticket.seq
+            self._queue.append((record, ticket))
+            self._cond.notify()
+        return ticket
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+            if self.flush_interval and not self._closed:
+                # Give concurrent trades a moment to join this group
+                time.sleep(self.flush_interval)
+            with self._cond:
+                batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            data = b"".join(self._encode(record) for record, _ in batch)
+            try:
+                with self._io_lock:
+                    self._file.write(data)
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self.durable_seq = batch[-1][1].seq
+            except OSError as e:
+                logger.exception("Trade journal write failed, refusing further trades")
+                with self._cond:
+                    self._failed = e
+                    batch.extend(self._queue)
+                    self._queue = []
+                for _, ticket in batch:
+                    ticket.error = e
+                    ticket._done.set()
+                return
+            self.flushes += 1
+            self.records += len(batch)
+            self.on_durable([record for record, _ in batch])
+            for _, ticket in batch:
+                ticket._done.set()
+
+    @staticmethod
+    def _encode(record: Dict[str, Any]) -> bytes:
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+    def refuse(self, error: BaseException) -> None:
+        # Stop accepting records, e.g. when they could no longer be applied
+        with self._cond:
+            if self._failed is None:
+                self._failed = error
+
+    def compact(self, applied_seq: int) -> bool:
+        # Start the file over once everything in it has reached the database
+        with self._io_lock:
+            if self.durable_seq > applied_seq or self._file.tell() < self.max_bytes:
+                return False
+            self._file.truncate(0)
+            self._file.seek(0)
+            os.fsync(self._file.fileno())
+        logger.info(f"Trade journal compacted at seq {applied_seq}")
+        return True
+
+    def stop(self) -> None:
+        # Write out everything queued and stop accepting records
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._writer is not None:
+            self._writer.join()
+
+    def close(self) -> None:
+        self.stop()
+        if self._file is not None:
+            self._file.close()
+
+
+class _PortfolioState:
+    # Cash and positions of a portfolio including journaled trades that are
+    # not in the database yet
+    __slots__ = ("portfolio_id", "cash", "positions", "trade_count", "last_seq")
+
+    def __init__(self, portfolio_id: int, cash: float, positions: Dict[str, Tuple[float, float]], trade_count: int):
+        self.portfolio_id = portfolio_id
+        self.cash = cash
+        self.positions = positions
+        self.trade_count = trade_count
+        self.last_seq = 0
+
+
+class TradeLedger:
+    """Journaled market orders.
+
+    A trade is validated against the portfolio's latest state, appended to the
+    journal and acknowledged after the group fsync, without a database commit.
+    A background thread then writes journaled trades into the trades,
+    positions and portfolios tables in bulk. Until that has happened for a
+    portfolio, wait_applied() blocks anything that wants to read or write it
+    through the database. Records carry the resulting cash and position, so
+    replaying the journal after a crash is idempotent; trades.journal_seq
+    tells which records already made it.
+
+    If the journal can't be written, or a batch still can't be applied after
+    ``apply_retries`` attempts, the ledger fails closed: ``failed`` is set,
+    trades and reads that would need the missing writes get a 503, and the
+    journal is replayed on the next start.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        session_factory: Callable[[], Session],
+        flush_interval: float = 0.002,
+        apply_interval: float = 0.05,
+        apply_batch: int = 5000,
+        max_bytes: int = 64 * 1024 * 1024,
+        apply_retries: int = 5,
+    ):
+        self.session_factory = session_factory
+        self.apply_interval = apply_interval
+        self.apply_batch = apply_batch
+        self.apply_retries = apply_retries
+        self.journal = TradeJournal(path, self._on_durable, flush_interval, max_bytes=max_bytes)
+        self.applied_seq = 0
+        self._durable: List[Dict[str, Any]] = []
+        self._durable_cond = threading.Condition()
+        self._pending: Dict[int, _PortfolioState] = {}
+        self._applied_cond = threading.Condition()
+        self._materializer: Optional[threading.Thread] = None
+        self._closed = False
+        self.failed: Optional[BaseException] = None
+
+    @classmethod
+    def from_env(cls, session_factory: Callable[[], Session]) -> Optional["TradeLedger"]:
+        # Journaled mode is off unless TRADE_JOURNAL_PATH is set
+        path = os.getenv("TRADE_JOURNAL_PATH")
+        if not path:
+            return None
+        return cls(
+            path,
+            session_factory,
+            flush_interval=float(os.getenv("TRADE_JOURNAL_FLUSH_MS", "2")) / 1000,
+            apply_interval=float(os.getenv("TRADE_JOURNAL_APPLY_INTERVAL", "0.05")),
+            max_bytes=int(float(os.getenv("TRADE_JOURNAL_MAX_MB", "64")) * 1024 * 1024),
+            apply_retries=int(os.getenv("TRADE_JOURNAL_APPLY_RETRIES", "5")),
+        )
+
+    def start(self) -> int:
+        # Replay whatever the journal has that the database doesn't, then
+        # start accepting trades. Returns the number of records replayed.
+        records = self.journal.read()
+        db = self.session_factory()
+        try:
+            self.applied_seq = db.query(func.max(models.Trade.journal_seq)).scalar() or 0
+        finally:
+            db.close()
+        missing = [record for record in records if record["seq"] > self.applied_seq]
+        for i in range(0, len(missing), self.apply_batch):
+            self._apply(missing[i:i + self.apply_batch])
+        if missing:
+            self.applied_seq = missing[-1]["seq"]
+            logger.info(f"Replayed {len(missing)} journaled trades up to seq {self.applied_seq}")
+        last_seq = max([self.applied_seq] + [record["seq"] for record in records])
+        self.journal.open(last_seq + 1)
+        self.journal.compact(self.applied_seq)
+        self._materializer = threading.Thread(target=self._apply_loop, name="trade-journal-apply", daemon=True)
+        self._materializer.start()
+        return len(missing)
+
+    def _fail(self, error: BaseException) -> None:
+        # Fail closed: no more trades, and readers waiting on writes that
+        # won't happen get an error instead of hanging
+        with self._applied_cond:
+            if self.failed is None:
+                self.failed = error
+            self._applied_cond.notify_all()
+        self.journal.refuse(error)
+
+    def _check_healthy(self) -> None:
+        if self.failed is not None:
+            raise TradeRejected("Trade journal is unavailable, try again later", status_code=503)
+
+    def execute(self, user_id: int, symbol: str, action: str, quantity: float, price: float) -> float:
+        # Journaled counterpart of trading.execute_market_order. The portfolio
+        # lock is held until the record is durable and only then is the new
+        # state published, so a failed write leaves nothing behind; other
+        # portfolios still share the group commit.
+        self._check_healthy()
+        with portfolio_locks.lock_for(user_id):
+            with self._applied_cond:
+                state = self._pending.get(user_id)
+            if state is None:
+                state = self._load(user_id)
+            held, average_price = state.positions.get(symbol, (0.0, 0.0))
+            cash, held, average_price = apply_fill(state.cash, held, average_price, action, quantity, price)
+            trade_seq = state.trade_count + 1
+            record = {
+                "user_id": user_id,
+                "portfolio_id": state.portfolio_id,
+                "symbol": symbol,
+                "action": action.upper(),
+                "quantity": quantity,
+                "price": price,
+                "timestamp": datetime.utcnow().isoformat(),
+                "cash": cash,
+                "held": held,
+                "average_price": average_price,
+                "trade_seq": trade_seq,
+            }
+            if trade_seq % CHECKPOINT_INTERVAL == 0:
+                record["checkpoint"] = {**state.positions, symbol: (held, average_price)}
+            try:
+                ticket = self.journal.submit(record)
+                ticket.wait()
+            except RuntimeError as e:
+                self._fail(e)
+                raise TradeRejected("Trade journal is unavailable, try again later", status_code=503)
+            new_state = _PortfolioState(
+                state.portfolio_id, cash, {**state.positions, symbol: (held, average_price)}, trade_seq
+            )
+            new_state.last_seq = ticket.seq
+            with self._applied_cond:
+                # The apply loop may already have written it
+                if ticket.seq > self.applied_seq:
+                    self._pending[user_id] = new_state
+                else:
+                    self._pending.pop(user_id, None)
+        return cash
+
+    def _load(self, user_id: int) -> _PortfolioState:
+        db = self.session_factory()
+        try:
+            portfolio = load_portfolio(db, user_id)
+            if not portfolio:
+                raise TradeRejected("Portfolio not found", status_code=404)
+            return _PortfolioState(
+                portfolio.id,
+                portfolio.cash,
+                {p.symbol: (p.quantity, p.average_price) for p in portfolio.positions},
+                portfolio.trade_count or 0,
+            )
+        finally:
+            db.close()
+
+    def wait_applied(self, user_id: int) -> None:
+        # Block until every journaled trade of this portfolio is in the database
+        with self._applied_cond:
+            while user_id in self._pending:
+                self._check_healthy()
+                self._applied_cond.wait()
+
+    def _on_durable(self, records: List[Dict[str, Any]]) -> None:
+        with self._durable_cond:
+            self._durable.extend(records)
+            self._durable_cond.notify()
+
+    def _apply_loop(self) -> None:
+        while True:
+            with self._durable_cond:
+                while not self._durable and not self._closed:
+                    self._durable_cond.wait()
+                if not self._durable:
+                    return
+            if not self._closed:
+                time.sleep(self.apply_interval)
+            with self._durable_cond:
+                batch = self._durable[:self.apply_batch]
+            for attempt in range(1, self.apply_retries + 1):
+                try:
+                    self._apply(batch)
+                    break
+                except Exception as e:
+                    if attempt == self.apply_retries:
+                        logger.exception(
+                            f"Applying journaled trades failed {attempt} times, refusing further trades "
+                            f"until a restart replays the journal"
+                        )
+                        self._fail(e)
+                        return
+                    logger.warning(f"Applying journaled trades failed ({e}), retry {attempt}")
+                    time.sleep(min(2 ** (attempt - 1), 30))
+            with self._durable_cond:
+                del self._durable[:len(batch)]
+            self.applied_seq = batch[-1]["seq"]
+            # Listeners first, so a reader woken below never sees stale
+            # analytics or leaderboard entries
+            for user_id in {record["user_id"] for record in batch}:
+                notify_portfolio_changed(user_id)
+            with self._applied_cond:
+                for user_id in [u for u, s in self._pending.items() if s.last_seq <= self.applied_seq]:
+                    del self._pending[user_id]
+                self._applied_cond.notify_all()
+            self.journal.compact(self.applied_seq)
+
+    def _apply(self, records: List[Dict[str, Any]]) -> None:
+        # One transaction per batch: all trade rows and checkpoints, the final
+        # state of every touched position and the final cash and trade count of
+        # every touched portfolio
+        positions: Dict[Tuple[int, str], Tuple[float, float]] = {}
+        portfolio_state: Dict[int, Tuple[float, int]] = {}
+        for record in records:
+            positions[(record["portfolio_id"], record["symbol"])] = (record["held"], record["average_price"])
+            portfolio_state[record["portfolio_id"]] = (record["cash"], record["trade_seq"])
+
+        db = self.session_factory()
+        try:
+            db.execute(insert(models.Trade), [
+                {
+                    "portfolio_id": record["portfolio_id"],
+                    "symbol": record["symbol"],
+                    "trade_type": record["action"],
+                    "quantity": record["quantity"],
+                    "price": record["price"],
+                    "timestamp": datetime.fromisoformat(record["timestamp"]),
+                    "seq": record["trade_seq"],
+                    "journal_seq": record["seq"],
+                }
+                for record in records
+            ])
+            for record in records:
+                if "checkpoint" in record:
+                    db.add(make_checkpoint(
+                        record["portfolio_id"], record["trade_seq"], datetime.fromisoformat(record["timestamp"]),
+                        record["cash"], {symbol: tuple(value) for symbol, value in record["checkpoint"].items()},
+                    ))
+            existing = {
+                (position.portfolio_id, position.symbol): position
+                for position in db.query(models.Position).filter(models.Position.portfolio_id.in_(portfolio_state))
+            }
+            for (portfolio_id, symbol), (held, average_price) in positions.items():
+                position = existing.get((portfolio_id, symbol))
+                if held == 0:
+                    if position is not None:
+                        db.delete(position)
+                elif position is not None:
+                    position.quantity = held
+                    position.average_price = average_price
+                else:
+                    db.add(models.Position(
+                        portfolio_id=portfolio_id, symbol=symbol, quantity=held, average_price=average_price
+                    ))
+            portfolios = models.Portfolio.__table__
+            db.execute(
+                update(portfolios)
+                .where(portfolios.c.id == bindparam("portfolio_id"))
+                .values(
+                    cash=bindparam("new_cash"),
+                    trade_count=bindparam("new_trade_count"),
+                    version=portfolios.c.version + 1,
+                ),
+                [
+                    {"portfolio_id": portfolio_id, "new_cash": cash, "new_trade_count": trade_count}
+                    for portfolio_id, (cash, trade_count) in portfolio_state.items()
+                ],
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def close(self) -> None:
+        # Flush and apply everything accepted so far
+        self.journal.stop()
+        with self._durable_cond:
+            self._closed = True
+            self._durable_cond.notify()
+        if self._materializer is not None:
+            self._materializer.join()
+        self.journal.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._applied_cond:
+            pending = len(self._pending)
+        return {
+            "durableSeq": self.journal.durable_seq,
+            "appliedSeq": self.applied_seq,
+            "flushes": self.journal.flushes,
+            "records": self.journal.records,
+            "recordsPerFlush": self.journal.records / self.journal.flushes if self.journal.flushes else 0.0,
+            "portfoliosPending": pending,
+            "healthy": self.failed is None,
+            "error": str(self.failed) if self.failed is not None else None,
+        }
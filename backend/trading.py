@@ -0,0 +1,262 @@
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.exc import StaleDataError
+
+import models
+from order_book import OPEN_STATUSES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+STARTING_CASH = 10000.00
+
+# A portfolio checkpoint is written every this many trades, so rebuilding a
+# past state replays at most this many trades (see portfolio_snapshots.py)
+CHECKPOINT_INTERVAL = int(os.getenv("PORTFOLIO_CHECKPOINT_INTERVAL", "100"))
+
+
+class TradeRejected(Exception):
+    def __init__(self, detail: str, status_code: int = 400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+class PortfolioLocks:
+    """Sharded table of in-process portfolio locks.
+
+    Work on one portfolio runs one request at a time, while portfolios that
+    hash to different shards never wait on each other.
+    """
+
+    def __init__(self, shards: int = 1024):
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def lock_for(self, user_id: int) -> threading.Lock:
+        return self._locks[hash(user_id) % len(self._locks)]
+
+
+portfolio_locks = PortfolioLocks(int(os.getenv("PORTFOLIO_LOCK_SHARDS", "1024")))
+
+# Set when trades are journaled (see trade_journal.py): blocks until a
+# portfolio's journaled trades are in the database, before anything else
+# writes to it
+write_barrier: Optional[Callable[[int], None]] = None
+
+# Called with the user_id after a change to that portfolio is committed
+portfolio_listeners: List[Callable[[int], None]] = []
+
+
+def notify_portfolio_changed(user_id: int) -> None:
+    for listener in portfolio_listeners:
+        try:
+            listener(user_id)
+        except Exception:
+            logger.exception(f"Portfolio listener failed for user {user_id}")
+
+
+def load_portfolio(db: Session, user_id: int, with_positions: bool = True, for_update: bool = False):
+    # Portfolio and its positions in a single round trip. for_update also
+    # locks the portfolio row (SELECT ... FOR UPDATE OF portfolios) on
+    # databases that support it; SQLite ignores it.
+    query = db.query(models.Portfolio)
+    if with_positions:
+        query = query.options(joinedload(models.Portfolio.positions))
+    if for_update:
+        query = query.with_for_update(of=models.Portfolio)
+    return query.filter(models.Portfolio.user_id == user_id).one_or_none()
+
+
+def get_or_create_portfolio(db: Session, user_id: int, with_positions: bool = True):
+    portfolio = load_portfolio(db, user_id, with_positions)
+    if portfolio:
+        return portfolio
+    portfolio = models.Portfolio(user_id=user_id, cash=STARTING_CASH)
+    db.add(portfolio)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Someone else created it first (user_id is unique)
+        db.rollback()
+        return load_portfolio(db, user_id, with_positions)
+    db.refresh(portfolio)
+    notify_portfolio_changed(user_id)
+    logger.info(f"Created new portfolio for user {user_id}")
+    return portfolio
+
+
+def serialized(db: Session, user_id: int, work: Callable[[], T], retries: int = 3) -> T:
+    # Run work() and commit while holding the portfolio's lock. The version
+    # column turns a write from another process into a StaleDataError, in
+    # which case the work is retried against fresh state.
+    with portfolio_locks.lock_for(user_id):
+        if write_barrier is not None:
+            write_barrier(user_id)
+        for attempt in range(retries):
+            try:
+                result = work()
+                db.commit()
+                notify_portfolio_changed(user_id)
+                return result
+            except StaleDataError:
+                db.rollback()
+                logger.warning(f"Portfolio {user_id} changed concurrently, retry {attempt + 1}")
+            except Exception:
+                db.rollback()
+                raise
+    raise TradeRejected("Portfolio was changed by another request, try again", status_code=409)
+
+
+def apply_fill(
+    cash: float, quantity: float, average_price: float, action: str, trade_quantity: float, price: float
+) -> Tuple[float, float, float]:
+    # The cash/position accounting for one fill. Returns the new
+    # (cash, quantity, average_price) or raises TradeRejected.
+    total = price * trade_quantity
+    if action == "buy":
+        if cash < total:
+            raise TradeRejected("Insufficient funds")
+        new_quantity = quantity + trade_quantity
+        if quantity:
+            average_price = ((average_price * quantity) + total) / new_quantity
+        else:
+            average_price = price
+        return cash - total, new_quantity, average_price
+    if action == "sell":
+        if quantity < trade_quantity:
+            raise TradeRejected("Insufficient shares")
+        return cash + total, quantity - trade_quantity, average_price
+    raise TradeRejected(f"Unknown action: {action}")
+
+
+def fill_order(
+    db: Session,
+    portfolio: models.Portfolio,
+    positions: Dict[str, models.Position],
+    symbol: str,
+    action: str,
+    quantity: float,
+    price: float,
+    timestamp: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    # Apply a fill to a loaded portfolio and its positions (keyed by symbol)
+    # and return the column values of the trade row to record for it. Emptied
+    # positions stay in ``positions`` until close_empty_positions() so a later
+    # buy in the same transaction can reuse the row. ``positions`` must hold
+    # all of the portfolio's positions, checkpoints are taken from it.
+    timestamp = timestamp or datetime.utcnow()
+    position = positions.get(symbol)
+    held, average_price = (position.quantity, position.average_price) if position else (0.0, 0.0)
+    cash, held, average_price = apply_fill(portfolio.cash, held, average_price, action, quantity, price)
+
+    portfolio.cash = cash
+    if position is None:
+        position = models.Position(
+            portfolio_id=portfolio.id,
+            symbol=symbol,
+            quantity=held,
+            average_price=average_price
+        )
+        db.add(position)
+        positions[symbol] = position
+    else:
+        position.quantity = held
+        position.average_price = average_price
+
+    portfolio.trade_count = (portfolio.trade_count or 0) + 1
+    if portfolio.trade_count % CHECKPOINT_INTERVAL == 0:
+        db.add(make_checkpoint(
+            portfolio.id, portfolio.trade_count, timestamp, cash,
+            {s: (p.quantity, p.average_price) for s, p in positions.items()},
+        ))
+
+    return {
+        "portfolio_id": portfolio.id,
+        "symbol": symbol,
+        "trade_type": action.upper(),
+        "quantity": quantity,
+        "price": price,
+        "timestamp": timestamp,
+        "seq": portfolio.trade_count,
+    }
+
+
+def make_checkpoint(
+    portfolio_id: int, seq: int, timestamp: datetime, cash: float, positions: Dict[str, Tuple[float, float]]
+) -> models.PortfolioCheckpoint:
+    return models.PortfolioCheckpoint(
+        portfolio_id=portfolio_id,
+        seq=seq,
+        timestamp=timestamp,
+        cash=cash,
+        positions={symbol: [held, average] for symbol, (held, average) in positions.items() if held},
+    )
+
+
+def close_empty_positions(db: Session, positions: Dict[str, models.Position]) -> None:
+    for symbol, position in list(positions.items()):
+        if position.quantity == 0:
+            if position in db.new:
+                # Opened and closed within this transaction, never inserted
+                db.expunge(position)
+            else:
+                db.delete(position)
+            del positions[symbol]
+
+
+def execute_market_order(db: Session, user_id: int, symbol: str, action: str, quantity: float, price: float) -> float:
+    # Fill one order at an already fetched price and return the new cash balance
+    def work() -> float:
+        portfolio = load_portfolio(db, user_id, for_update=True)
+        if not portfolio:
+            raise TradeRejected("Portfolio not found", status_code=404)
+        positions = {position.symbol: position for position in portfolio.positions}
+        trade_row = fill_order(db, portfolio, positions, symbol, action, quantity, price)
+        close_empty_positions(db, positions)
+        db.add(models.Trade(**trade_row))
+        return portfolio.cash
+
+    return serialized(db, user_id, work)
+
+
+def fill_pending_order(
+    db: Session, order_id: int, user_id: int, symbol: str, side: str, quantity: float, price: float
+) -> bool:
+    # Settle a triggered limit/stop order at ``price`` with the same accounting
+    # as a market trade. False if it was already filled or cancelled.
+    def work() -> bool:
+        now = datetime.utcnow()
+        # Claim the order first so two workers can never fill it twice
+        claimed = db.query(models.Order).filter(
+            models.Order.id == order_id,
+            models.Order.status.in_(OPEN_STATUSES)
+        ).update({"status": "FILLED", "fill_price": price, "filled_at": now}, synchronize_session=False)
+        if not claimed:
+            return False
+        portfolio = load_portfolio(db, user_id, for_update=True)
+        if not portfolio:
+            raise TradeRejected("Portfolio not found", status_code=404)
+        positions = {position.symbol: position for position in portfolio.positions}
+        trade_row = fill_order(db, portfolio, positions, symbol, side.lower(), quantity, price, now)
+        close_empty_positions(db, positions)
+        db.add(models.Trade(**trade_row))
+        return True
+
+    return serialized(db, user_id, work)
+
+
+def update_pending_order(db: Session, order_id: int, status: str, detail: Optional[str] = None) -> bool:
+    # Move a still-open order to TRIGGERED, CANCELLED or REJECTED
+    updated = db.query(models.Order).filter(
+        models.Order.id == order_id,
+        models.Order.status.in_(OPEN_STATUSES)
+    ).update({"status": status, "detail": detail}, synchronize_session=False)
+    db.commit()
+    return bool(updated)